@@ -1,3 +1,5 @@
 from .profiler import Profiler, ProfilerFunction, ComputeEvalMetric
+from .multi_profiler import MultiProfiler, compare_profilers
 from .metrics import *
-from .utils import Device
\ No newline at end of file
+from .layerwise import LayerwiseTable, LayerwiseTimeTable, LayerRecord, HotLayersReport
+from .utils import Device
@@ -0,0 +1,104 @@
+from collections import deque
+import time
+
+import numpy as np
+
+from .metrics import ExecutionTime, ExecutionTimeP50, ExecutionTimeP90, ExecutionTimeP99, ExecutionTimeStd, \
+    ExecutionTimeMin, ExecutionTimeOutliers
+
+# two-sided z-scores of the supported confidence levels
+_Z_SCORES = {0.9: 1.645, 0.95: 1.960, 0.99: 2.576}
+
+# (StatusKey, statistic) pairs reported by a benchmark, the outliers count is not a time
+BENCHMARK_STATUS_KEYS = ((ExecutionTime, 'mean'), (ExecutionTimeP50, 'p50'), (ExecutionTimeP90, 'p90'),
+                         (ExecutionTimeP99, 'p99'), (ExecutionTimeStd, 'std'), (ExecutionTimeMin, 'min'),
+                         (ExecutionTimeOutliers, 'outliers'))
+
+
+def _coefficient_of_variation(samples):
+    mean = np.mean(samples)
+    if mean == 0:
+        return 0.
+    return np.std(samples) / mean
+
+
+def latency_statistics(samples):
+    """
+    Summary statistics of timing samples. Outliers are counted with Tukey's fences (1.5 times the
+    interquartile range away from the first or third quartile).
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    q1, p50, q3, p90, p99 = np.percentile(samples, (25, 50, 75, 90, 99))
+    iqr = q3 - q1
+    outliers = np.count_nonzero((samples < q1 - 1.5 * iqr) | (samples > q3 + 1.5 * iqr))
+    return {'mean': float(np.mean(samples)), 'p50': float(p50), 'p90': float(p90), 'p99': float(p99),
+            'std': float(np.std(samples, ddof=1)) if len(samples) > 1 else 0., 'min': float(np.min(samples)),
+            'outliers': int(outliers), 'steps': len(samples)}
+
+
+def run_benchmark(step, min_warmup=3, max_warmup=100, warmup_window=5, warmup_tolerance=0.05, min_steps=10,
+                  max_steps=1000, max_time=60., confidence=0.95, relative_precision=0.02):
+    """
+    Time `step` until its measurements are statistically meaningful.
+
+    The warmup runs until the coefficient of variation of the last `warmup_window` measurements falls under
+    `warmup_tolerance` (or `max_warmup` steps). The benchmark then runs until the confidence interval of the
+    mean is within `relative_precision` of the mean, or until `max_steps` steps or `max_time` seconds.
+
+    :param step: Runs one iteration and returns its measured time
+    :type step: `callable`
+    :param confidence: Confidence level of the interval on the mean, one of 0.9, 0.95 or 0.99
+    :type confidence: `float`
+    :param relative_precision: Targeted half width of the confidence interval relative to the mean
+    :type relative_precision: `float`
+
+    :raises ValueError: Unsupported confidence level
+
+    :return: The statistics of :func:`~latency_statistics` plus 'converged', True if the confidence interval
+        target was reached
+    :rtype: `dict`
+    """
+    if confidence not in _Z_SCORES:
+        raise ValueError("Unsupported confidence level '{}' (valid := {})".format(confidence,
+                                                                                tuple(_Z_SCORES.keys())))
+    z = _Z_SCORES[confidence]
+    min_steps = max(min_steps, 2)
+
+    window = deque(maxlen=warmup_window)
+    for i in range(max_warmup):
+        window.append(step())
+        if i + 1 >= max(min_warmup, warmup_window) and \
+                _coefficient_of_variation(window) <= warmup_tolerance:
+            break
+
+    samples = []
+    converged = False
+    start = time.perf_counter()
+    while len(samples) < max_steps:
+        samples.append(step())
+        n = len(samples)
+        if n < min_steps:
+            continue
+        mean = np.mean(samples)
+        half_width = z * np.std(samples, ddof=1) / np.sqrt(n)
+        if half_width <= relative_precision * mean:
+            converged = True
+            break
+        if time.perf_counter() - start >= max_time:
+            break
+
+    stats = latency_statistics(samples)
+    stats['converged'] = converged
+    return stats
+
+
+def benchmark_status_values(stats, scale=1.):
+    """
+    Map the statistics returned by :func:`~run_benchmark` to their `StatusKey`, the times being multiplied
+    by `scale`.
+    """
+    rval = {}
+    for sk_cls, stat in BENCHMARK_STATUS_KEYS:
+        value = stats[stat]
+        rval[sk_cls.NAME] = value if sk_cls is ExecutionTimeOutliers else value * scale
+    return rval
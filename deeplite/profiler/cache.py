@@ -0,0 +1,109 @@
+from contextlib import closing
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+
+from .formatter import getLogger
+
+logger = getLogger(__name__)
+
+
+class StatusCache:
+    """
+    Persistent on-disk store of values computed by :class:`ProfilerFunction`. It is meant to be given to a
+    :class:`Profiler` which then serves the values from here instead of recomputing them whenever the same
+    function is called with the same arguments on a model with the same fingerprint.
+
+    The values are pickled in a local SQLite database. Once the total size of the stored values goes over
+    `max_size`, the least recently used entries are evicted.
+
+    NOTE: The data splits are not part of the key. A cache should not be shared between profilers that
+    evaluate on different data.
+
+    :param path: Path of the SQLite database file, defaults to ~/.cache/deeplite_profiler/status_cache.sqlite
+    :type path: `str`, optional
+    :param max_size: Maximum total size in bytes of the stored values, defaults to 256MB
+    :type max_size: `int`, optional
+    """
+
+    def __init__(self, path=None, max_size=256 * 1024 ** 2):
+        if path is None:
+            path = os.path.join(os.path.expanduser('~'), '.cache', 'deeplite_profiler', 'status_cache.sqlite')
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        self.path = path
+        self.max_size = max_size
+        with closing(self._connect()) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS status_cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                         "size INTEGER NOT NULL, last_access REAL NOT NULL)")
+
+    def _connect(self):
+        # a new connection per operation keeps the cache usable from any thread
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Hash any number of `str` parts into a single cache key.
+        """
+        hasher = hashlib.sha256()
+        for part in parts:
+            hasher.update(part.encode('utf-8'))
+            hasher.update(b'\0')
+        return hasher.hexdigest()
+
+    def get(self, key, default=None):
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT value FROM status_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            conn.execute("UPDATE status_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        try:
+            return pickle.loads(row[0])
+        except Exception:
+            logger.warning("Could not unpickle cached status value, discarding it")
+            self.discard(key)
+            return default
+
+    def put(self, key, value):
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            logger.debug("Status value {} is not picklable, it will not be cached".format(value))
+            return
+        if len(blob) > self.max_size:
+            return
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO status_cache (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                         (key, blob, len(blob), time.time()))
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM status_cache").fetchone()[0]
+        if total_size <= self.max_size:
+            return
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM status_cache ORDER BY last_access ASC"):
+            if total_size <= self.max_size:
+                break
+            evicted.append((key,))
+            total_size -= size
+        conn.executemany("DELETE FROM status_cache WHERE key = ?", evicted)
+
+    def discard(self, key):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM status_cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM status_cache")
+
+    def __len__(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM status_cache").fetchone()[0]
+
+    def __contains__(self, key):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT 1 FROM status_cache WHERE key = ?", (key,)).fetchone() is not None
@@ -1,4 +1,8 @@
 from abc import ABC, abstractmethod
+from copy import deepcopy
+from itertools import count
+import queue
+import threading
 
 from .formatter import getLogger
 from .utils import timer, Device
@@ -20,13 +24,46 @@ class DataLoader(ABC):
 
     @abstractmethod
     def dump_native_info(self):
-        """ Dump 'native_dl' picklable state """
+        """
+        Dump 'native_dl' picklable state. Returning None means 'native_dl' is itself picklable and will be
+        sent as is.
+        """
 
     @abstractmethod
     def load_native_info(self, native_state):
         """ Use dumped state from `dump_native_info` to reload itself """
         return self
 
+    def __getstate__(self):
+        # the iterator over native_dl is never picklable, it is recreated on the other side
+        state = self.__dict__.copy()
+        state['dl_iter'] = None
+        native_state = self.dump_native_info()
+        if native_state is not None:
+            state['native_dl'] = None
+        state['_native_state'] = native_state
+        return state
+
+    def __setstate__(self, state):
+        native_state = state.pop('_native_state', None)
+        self.__dict__.update(state)
+        if native_state is not None:
+            self.load_native_info(native_state)
+
+    def task_copy(self):
+        """
+        Copy of this `DataLoader` for a concurrent task. The native loader goes through `dump_native_info` /
+        `load_native_info` (it is shared if it dumps None), the :class:`~ForwardPass` and its
+        :class:`~TensorSampler` are deep copied and the iteration state is fresh.
+        """
+        state = self.__getstate__()
+        native_dl = state.pop('native_dl')
+        state = deepcopy(state)
+        state['native_dl'] = native_dl
+        new = type(self).__new__(type(self))
+        new.__setstate__(state)
+        return new
+
     @property
     def forward_pass(self):
         return self._forward_pass
@@ -36,16 +73,21 @@ class DataLoader(ABC):
         if fp is None:
             return
         self._forward_pass = fp
-        self.forward_pass.infer_sampler(next(iter(self)))
+        self.forward_pass.infer_sampler(self._first_batch())
 
     def __iter__(self):
         self.dl_iter = self._create_iter()
         return self
 
+    def _first_batch(self):
+        return next(iter(self))
+
     def __next__(self):
         """
             Returns a tuple.
         """
+        if self.dl_iter is None:
+            self.dl_iter = self._create_iter()
         return next(self.dl_iter)
 
     @abstractmethod
@@ -71,6 +113,12 @@ class DataLoader(ABC):
     def dataset_size(self):
         return len(self) * self.batch_size
 
+    def prefetch(self, num_batches=2, convert=None):
+        """
+        Returns a :class:`~PrefetchDataLoader` over this `DataLoader`, see its documentation.
+        """
+        return PrefetchDataLoader(self, num_batches=num_batches, convert=convert)
+
     ######### ForwardPass enabled methods ###########
     def sample_forward(self, model, device=Device.CPU):
         """
@@ -79,7 +127,7 @@ class DataLoader(ABC):
         """
         if self._forward_pass is None:
             raise TypeError("Cannot sample forward with a DataLoader that has no ForwardPass")
-        return self.forward_pass.perform(model, next(iter(self)), device)
+        return self.forward_pass.perform(model, self._first_batch(), device)
 
     def sample_random_forward(self, model, batch_size=None, device=Device.CPU):
         """
@@ -99,6 +147,157 @@ class DataLoader(ABC):
         return self.sample_random_forward(model, batch_size, device)
 
 
+class _PrefetchError:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+_PREFETCH_END = object()
+
+
+def _put_unless_stopped(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(iterable, convert, q, stop):
+    # module level, the thread does not hold the iterator which can be garbage collected when abandoned
+    try:
+        for batch in iterable:
+            if convert is not None:
+                batch = convert(batch)
+            if not _put_unless_stopped(q, batch, stop):
+                return
+    except Exception as e:
+        _put_unless_stopped(q, _PrefetchError(e), stop)
+    else:
+        _put_unless_stopped(q, _PREFETCH_END, stop)
+
+
+class _PrefetchIterator:
+    """
+    Iterator over the batches prepared by a background thread, which is only started by the first `next`.
+    An iterator abandoned before its end stops its thread when it is closed or garbage collected.
+    """
+
+    def __init__(self, iterable, num_batches, convert):
+        self._iterable = iterable
+        self._convert = convert
+        self._queue = queue.Queue(num_batches)
+        self._stop = threading.Event()
+        self._thread = None
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        if self._thread is None:
+            self._thread = threading.Thread(target=_produce, args=(self._iterable, self._convert, self._queue,
+                                                                   self._stop), daemon=True)
+            self._thread.start()
+        item = self._queue.get()
+        if item is _PREFETCH_END:
+            self.close()
+            raise StopIteration
+        if isinstance(item, _PrefetchError):
+            self.close()
+            raise item.exc
+        return item
+
+    def _drain(self):
+        # the prefetched batches are dropped, a producer blocked on the full queue sees the stop event
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def close(self):
+        """
+        Stops the background thread, the prefetched batches are dropped.
+        """
+        self._done = True
+        self._stop.set()
+        self._drain()
+        if self._thread is not None:
+            self._thread.join()
+        self._drain()
+
+    def __del__(self):
+        self._stop.set()
+        self._drain()
+
+
+class PrefetchDataLoader(DataLoader):
+    """
+    Wraps a :class:`~DataLoader` to read its next `num_batches` batches on a background thread while the
+    current one is consumed. `convert` is called on every batch in the background thread, to do ahead of
+    time the conversions the consumer would do (ex.: numpy to framework tensors, device transfer, see the
+    `prefetch` method of the framework `DataLoader`).
+
+    The background thread is started by the first batch requested, a new iteration stops the previous one.
+    The :class:`~ForwardPass` is the one of the wrapped `DataLoader`.
+
+    :param data_loader: The `DataLoader` to prefetch from
+    :type data_loader: :class:`~DataLoader`
+    :param num_batches: Maximum number of batches read ahead, defaults to 2
+    :type num_batches: `int`, optional
+    :param convert: Called on every batch ahead of time, defaults to None
+    :type convert: `callable`, optional
+    """
+
+    def __init__(self, data_loader, num_batches=2, convert=None):
+        if num_batches < 1:
+            raise ValueError("A prefetching DataLoader needs 'num_batches' >= 1 (got {})".format(num_batches))
+        self.num_batches = num_batches
+        self.convert = convert
+        super().__init__(data_loader)
+        self._forward_pass = data_loader.forward_pass
+
+    def dump_native_info(self):
+        # the wrapped DataLoader pickles itself
+        return
+
+    def load_native_info(self, native_state):
+        return self
+
+    def __len__(self):
+        return len(self.native_dl)
+
+    def _create_iter(self):
+        return _PrefetchIterator(self.native_dl._create_iter(), self.num_batches, self.convert)
+
+    def __iter__(self):
+        if self.dl_iter is not None:
+            self.dl_iter.close()
+        return super().__iter__()
+
+    def _first_batch(self):
+        # a single batch is read, the prefetching thread is stopped right away
+        batch = super()._first_batch()
+        self.close()
+        return batch
+
+    def close(self):
+        """
+        Stops the current iteration and its background thread.
+        """
+        if self.dl_iter is not None:
+            self.dl_iter.close()
+
+    @property
+    def batch_size(self):
+        return self.native_dl.batch_size
+
+
 class ModelInputPattern(tuple):
     """
     Makes sure we can call unambiguously model(*x)
@@ -164,12 +363,17 @@ class ForwardPass(ABC):
     user has nothing to override! If the use case is too complex for these assumptions to work, the user
     is always free to override any of the `ForwardPass` method.
 
+    If `reuse_random_inputs` is True, the default :method:`~create_random_model_inputs` hands out the same
+    random tensors for a given batch size instead of allocating new ones at every call. The values are then
+    only random once, which does not matter to profile the model but avoids large allocations at every step
+    (ex.: for video models).
+
     The design goal of this object is that a :class:`ProfilerFunction` can be written more generally and have
     a unified way to pipe data to model using this object. All default functions written here assumes the
     `ForwardPass`'s logic.
     """
 
-    def __new__(cls, model_input_pattern=None, expecting_common_inputs=True):
+    def __new__(cls, model_input_pattern=None, expecting_common_inputs=True, reuse_random_inputs=False):
         # checking the __dict__ over hasattr to avoid True because of super()
         if model_input_pattern is None and 'extract_model_inputs' not in cls.__dict__:
             raise TypeError(
@@ -185,11 +389,12 @@ class ForwardPass(ABC):
         # bypyass the Type error checks when creating __new__ at pickling
         return 'dummy', True
 
-    def __init__(self, model_input_pattern=None, expecting_common_inputs=True):
+    def __init__(self, model_input_pattern=None, expecting_common_inputs=True, reuse_random_inputs=False):
         if isinstance(model_input_pattern, tuple):
             model_input_pattern = ModelInputPattern(model_input_pattern)
         self.mip = model_input_pattern
         self.expecting_common_inputs = expecting_common_inputs
+        self.reuse_random_inputs = reuse_random_inputs
         self._tensor_sampler = None
 
     def perform(self, model, batch, device):
@@ -223,7 +428,7 @@ class ForwardPass(ABC):
         Default implementation is provided if the ForwardPass is instantiated expecting common inputs.
         """
         if self.expecting_common_inputs:
-            return self._tensor_sampler.create_random_tensors(batch_size)
+            return self._tensor_sampler.create_random_tensors(batch_size, reuse=self.reuse_random_inputs)
         raise NotImplementedError
 
     # @conditionnal_method('model_input_patterns')
@@ -249,6 +454,18 @@ class ForwardPass(ABC):
             raise NotImplementedError
         return self._tensor_sampler.get_flat_shapes_tuple()
 
+    # @conditionnal_method('expecting_common_inputs')
+    def get_model_input_dtypes(self):
+        """
+        Returns a tuple of all input dtypes that are fed to the model, in the order of
+        :method:`~get_model_input_shapes`.
+
+        Default implementation is provided if the ForwardPass is instantiated expecting common inputs.
+        """
+        if not self.expecting_common_inputs:
+            raise NotImplementedError
+        return self._tensor_sampler.get_flat_dtypes_tuple()
+
     @property
     @abstractmethod
     def _tensor_sampler_cls(self):
@@ -281,6 +498,14 @@ class TensorSampler(ABC):
         sample = self.standardize_tensors(tensors_tuple_sample)
         # tensors_info is structured as the tensors_tuple_sample, it preserves the model input structure
         self.tensors_info = self.get_tensors_info(sample)
+        # random tensors handed out when reused, keyed by (input index, shape, dtype, batch_size)
+        self._random_buffers = {}
+
+    def __getstate__(self):
+        # the buffers can be very large, they are recreated on demand
+        state = self.__dict__.copy()
+        state['_random_buffers'] = {}
+        return state
 
     @abstractmethod
     def _standardize_tensor(self, x):
@@ -309,24 +534,49 @@ class TensorSampler(ABC):
     def standardize_tensors(self, tensors_tuple):
         return self._loop_over_tensors_tuple(tensors_tuple, self._standardize_tensor)
 
-    def create_random_tensors(self, batch_size):
-        f = lambda x: self._create_random_tensor(x, batch_size)
+    def create_random_tensors(self, batch_size, reuse=False):
+        """
+        Random tensors structured as the model inputs. With `reuse`, the tensors created for a batch size are
+        kept and returned again at the next calls with the same batch size.
+        """
+        if not reuse:
+            f = lambda x: self._create_random_tensor(x, batch_size)
+        else:
+            # inputs of the same shape and dtype get their own buffer, an in-place op on one does not change
+            # the other
+            index = count()
+            f = lambda x: self._get_random_buffer(x, batch_size, next(index))
         return self._loop_over_tensors_tuple(self.tensors_info, f)
 
+    def _get_random_buffer(self, x_info, batch_size, index):
+        key = (index, tuple(x_info.shp), x_info.dtype, batch_size)
+        if key not in self._random_buffers:
+            self._random_buffers[key] = self._create_random_tensor(x_info, batch_size)
+        return self._random_buffers[key]
+
+    def clear_random_buffers(self):
+        self._random_buffers = {}
+
     def get_tensors_info(self, tensors_tuple):
         f = lambda x: TensorInfo(*self._get_info(x))
         infos_tuple = self._loop_over_tensors_tuple(tensors_tuple, f)
         return infos_tuple
 
     def get_flat_shapes_tuple(self):
+        return self._get_flat_info_tuple('shp')
+
+    def get_flat_dtypes_tuple(self):
+        return self._get_flat_info_tuple('dtype')
+
+    def _get_flat_info_tuple(self, attr):
         rval = []
         for info in self.tensors_info:
             if isinstance(info, (tuple, list)):
-                rval.extend(map(lambda s: s.shp, info))
+                rval.extend(map(lambda s: getattr(s, attr), info))
             elif isinstance(info, dict):
-                rval.extend(map(lambda s: s.shp, info.values()))
+                rval.extend(map(lambda s: getattr(s, attr), info.values()))
             else:
-                rval.append(info.shp)
+                rval.append(getattr(info, attr))
         return tuple(rval)
 
 
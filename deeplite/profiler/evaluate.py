@@ -51,3 +51,32 @@ class EvaluationFunction(ABC):
 
         return_keys = cast_tuple(return_keys)
         return {k: rval[k] for k in return_keys}
+
+
+class MetricReducer(ABC):
+    """
+    Reduces a metric over the batches of an evaluation. It is fed the outputs of the model and the targets of
+    every batch with :method:`~update`, and :method:`~get` returns the metric and resets the reducer, like an
+    :class:`deeplite.profiler.utils.Aggregator`. A reducer never runs the model itself, which allows many of
+    them to share the outputs of a single inference pass.
+    """
+
+    @abstractmethod
+    def update(self, outputs, targets):
+        """ Update the reduced state with one batch """
+
+    @abstractmethod
+    def get(self):
+        """ Get the metric and reset the state """
+
+    def get_state(self):
+        """
+        Get the raw reduced state (ex.: the sums and counts of its aggregators) and reset the reducer. The states
+        of reducers fed with different parts of the data are combined with :method:`~merge_state`, the metric
+        of the merged states is the same as the one of a single reducer fed with all the data.
+        """
+        raise NotImplementedError("{} does not support merging states".format(type(self).__name__))
+
+    def merge_state(self, state):
+        """ Merge a state of :method:`~get_state` into the reduced state """
+        raise NotImplementedError("{} does not support merging states".format(type(self).__name__))
@@ -124,6 +124,41 @@ def make_one_model_summary_str(status_dict, short_print=True, description_str=''
     return summary_str
 
 
+def compare_metrics(metric, other_metric):
+    """
+    Compare the value of `metric` to the one of `other_metric` according to the `Comparative` of `metric`.
+
+    :return: The comparison value, None if the metrics cannot be compared, and its display `str`
+    :rtype: `tuple`
+    """
+    _, value_1, units_1, comp, _ = parse_metric(metric)
+    _, value_2, units_2, _, _ = parse_metric(other_metric)
+
+    if comp is None:
+        comp = Comparative.NONE
+
+    if units_1 != "" and units_2 != "" and units_1 != units_2:
+        # TODO fix when units are not the same
+        return None, "<Unsupported units>"
+    if metric.value is None or other_metric.value is None:
+        return None, '---'
+    try:
+        # this should raise a ValueError if the str is not correct
+        if isinstance(comp, str):
+            comp = Comparative(comp)
+        rval = compare_status_values(comp, value_1, value_2)
+    except ZeroDivisionError:
+        return None, "INF"
+    except ValueError:
+        return None, "<Error Comparing>"
+    if rval is None:
+        return None, '---'
+    format_str = "{:>.2f}"
+    if comp is not Comparative.DIFF:
+        format_str += "x"
+    return rval, format_str.format(rval)
+
+
 def make_two_models_summary_str(status_dict, status_dict_2, short_print=True, description_str='',
                                 summary_str='\n'):
     line_length, col0_length, col1_length, col2_length, col3_length = 122, 40, 25, 25, 25
@@ -150,31 +185,7 @@ def make_two_models_summary_str(status_dict, status_dict_2, short_print=True, de
             sv2 = status_dict_2[sk]
             text, value_1, units_1, comp, desc = parse_metric(sv)
             _, value_2, units_2, _, _ = parse_metric(sv2)
-
-            if comp is None:
-                comp = Comparative.NONE
-
-            if units_1 != "" and units_2 != "" and units_1 != units_2:
-                # TODO fix when units are not the same
-                val = "<Unsupported units>"
-            else:
-                try:
-                    # this should raise a ValueError if the str is not correct
-                    if isinstance(comp, str):
-                        comp = Comparative(comp)
-                    rval = compare_status_values(comp, value_1, value_2)
-                except ZeroDivisionError:
-                    val = "INF"
-                except ValueError:
-                    val = "<Error Comparing>"
-                else:
-                    if rval is None:
-                        val = '---'
-                    else:
-                        format_str = "{:>.2f}"
-                        if comp is not Comparative.DIFF:
-                            format_str += "x"
-                        val = format_str.format(rval)
+            _, val = compare_metrics(sv, sv2)
 
             print_str = text + ' (' + units_1 + ')'
             line_new = "|{:>{col0_length}} | {:>{col1_length}}| {:>{col2_length}.4f}| {:>{col3_length}.4f}|".format(
@@ -195,6 +206,65 @@ def make_two_models_summary_str(status_dict, status_dict_2, short_print=True, de
     return summary_str
 
 
+def make_n_models_summary_str(status_dicts, short_print=True, baseline=None, description_str='',
+                              summary_str='\n'):
+    """
+    Table of the status of any number of models side by side, one value column per model. The rows are the
+    `Metric` of the first status dictionary (or of the baseline), a missing one in another model is shown as
+    not computed. With a `baseline` index, the value of every other model is followed by its enhancement
+    over the baseline, computed as in :func:`~make_two_models_summary_str`.
+    """
+    col0_length = 40
+    col_length = 20 if baseline is None else 30
+    n = len(status_dicts)
+    line_length = col0_length + 1 + (col_length + 2) * n
+    separator = "+" + "-" * (col0_length + 1) + ("+" + "-" * (col_length + 1)) * n + "+" + "\n"
+    line_format = "|{:>{col0_length}} |" + " {:>{col_length}}|" * n
+
+    def header(i, sd):
+        text = "Value (" + sd['name'] + ")"
+        if i == baseline:
+            text = "Baseline (" + sd['name'] + ")"
+        return text
+
+    summary_str += "+" + "-" * line_length + "+" + "\n"
+    summary_str += "|{:^{line_length}}|".format("Deeplite Profiler", line_length=line_length) + "\n"
+    summary_str += separator
+    summary_str += line_format.format("Param Name", *(header(i, sd) for i, sd in enumerate(status_dicts)),
+                                      col0_length=col0_length, col_length=col_length) + "\n"
+    summary_str += line_format.format("", *("Backend: " + sd['backend'] for sd in status_dicts),
+                                      col0_length=col0_length, col_length=col_length) + "\n"
+    summary_str += separator
+
+    reference = status_dicts[0 if baseline is None else baseline]
+    for sk, sv in reference.items():
+        if not isinstance(sv, Metric):
+            continue
+        text, _, units, _, desc = parse_metric(sv)
+        cells = []
+        for i, sd in enumerate(status_dicts):
+            metric = sd.get(sk, None)
+            if not isinstance(metric, Metric):
+                cells.append(str(NotComputedValue()))
+                continue
+            cell = "{:.4f}".format(parse_metric(metric)[1])
+            if baseline is not None and i != baseline:
+                cell += " (" + compare_metrics(sv, metric)[1] + ")"
+            cells.append(cell)
+        print_str = text + ' (' + units + ')'
+        summary_str += line_format.format(print_str, *cells, col0_length=col0_length,
+                                          col_length=col_length) + "\n"
+        description_str += '* ' + text + ': ' + desc + "\n"
+    summary_str += separator
+
+    if not short_print:
+        summary_str += "Note: " + "\n"
+        summary_str += description_str
+        summary_str += "+" + "-" * line_length + "+"
+
+    return summary_str
+
+
 def default_display_filter_function(status_dict):
     """
     The default order is like:
@@ -0,0 +1,298 @@
+from array import array
+
+__all__ = ['LayerwiseTable', 'LayerwiseTimeTable', 'LayerRecord', 'HotLayersReport']
+
+
+class LayerRecord:
+    """
+    A single layer of a :class:`~LayerwiseTable`, its fields are the columns of the table. A missing
+    measurement is None.
+    """
+    __slots__ = ('name', 'type', 'input_shape', 'output_shape', 'weight_shape', 'bias_shape', 'macs', 'params',
+                 'activations', 'activation_bytes', 'time', 'depth', 'calls', 'inclusive_time', 'exclusive_time')
+
+    def __init__(self, **fields):
+        for c in self.__slots__:
+            setattr(self, c, fields.pop(c, None))
+        if fields:
+            raise ValueError("Unknown layer columns {} (valid := {})".format(sorted(fields), self.__slots__))
+
+    def __getitem__(self, column):
+        if column not in self.__slots__:
+            raise KeyError(column)
+        return getattr(self, column)
+
+    def to_dict(self):
+        return {c: getattr(self, c) for c in self.__slots__}
+
+    def __eq__(self, other):
+        if not isinstance(other, LayerRecord):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join("{}={!r}".format(c, getattr(self, c))
+                                                             for c in self.__slots__))
+
+
+class LayerwiseTable:
+    """
+    Per layer measurements of a model, the value of the :class:`~LayerwiseSummary` status key. The table is
+    stored by columns, the counts and times in typed arrays, and a layer is read back as a
+    :class:`~LayerRecord`. The columns are listed in `COLUMNS`.
+
+    The human readable table is only rendered when the table is converted to `str`, otherwise the layers are
+    meant to be queried (:method:`~filter`, :method:`~sort_by`, :method:`~top_k`) or consumed directly (ex.:
+    :method:`Profiler.export_status`).
+
+    :param records: Layers in their execution order, as `dict` or :class:`~LayerRecord`
+    :type records: iterable, optional
+    :param model_name: Name of the model displayed in the rendered table header
+    :type model_name: `str`, optional
+    """
+    COLUMNS = LayerRecord.__slots__
+    # typecode of the numeric columns, the others are kept in lists
+    _TYPECODES = {'macs': 'q', 'params': 'q', 'activations': 'q', 'activation_bytes': 'q', 'time': 'd',
+                  'depth': 'q', 'calls': 'q', 'inclusive_time': 'd', 'exclusive_time': 'd'}
+
+    # (header, column, width) of the rendered table
+    _DISPLAY = (("Layer ({model_name})", 'name', 25), ("Weight Shape", 'weight_shape', 20),
+                ("Bias Shape", 'bias_shape', 15), ("Output Shape", 'output_shape', 20),
+                ("ActivationSize (Bytes)", 'activation_bytes', 25), ("# Params", 'params', 14),
+                ("Time (ms)", 'time', 14))
+    _DISPLAY_WIDTH = 140
+
+    def __init__(self, records=(), model_name=''):
+        self.model_name = model_name
+        self._columns = {c: array(self._TYPECODES[c]) if c in self._TYPECODES else [] for c in self.COLUMNS}
+        # rows where a numeric column is missing, the arrays cannot hold None
+        self._missing = {c: set() for c in self._TYPECODES}
+        self._len = 0
+        for record in records:
+            self.append(record)
+
+    @classmethod
+    def column_types(cls):
+        """
+        The type of the values of each column, in the order of `COLUMNS`: `int` or `float` for the counts and
+        times, `str` for the name and type and `list` for the shapes (nested lists of `int`). A missing value is
+        None whatever the type.
+
+        :rtype: `dict` of `str` to `type`
+        """
+        types = {'q': int, 'd': float}
+        return {c: types[cls._TYPECODES[c]] if c in cls._TYPECODES else list if c.endswith('shape') else str
+                for c in cls.COLUMNS}
+
+    def append(self, record):
+        if isinstance(record, LayerRecord):
+            record = record.to_dict()
+        unknown = set(record) - set(self.COLUMNS)
+        if unknown:
+            raise ValueError("Unknown layer columns {} (valid := {})".format(sorted(unknown), self.COLUMNS))
+        for c, column in self._columns.items():
+            value = record.get(c, None)
+            if c in self._TYPECODES:
+                if value is None:
+                    self._missing[c].add(self._len)
+                    value = 0
+                value = float(value) if self._TYPECODES[c] == 'd' else int(value)
+            column.append(value)
+        self._len += 1
+
+    def _get(self, c, i):
+        if c in self._missing and i in self._missing[c]:
+            return None
+        return self._columns[c][i]
+
+    def record(self, i):
+        """
+        The layer at index `i`, in execution order.
+        """
+        if not -self._len <= i < self._len:
+            raise IndexError("Layer index out of range")
+        i = i % self._len
+        return LayerRecord(**{c: self._get(c, i) for c in self.COLUMNS})
+
+    def column(self, c):
+        """
+        A copy of the values of a column as a `list`, missing values are None.
+        """
+        if c not in self._columns:
+            raise KeyError(c)
+        return [self._get(c, i) for i in range(self._len)]
+
+    def iter_records(self):
+        """
+        Iterate over the layers as :class:`~LayerRecord`, in execution order.
+        """
+        for i in range(self._len):
+            yield self.record(i)
+
+    def _take(self, indices):
+        table = type(self)(model_name=self.model_name)
+        for i in indices:
+            table.append({c: self._get(c, i) for c in self.COLUMNS})
+        return table
+
+    def filter(self, predicate=None, **equals):
+        """
+        New table of the layers for which `predicate(record)` is True and whose columns are equal to the given
+        keywords (ex.: table.filter(type='Conv2d')).
+        """
+        indices = []
+        for i, record in enumerate(self.iter_records()):
+            if all(record[c] == v for c, v in equals.items()) and (predicate is None or predicate(record)):
+                indices.append(i)
+        return self._take(indices)
+
+    def _sorted_indices(self, c, descending):
+        values = self.column(c)
+        present = sorted((i for i, v in enumerate(values) if v is not None), key=values.__getitem__,
+                         reverse=descending)
+        return present + [i for i, v in enumerate(values) if v is None]
+
+    def sort_by(self, c, descending=True):
+        """
+        New table of the layers sorted by a column, missing values last.
+        """
+        return self._take(self._sorted_indices(c, descending))
+
+    def top_k(self, k, c='macs'):
+        """
+        New table of the `k` most costly layers according to a column.
+        """
+        return self._take(self._sorted_indices(c, True)[:k])
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def __eq__(self, other):
+        if not isinstance(other, LayerwiseTable):
+            return NotImplemented
+        return self._columns == other._columns and self._missing == other._missing
+
+    @staticmethod
+    def _format_cell(column, value):
+        if value is None:
+            return str(None)
+        if column in ('activation_bytes', 'params'):
+            return "{0:,}".format(value)
+        if column.endswith('time'):
+            return "{0:2.4f}".format(value)
+        return str(value)
+
+    def __str__(self):
+        line_format = " ".join("{:>%d}" % width for _, _, width in self._DISPLAY)
+        width = self._DISPLAY_WIDTH
+        lines = ["", "-" * width,
+                 line_format.format(*(h.format(model_name=self.model_name) for h, _, _ in self._DISPLAY)),
+                 "=" * width]
+        for i in range(self._len):
+            cells = (self._format_cell(c, self._get(c, i)) for _, c, _ in self._DISPLAY)
+            lines.append(line_format.format(*cells))
+        lines.append("-" * width)
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "{}({} layers)".format(type(self).__name__, len(self))
+
+
+class LayerwiseTimeTable(LayerwiseTable):
+    """
+    :class:`~LayerwiseTable` of the timings of the modules hierarchy, displayed with the timing columns.
+    `name` is the qualified name of the module and `depth` its depth in the hierarchy, 0 for the model.
+    """
+    _DISPLAY = (("Module ({model_name})", 'name', 40), ("Type", 'type', 20), ("Calls", 'calls', 8),
+                ("Inclusive (ms)", 'inclusive_time', 16), ("Exclusive (ms)", 'exclusive_time', 16))
+    _DISPLAY_WIDTH = 104
+
+
+class HotLayersReport:
+    """
+    Layers ranked by their share of the forward pass time, the value of the :class:`~HotLayers` status key.
+    Each row is a `dict` with the keys of `COLUMNS`:
+
+    - 'time' is the exclusive time of the layer (ms) and 'time_share' its share of the total time of the
+      layers, 'cumulative_time_share' the share of this layer and all the hotter ones
+    - 'macs', 'mac_share', 'bytes' (weights, inputs and outputs of the layer) and 'bytes_share' likewise
+    - 'arithmetic_intensity' is the FLOPs (2 * MACs) per byte and 'bound' is 'compute' if it is over the
+      `machine_balance` (FLOPs per byte the device computes in the time it moves a byte), 'memory' otherwise
+
+    :param rows: Rows of the layers
+    :type rows: iterable of `dict`
+    :param machine_balance: FLOPs per byte of the device
+    :type machine_balance: `float`
+    """
+    COLUMNS = ('name', 'type', 'time', 'time_share', 'cumulative_time_share', 'macs', 'mac_share', 'bytes',
+               'bytes_share', 'arithmetic_intensity', 'bound')
+
+    _DISPLAY = (("Layer", 'name', 30, '{}'), ("Type", 'type', 18, '{}'), ("Time (ms)", 'time', 12, '{:.4f}'),
+                ("Time %", 'time_share', 8, '{:.1%}'), ("Cumul. %", 'cumulative_time_share', 9, '{:.1%}'),
+                ("MACs %", 'mac_share', 8, '{:.1%}'), ("Bytes %", 'bytes_share', 8, '{:.1%}'),
+                ("FLOPs/Byte", 'arithmetic_intensity', 11, '{:.2f}'), ("Bound", 'bound', 8, '{}'))
+
+    def __init__(self, rows, machine_balance):
+        self.machine_balance = machine_balance
+        rows = sorted(rows, key=lambda r: r['time'], reverse=True)
+        total_time, total_macs, total_bytes = (sum(r[c] for r in rows) for c in ('time', 'macs', 'bytes'))
+
+        def share(x, total):
+            return x / total if total else 0.
+
+        self.rows = []
+        cumulative_time = 0.
+        for row in rows:
+            cumulative_time += row['time']
+            intensity = share(2 * row['macs'], row['bytes'])
+            self.rows.append({'name': row['name'], 'type': row['type'], 'time': row['time'],
+                              'time_share': share(row['time'], total_time),
+                              'cumulative_time_share': share(cumulative_time, total_time),
+                              'macs': row['macs'], 'mac_share': share(row['macs'], total_macs),
+                              'bytes': row['bytes'], 'bytes_share': share(row['bytes'], total_bytes),
+                              'arithmetic_intensity': intensity,
+                              'bound': 'compute' if intensity >= machine_balance else 'memory'})
+
+    @classmethod
+    def column_types(cls):
+        """
+        The type of the values of each column, in the order of `COLUMNS`.
+
+        :rtype: `dict` of `str` to `type`
+        """
+        return {c: str if c in ('name', 'type', 'bound') else int if c in ('macs', 'bytes') else float
+                for c in cls.COLUMNS}
+
+    def pareto(self, share=0.8):
+        """
+        The hottest rows which together take at least `share` of the time.
+        """
+        for i, row in enumerate(self.rows):
+            if row['cumulative_time_share'] >= share:
+                return self.rows[:i + 1]
+        return list(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __str__(self):
+        line_format = " ".join("{:>%d}" % width for _, _, width, _ in self._DISPLAY)
+        width = sum(width + 1 for _, _, width, _ in self._DISPLAY) - 1
+        lines = ["", "-" * width, line_format.format(*(h for h, _, _, _ in self._DISPLAY)), "=" * width]
+        for row in self.rows:
+            lines.append(line_format.format(*(fmt.format(row[c]) for _, c, _, fmt in self._DISPLAY)))
+        lines.append("-" * width)
+        lines.append("Machine balance: {:.2f} FLOPs/Byte".format(self.machine_balance))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "{}({} layers)".format(type(self).__name__, len(self))
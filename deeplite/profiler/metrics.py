@@ -2,7 +2,10 @@ from abc import ABC, abstractmethod, abstractstaticmethod
 from enum import Enum
 
 __all__ = ["Comparative", "LayerwiseSummary", "Flops", "ModelSize", "ExecutionTime", "TotalParams",
-           "MemoryFootprint", "EvalMetric", "InferenceTime"]
+           "MemoryFootprint", "EvalMetric", "SecondaryEvalMetric", "InferenceTime", "ExecutionTimeP50", "ExecutionTimeP90",
+           "ExecutionTimeP99", "ExecutionTimeStd", "ExecutionTimeMin", "ExecutionTimeOutliers",
+           "ThroughputCurve", "OptimalBatchSize", "PeakMemory", "PeakActivationMemory", "LayerwiseTime",
+           "HotLayers"]
 
 
 class Comparative(Enum):
@@ -45,6 +48,28 @@ class LayerwiseSummary(StatusKey):
     NAME = 'layerwise_summary'
 
 
+class LayerwiseTime(StatusKey):
+    """
+    Time of every module of the model, a :class:`~LayerwiseTimeTable`.
+    """
+    NAME = 'layerwise_time'
+
+
+class HotLayers(StatusKey):
+    """
+    Layers ranked by their share of the time with their roofline classification, a :class:`~HotLayersReport`.
+    """
+    NAME = 'hot_layers'
+
+
+class ThroughputCurve(StatusKey):
+    """
+    Per batch size measurements, a list of `dict` with keys 'batch_size', 'latency' (ms per batch),
+    'throughput' (images per second) and 'peak_memory' (MB).
+    """
+    NAME = 'throughput_curve'
+
+
 class Metric(StatusKey):
     """
     Metric is the most used interface of :class:`~StatusKey`. A :class:`~Metric` usually has a description,
@@ -156,6 +181,84 @@ class ExecutionTime(Metric):
         return 'ms'
 
 
+class ExecutionTimeP50(ExecutionTime):
+    NAME = 'execution_time_p50'
+
+    @staticmethod
+    def description():
+        return "On current device, median time required for the forward pass per single image"
+
+    @staticmethod
+    def friendly_name():
+        return "Execution Time p50"
+
+
+class ExecutionTimeP90(ExecutionTime):
+    NAME = 'execution_time_p90'
+
+    @staticmethod
+    def description():
+        return "On current device, 90th percentile of the time required for the forward pass per single image"
+
+    @staticmethod
+    def friendly_name():
+        return "Execution Time p90"
+
+
+class ExecutionTimeP99(ExecutionTime):
+    NAME = 'execution_time_p99'
+
+    @staticmethod
+    def description():
+        return "On current device, 99th percentile of the time required for the forward pass per single image"
+
+    @staticmethod
+    def friendly_name():
+        return "Execution Time p99"
+
+
+class ExecutionTimeStd(ExecutionTime):
+    NAME = 'execution_time_std'
+
+    @staticmethod
+    def description():
+        return "On current device, standard deviation of the time required for the forward pass per single image"
+
+    @staticmethod
+    def friendly_name():
+        return "Execution Time Std"
+
+
+class ExecutionTimeMin(ExecutionTime):
+    NAME = 'execution_time_min'
+
+    @staticmethod
+    def description():
+        return "On current device, fastest time required for the forward pass per single image"
+
+    @staticmethod
+    def friendly_name():
+        return "Execution Time Min"
+
+
+class ExecutionTimeOutliers(Metric):
+    NAME = 'execution_time_outliers'
+
+    @staticmethod
+    def description():
+        return "Number of timed forward passes outside of the 1.5 interquartile range fences"
+
+    @staticmethod
+    def friendly_name():
+        return "Execution Time Outliers"
+
+    def get_comparative(self):
+        return Comparative.NONE
+
+    def get_units(self):
+        return ''
+
+
 class ModelSize(Metric):
     NAME = 'model_size'
 
@@ -217,6 +320,23 @@ class EvalMetric(Metric):
         return self.comparative
 
 
+class SecondaryEvalMetric(EvalMetric):
+    """
+    Another metric returned by the evaluation function of an :class:`EvalMetric`, the `name` of the metric
+    is its status key.
+    """
+
+    def __init__(self, name, unit_name='', comparative=Comparative.DIFF):
+        super().__init__(unit_name=unit_name, comparative=comparative)
+        self.NAME = name
+
+    def description(self):
+        return "Computed performance of the model on the given data ({})".format(self.NAME)
+
+    def friendly_name(self):
+        return self.NAME
+
+
 class InferenceTime(Metric):
     NAME = 'inference_time'
 
@@ -233,3 +353,57 @@ class InferenceTime(Metric):
 
     def get_units(self):
         return 's'
+
+
+class OptimalBatchSize(Metric):
+    NAME = 'optimal_batch_size'
+
+    @staticmethod
+    def description():
+        return "On current device, batch size with the highest throughput within the latency budget"
+
+    @staticmethod
+    def friendly_name():
+        return "Optimal Batch Size"
+
+    def get_comparative(self):
+        return Comparative.NONE
+
+    def get_units(self):
+        return ''
+
+
+class PeakMemory(Metric):
+    NAME = 'peak_memory'
+
+    @staticmethod
+    def description():
+        return "Measured peak memory of a forward pass, parameters included"
+
+    @staticmethod
+    def friendly_name():
+        return "Peak Memory"
+
+    def get_comparative(self):
+        return Comparative.RECIPROCAL
+
+    def get_units(self):
+        return 'MB'
+
+
+class PeakActivationMemory(Metric):
+    NAME = 'peak_activation_memory'
+
+    @staticmethod
+    def description():
+        return "Highest memory held at once by the inputs and activations of a forward pass, from their lifetimes"
+
+    @staticmethod
+    def friendly_name():
+        return "Peak Activation Memory"
+
+    def get_comparative(self):
+        return Comparative.RECIPROCAL
+
+    def get_units(self):
+        return 'MB'
@@ -0,0 +1,311 @@
+from collections import OrderedDict
+import queue
+import threading
+
+from .formatter import getLogger, make_n_models_summary_str, compare_metrics
+from .metrics import Metric
+from .profiler import ComputeEvalMetric, _CACHE_MISS
+
+logger = getLogger(__name__)
+
+_END = object()
+
+
+class _BroadcastError:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+class _BroadcastConsumer:
+    """
+    One model's view of a broadcast data loader. It is iterated once, yielding the batches the producer reads
+    from the source, and delegates any other attribute (ex.: `batch_size`, `forward_pass`) to the source.
+
+    The native data loader of the source is hidden, an evaluation reading it directly (ex.: a
+    `ShardedEvaluation`) would pass it over again instead of using the shared pass.
+    """
+
+    def __init__(self, source, maxsize):
+        self._source = source
+        self._queue = queue.Queue(maxsize)
+        self._closed = threading.Event()
+        self._iterated = False
+
+    def __getattr__(self, item):
+        if item.startswith('__') or item in ('_source', 'native_dl'):
+            raise AttributeError(item)
+        return getattr(self._source, item)
+
+    def __len__(self):
+        return len(self._source)
+
+    def __iter__(self):
+        if self._iterated:
+            raise RuntimeError("A broadcast data loader can only be iterated once")
+        self._iterated = True
+        return self._iterate()
+
+    def _iterate(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _END:
+                    return
+                if isinstance(item, _BroadcastError):
+                    raise item.exc
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        # a consumer which stops early must not block the producer
+        self._closed.set()
+
+    def put(self, item, timeout=0.1):
+        """
+        Blocks until `item` is queued, returns False if the consumer was closed in the meantime.
+        """
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=timeout)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+class _Broadcast:
+    """
+    Reads the batches of `source` once and puts each of them in the bounded queue of every consumer. The
+    slowest consumer sets the pace, at most `maxsize` batches are buffered per consumer.
+    """
+
+    def __init__(self, source, n_consumers, maxsize):
+        self.source = source
+        self.consumers = [_BroadcastConsumer(source, maxsize) for _ in range(n_consumers)]
+
+    def _put(self, item):
+        alive = False
+        for consumer in self.consumers:
+            alive = consumer.put(item) or alive
+        return alive
+
+    def run(self):
+        try:
+            for batch in self.source:
+                if not self._put(batch):
+                    break
+        except Exception as e:
+            self._put(_BroadcastError(e))
+        finally:
+            self._put(_END)
+
+
+def compare_profilers(profilers, baseline=0, print_mode='info', recompute=False, short_print=True, **kwargs):
+    """
+    Compare any number of :class:`Profiler` to a baseline one. Contrary to calling :method:`Profiler.compare`
+    pairwise, the status of every profiler is computed once and what is already computed is reused (unless
+    `recompute`). The profilers can belong to the same model or different models.
+
+    :param profilers: Profilers to compare, their names must be unique
+    :type profilers: `list` of :class:`Profiler`
+    :param baseline: Index or name of the baseline profiler, defaults to 0
+    :type baseline: `int` or `str`, optional
+    :param print_mode: Logger print mode of the comparison table, defaults to 'info'. None does not display it
+    :type print_mode: str, optional
+    :param recompute: If all the :class:`StatusKey` need to be recomputed, defaults to False
+    :type recompute: bool, optional
+    :param short_print: If to display a short version of the profiled output or a long detailed version,
+        defaults to True
+    :type short_print: bool, optional
+
+    :raises ValueError: Duplicated profiler names or unknown baseline
+
+    :return: For every `Metric` of the baseline, the 'value' of each profiler and its 'relative' value to the
+        baseline (its enhancement in the comparison table, None if not comparable), as
+        {status key: {profiler name: {'value', 'relative'}}}
+    :rtype: `OrderedDict`
+    """
+    profilers = list(profilers)
+    for p in profilers:
+        p.compute_network_status(print_mode=None, recompute=recompute, **kwargs)
+    return _compare_status(profilers, baseline, print_mode, short_print)
+
+
+def _compare_status(profilers, baseline, print_mode, short_print):
+    names = [p.name for p in profilers]
+    if len(set(names)) != len(names):
+        raise ValueError("Compared profilers need unique names (got {})".format(names))
+    if not isinstance(baseline, int):
+        if baseline not in names:
+            raise ValueError("Unknown baseline profiler '{}' (valid := {})".format(baseline, names))
+        baseline = names.index(baseline)
+
+    reference = profilers[baseline].status_to_dict(to_value=False)
+    status_dicts = [p.status_to_dict(to_value=False) for p in profilers]
+    result = OrderedDict()
+    for sk, metric in reference.items():
+        if not isinstance(metric, Metric):
+            continue
+        result[sk] = OrderedDict()
+        for name, status_dict in zip(names, status_dicts):
+            other = status_dict.get(sk, None)
+            if isinstance(other, Metric) and other.value is not None:
+                value, relative = other.get_value(), compare_metrics(metric, other)[0]
+            else:
+                value, relative = None, None
+            result[sk][name] = {'value': value, 'relative': relative}
+
+    if print_mode:
+        assert isinstance(print_mode, str) and hasattr(logger, print_mode.lower()), \
+            "'print_mode' needs to be a logger level"
+        status_dicts = [p.display_status_dict()[0] for p in profilers]
+        summary_str = make_n_models_summary_str(status_dicts, short_print=short_print, baseline=baseline)
+        getattr(logger, print_mode.lower())(summary_str)
+    return result
+
+
+class MultiProfiler:
+    """
+    Profiles many models over the same data splits. Every model gets its own :class:`Profiler`, a clone of
+    `profiler` with the same registered :class:`ProfilerFunction`, and the results are displayed side by
+    side in a single table.
+
+    The :class:`ComputeEvalMetric` functions of all the models are computed in a shared pass: each batch of
+    their split is read once from the data loader and broadcast to every model's evaluation function, each
+    running in its own thread. The other functions (complexity, execution time, ...) do not iterate over the
+    data and are computed model after model so that the timings do not compete for the same cores.
+
+    NOTE: The 'inference_time' of a shared evaluation is the time of the whole shared pass. The batches are
+    shared between the models, an evaluation function should not modify them in place. A sharded evaluation
+    runs in a single process on the shared batches.
+
+    :param profiler: Template profiler, its data splits and registered functions are used for every model
+    :type profiler: :class:`Profiler`
+    :param models: Models to profile
+    :type models: `list` of <native object type>
+    :param names: A user-friendly name for each model, defaults to 'model_0', 'model_1', ...
+    :type names: `list` of `str`, optional
+    :param queue_size: Maximum number of batches buffered for each model in the shared pass, defaults to 2
+    :type queue_size: `int`, optional
+
+    :raises ValueError: Not as many names as models
+    """
+
+    def __init__(self, profiler, models, names=None, queue_size=2):
+        models = list(models)
+        if names is None:
+            names = ['model_{}'.format(i) for i in range(len(models))]
+        names = list(names)
+        if len(names) != len(models):
+            raise ValueError("Got {} names for {} models".format(len(names), len(models)))
+        self.data_splits = profiler.data_splits
+        self.queue_size = queue_size
+        self.profilers = []
+        for model, name in zip(models, names):
+            p = profiler.clone(model=model)
+            p.name = name
+            p.display_status_filter_func = profiler.display_status_filter_func
+            self.profilers.append(p)
+
+    def __len__(self):
+        return len(self.profilers)
+
+    def __iter__(self):
+        return iter(self.profilers)
+
+    def compute_network_status(self, print_mode=None, recompute=False, short_print=True, **kwargs):
+        """
+        Populates the status of every model, see :method:`Profiler.compute_network_status`.
+
+        :return: The status dictionary of each model, keyed by its name
+        :rtype: `OrderedDict`
+        """
+        if print_mode:
+            getattr(logger, print_mode.lower())("Computing networks status...")
+
+        if recompute:
+            for p in self.profilers:
+                p.reset_status()
+
+        self._compute_eval_metrics(kwargs)
+        for p in self.profilers:
+            p.compute_network_status(print_mode=None, **kwargs)
+
+        if print_mode:
+            self.display_status(print_mode=print_mode, short_print=short_print)
+
+        return OrderedDict((p.name, dict(p.status_items())) for p in self.profilers)
+
+    def _compute_eval_metrics(self, kwargs):
+        # split -> [(profiler, function, status key, cache key)] of every missing evaluation
+        pending = OrderedDict()
+        for p in self.profilers:
+            functions = set()
+            for sk in p.status_keys():
+                pf_func = p._profiling_functions_register[sk].function
+                if p.status_get(sk) is not None or not isinstance(pf_func, ComputeEvalMetric) or \
+                        pf_func in functions:
+                    continue
+                functions.add(pf_func)
+                cache_key = p._get_cache_key(pf_func, kwargs)
+                rval = p._get_cached(cache_key)
+                if rval is not _CACHE_MISS:
+                    p._update_status(sk, pf_func, rval)
+                    continue
+                split = kwargs.get('split', None)
+                split = split if split else pf_func.default_split
+                pending.setdefault(split, []).append((p, pf_func, sk, cache_key))
+
+        for split, tasks in pending.items():
+            self._run_shared_pass(split, tasks, kwargs)
+
+    def _run_shared_pass(self, split, tasks, kwargs):
+        broadcast = _Broadcast(self.data_splits[split], len(tasks), self.queue_size)
+        results = [None] * len(tasks)
+
+        def consume(i, p, pf_func, consumer):
+            try:
+                results[i] = (True, pf_func.pipe_kwargs_to_call(p.model, {split: consumer}, kwargs))
+            except Exception as e:
+                results[i] = (False, e)
+            finally:
+                consumer.close()
+
+        threads = [threading.Thread(target=consume, args=(i, p, pf_func, consumer), daemon=True)
+                   for i, ((p, pf_func, _, _), consumer) in enumerate(zip(tasks, broadcast.consumers))]
+        threads.append(threading.Thread(target=broadcast.run, daemon=True))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        for (p, pf_func, sk, cache_key), (success, rval) in zip(tasks, results):
+            if not success:
+                raise rval
+            p._put_cached(cache_key, rval)
+            p._update_status(sk, pf_func, rval)
+
+    def compare(self, baseline=0, print_mode='info', recompute=False, short_print=True, **kwargs):
+        """
+        Compare the models to a baseline one after computing their status with
+        :method:`~compute_network_status`, see :func:`~compare_profilers`.
+        """
+        self.compute_network_status(print_mode=None, recompute=recompute, **kwargs)
+        return _compare_status(self.profilers, baseline, print_mode, short_print)
+
+    def display_status(self, print_mode='debug', short_print=True):
+        """
+        Display the status of all the models side by side, see :method:`Profiler.display_status`.
+        """
+        assert isinstance(print_mode, str) and hasattr(logger, print_mode.lower()), \
+            "'print_mode' needs to be a logger level"
+
+        status_dicts, layerwise_summaries = zip(*(p.display_status_dict() for p in self.profilers))
+        summary_str = make_n_models_summary_str(status_dicts, short_print=short_print)
+
+        if not short_print:
+            for layerwise_summary in layerwise_summaries:
+                if layerwise_summary:
+                    logger.debug(layerwise_summary.value)
+        getattr(logger, print_mode.lower())(summary_str)
@@ -1,19 +1,26 @@
 from abc import ABC, abstractmethod
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from copy import copy, deepcopy
+from enum import Enum
 from inspect import signature, Parameter
+import json
+import os
 import time
 
+from .data_loader import DataLoader
 from .evaluate import EvaluationFunction
 from .formatter import getLogger, make_one_model_summary_str, make_two_models_summary_str, \
     default_display_filter_function
-from .metrics import EvalMetric, InferenceTime, Comparative
+from .layerwise import LayerwiseTable, HotLayersReport
+from .metrics import EvalMetric, SecondaryEvalMetric, InferenceTime, Comparative
 from .utils import cast_tuple
 
 logger = getLogger(__name__)
 
 _ProfilerFunctionRegister = namedtuple("_ProfilerFunctionRegister", ('function', 'overriding', 'status'),
                                        module=__name__)
+_CACHE_MISS = object()
 
 
 class Profiler(ABC):
@@ -40,16 +47,21 @@ class Profiler(ABC):
     :param display_status_filter_func: A method to display the computed metrics in a user-friendly readable format,
         defaults to deeplite.profiler.formatter.default_display_filter_function
     :type display_status_filter_func: `callable`, optional
+    :param status_cache: A persistent cache of the computed values, keyed on :method:`~model_fingerprint`, the
+        `ProfilerFunction` and the keywords it is called with, defaults to None (no cache)
+    :type status_cache: :class:`deeplite.profiler.cache.StatusCache`, optional
     """
 
     def __init__(self, model, data_splits, name="<UnNamedModel>",
-                 display_status_filter_func=default_display_filter_function):
+                 display_status_filter_func=default_display_filter_function, status_cache=None):
         self._profiling_functions_register = {}
         self.model = model
         self.name = name
         self.data_splits = data_splits
         self.backend = '<None>'
         self.display_status_filter_func = display_status_filter_func
+        self.status_cache = status_cache
+        self._model_fingerprint = None
 
     def register_profiler_function(self, profiler_func, override=False):
         """
@@ -110,6 +122,13 @@ class Profiler(ABC):
         Returns the concrete framework :class:`ForwardPass`
         """
 
+    def model_fingerprint(self):
+        """
+        Returns a `str` hash of the model's architecture and weights. Two models with the same fingerprint
+        are expected to produce the same profiled values. Needed only when a `status_cache` is used.
+        """
+        raise NotImplementedError("Profiler '{}' cannot fingerprint its model".format(type(self).__name__))
+
     @classmethod
     def enable_forward_pass_data_splits(cls, data_splits, forward_pass=None):
         """
@@ -138,7 +157,8 @@ class Profiler(ABC):
 
         :param status: Unique string identifier of wanted `StatusKey`
         :type status: `str`
-        :param recompute: If the metric values need to be recomputed, defaults to False
+        :param recompute: If the metric values need to be recomputed, bypassing the status cache (the new
+            values are still stored in it), defaults to False
         :type recompute: `bool`, optional
 
         :raises ValueError: If an unrecognized status key is found
@@ -155,8 +175,34 @@ class Profiler(ABC):
 
         pfr = self._profiling_functions_register[status]
         pf_func = pfr.function
-        rval = pf_func.pipe_kwargs_to_call(self.model, self.data_splits, kwargs)
-
+        cache_key = self._get_cache_key(pf_func, kwargs)
+        rval = _CACHE_MISS if recompute else self._get_cached(cache_key)
+        if rval is _CACHE_MISS:
+            rval = pf_func.pipe_kwargs_to_call(self.model, self.data_splits, kwargs)
+            self._put_cached(cache_key, rval)
+        return self._update_status(status, pf_func, rval)
+
+    def _get_cache_key(self, pf_func, kwargs):
+        if self.status_cache is None:
+            return None
+        fingerprint = self._model_fingerprint
+        if fingerprint is None:
+            fingerprint = self.model_fingerprint()
+        return self.status_cache.make_key(self.backend, fingerprint, pf_func.get_call_fingerprint(kwargs))
+
+    def _get_cached(self, cache_key):
+        if cache_key is None:
+            return _CACHE_MISS
+        return self.status_cache.get(cache_key, _CACHE_MISS)
+
+    def _put_cached(self, cache_key, rval):
+        if cache_key is not None:
+            self.status_cache.put(cache_key, rval)
+
+    def _update_status(self, status, pf_func, rval):
+        """
+        Store what `pf_func` returned when computing `status` and returns the value of `status`.
+        """
         if isinstance(rval, dict):
             if status not in rval:
                 raise TypeError(
@@ -173,17 +219,34 @@ class Profiler(ABC):
 
         return rval
 
-    def compute_network_status(self, print_mode=None, recompute=False, short_print=True, **kwargs):
+    def compute_network_status(self, print_mode=None, recompute=False, short_print=True, executor=None,
+                               **kwargs):
         """
         Calls all registered :class:`~ProfilerFunction` and populates its whole status dictionary.
 
+        If an `executor` is given, every :class:`~ProfilerFunction` with a missing :class:`StatusKey` is
+        submitted to it as its own task and the returned values are merged back in the status once they
+        all completed. With a `concurrent.futures.ProcessPoolExecutor`, the model and the data splits are
+        pickled to the workers (:class:`DataLoader` go through their `dump_native_info` /
+        `load_native_info` hooks). With a `concurrent.futures.ThreadPoolExecutor`, each task gets its own
+        copy of the :class:`DataLoader` (see :method:`DataLoader.task_copy`) so that their iteration states
+        and forward passes do not collide. The functions with a `copy_model` attribute decide for the model:
+        with `copy_model=True` they copy it themselves, with `copy_model=False` they instrument it in place
+        and run in this thread once the tasks completed. The other functions get their own copy of it.
+
+        NOTE: Functions running concurrently compete for the same cores, timing related `StatusKey` (ex.:
+        'execution_time') are better computed serially or in a process pool with enough cores.
+
         :param print_mode: A default printing mode of the logger, defaults to None (no logging)
         :type print_mode: str, optional
-        :param recompute: If all the :class:`StatusKey` need to be recomputed, defaults to False
+        :param recompute: If all the :class:`StatusKey` need to be recomputed, bypassing the status cache,
+            defaults to False
         :type recompute: bool, optional
         :param short_print: Display a short version of the profiled output or a long detailed version,
             defaults to True
         :type short_print: bool, optional
+        :param executor: Executor on which to schedule the profiler functions, defaults to None (serial)
+        :type executor: `concurrent.futures.Executor`, optional
 
         :return: A dictionary of updated key-value pairs of the metric status key and the metric value
         :rtype: dictionary
@@ -194,20 +257,77 @@ class Profiler(ABC):
         if recompute:
             self.reset_status()
 
-        for sk in self.status_keys():
-            if self.status_get(sk) is not None:
-                continue
-            self.compute_status(sk, recompute=recompute, **kwargs)
+        # the model does not change during this call, fingerprint it only once
+        if self.status_cache is not None:
+            self._model_fingerprint = self.model_fingerprint()
+        try:
+            if executor is None:
+                for sk in self.status_keys():
+                    if self.status_get(sk) is not None:
+                        continue
+                    self.compute_status(sk, recompute=recompute, **kwargs)
+            else:
+                self._compute_network_status_concurrently(executor, recompute, kwargs)
+        finally:
+            self._model_fingerprint = None
 
         if print_mode:
             self.display_status(print_mode=print_mode, short_print=short_print)
 
         return dict(self.status_items())
 
+    def _copy_model(self):
+        # the copy of the model given to a task of a thread pool, backends can override it
+        return deepcopy(self.model)
+
+    def _compute_network_status_concurrently(self, executor, recompute, kwargs):
+        # one task per profiler function, the first missing status key it is registered to is the one
+        # used to check its return value
+        pending = OrderedDict()
+        for sk in self.status_keys():
+            if self.status_get(sk) is not None:
+                continue
+            pf_func = self._profiling_functions_register[sk].function
+            if pf_func not in pending:
+                pending[pf_func] = sk
+
+        is_process_pool = isinstance(executor, ProcessPoolExecutor)
+        futures, in_place = [], []
+        for pf_func, sk in pending.items():
+            cache_key = self._get_cache_key(pf_func, kwargs)
+            rval = _CACHE_MISS if recompute else self._get_cached(cache_key)
+            if rval is not _CACHE_MISS:
+                self._update_status(sk, pf_func, rval)
+                continue
+            model, data_splits = self.model, self.data_splits
+            if not is_process_pool:
+                copy_model = getattr(pf_func, 'copy_model', None)
+                if copy_model is False:
+                    # instruments the shared model, it cannot run alongside the other tasks
+                    in_place.append((pf_func, sk, cache_key))
+                    continue
+                if copy_model is None:
+                    model = self._copy_model()
+                data_splits = {k: v.task_copy() if isinstance(v, DataLoader) else v
+                               for k, v in data_splits.items()}
+            futures.append((pf_func, sk, cache_key, executor.submit(_pipe_kwargs_to_call, pf_func, model,
+                                                                    data_splits, kwargs)))
+
+        for pf_func, sk, cache_key, future in futures:
+            rval = future.result()
+            self._put_cached(cache_key, rval)
+            self._update_status(sk, pf_func, rval)
+
+        for pf_func, sk, cache_key in in_place:
+            rval = pf_func.pipe_kwargs_to_call(self.model, self.data_splits, kwargs)
+            self._put_cached(cache_key, rval)
+            self._update_status(sk, pf_func, rval)
+
     def compare(self, other, print_mode='info', recompute=False, short_print=True, **kwargs):
         """
         Compare two different :class:`~Profiler`s. The two different profilers could belong to the same model
-        or different models. Compare *is* for stdout / logging comparison.
+        or different models. Compare *is* for stdout / logging comparison. To compare more than two profilers,
+        see :func:`deeplite.profiler.multi_profiler.compare_profilers`.
 
         :param other: Another profiler object
         :type other: :class:`~Profiler`
@@ -252,18 +372,10 @@ class Profiler(ABC):
         assert isinstance(print_mode, str) and hasattr(logger, print_mode.lower()), \
             "'print_mode' needs to be a logger level"
 
-        status_dict = self.status_to_dict(to_value=False)
-        layerwise_summary_1 = status_dict.pop('layerwise_summary', None)
-        status_dict = self.display_status_filter_func(status_dict)
-        status_dict['backend'] = self.backend
-        status_dict['name'] = self.name
+        status_dict, layerwise_summary_1 = self.display_status_dict()
 
         if other is not None:
-            other_status_dict = other.status_to_dict(to_value=False)
-            layerwise_summary_2 = other_status_dict.pop('layerwise_summary', None)
-            other_status_dict = self.display_status_filter_func(other_status_dict)
-            other_status_dict['backend'] = other.backend
-            other_status_dict['name'] = other.name
+            other_status_dict, layerwise_summary_2 = other.display_status_dict(self.display_status_filter_func)
             summary_str = make_two_models_summary_str(status_dict, other_status_dict, short_print=short_print)
         else:
             layerwise_summary_2 = None
@@ -276,6 +388,80 @@ class Profiler(ABC):
                 logger.debug(layerwise_summary_2.value)
         getattr(logger, print_mode.lower())(summary_str)
 
+    def display_status_dict(self, display_status_filter_func=None):
+        """
+        The status as it is displayed, filtered and ordered by `display_status_filter_func` with its 'backend'
+        and 'name', and the popped 'layerwise_summary' status.
+
+        :param display_status_filter_func: Overrides the profiler's own display filter function, defaults to None
+        :type display_status_filter_func: `callable`, optional
+
+        :return: The displayed status dictionary and the layerwise summary `StatusKey` (None if not registered)
+        :rtype: `tuple`
+        """
+        if display_status_filter_func is None:
+            display_status_filter_func = self.display_status_filter_func
+        status_dict = self.status_to_dict(to_value=False)
+        layerwise_summary = status_dict.pop('layerwise_summary', None)
+        status_dict = display_status_filter_func(status_dict)
+        status_dict['backend'] = self.backend
+        status_dict['name'] = self.name
+        return status_dict, layerwise_summary
+
+    def export_status(self, path, fmt='jsonl', layers_path=None, hot_layers_path=None):
+        """
+        Export the status in a machine readable format. The values of :class:`~LayerwiseTable` are exported
+        as one record per layer, streamed row by row instead of rendered as a table. Likewise, the values of
+        :class:`~HotLayersReport` are exported as one record per row, hottest first, with its rank and the
+        machine balance of the report.
+
+        With 'jsonl', the first line of `path` is the status record {'record': 'status', 'name', 'backend',
+        'status'} followed by one {'record': 'layer', 'status_key', ...} line per layer and one
+        {'record': 'hot_layer', 'status_key', 'rank', 'machine_balance', ...} line per hot layer. With
+        'parquet', the status is a one row table in `path`, the layers a table in `layers_path` and the hot
+        layers a table in `hot_layers_path`. It requires pyarrow.
+
+        :param path: File to write the status to
+        :type path: `str`
+        :param fmt: One of 'jsonl' or 'parquet', defaults to 'jsonl'
+        :type fmt: `str`, optional
+        :param layers_path: File to write the layers to with 'parquet', defaults to `path` with a '.layers'
+            suffix before its extension. Ignored with 'jsonl'.
+        :type layers_path: `str`, optional
+        :param hot_layers_path: File to write the hot layers to with 'parquet', defaults to `path` with a
+            '.hot_layers' suffix before its extension. Ignored with 'jsonl'.
+        :type hot_layers_path: `str`, optional
+
+        :raises ValueError: Unknown export format
+        :raises ImportError: pyarrow is not installed for a 'parquet' export
+        """
+        status = {}
+        layers = []
+        hot_layers = []
+        for k, v in self.status_items():
+            if isinstance(v, LayerwiseTable):
+                layers.append((k, v))
+            elif isinstance(v, HotLayersReport):
+                hot_layers.append((k, v))
+            else:
+                status[k] = _to_json_value(v)
+        header = {'name': self.name, 'backend': self.backend}
+
+        if fmt == 'jsonl':
+            with open(path, 'w') as f:
+                f.write(json.dumps(dict(record='status', status=status, **header)) + "\n")
+                for k, table in layers:
+                    for record in table.iter_records():
+                        record = {c: _to_json_value(v) for c, v in record.to_dict().items()}
+                        f.write(json.dumps(dict(record='layer', status_key=k, **record)) + "\n")
+                for k, report in hot_layers:
+                    for row in _hot_layers_rows(k, report):
+                        f.write(json.dumps(dict(record='hot_layer', **row)) + "\n")
+        elif fmt == 'parquet':
+            _export_status_parquet(path, layers_path, hot_layers_path, header, status, layers, hot_layers)
+        else:
+            raise ValueError("Unknown export format '{}' (valid := ('jsonl', 'parquet'))".format(fmt))
+
     def clone(self, model=None, data_splits=None, retain_status=False):
         # create a new instance instead of deepcopying stuff
         model = self.model if not model else model
@@ -285,6 +471,7 @@ class Profiler(ABC):
         if not retain_status and new.model is not self.model:
             new.reset_status()
         new.backend = self.backend
+        new.status_cache = self.status_cache
         return new
 
     # Below are methods to give dict-like access to the internal status storage.
@@ -326,6 +513,112 @@ class Profiler(ABC):
         return map_status
 
 
+def _pipe_kwargs_to_call(pf_func, model, data_splits, kwargs):
+    # module level so that it can be pickled to a process pool
+    return pf_func.pipe_kwargs_to_call(model, data_splits, kwargs)
+
+
+def _to_json_value(x):
+    if x is None or isinstance(x, (bool, int, float, str)):
+        return x
+    if isinstance(x, Enum):
+        return x.value
+    if isinstance(x, (list, tuple)):
+        return [_to_json_value(v) for v in x]
+    if isinstance(x, dict):
+        return {str(k): _to_json_value(v) for k, v in x.items()}
+    if hasattr(x, 'item') and getattr(x, 'ndim', None) == 0:
+        # numpy / framework scalars
+        return x.item()
+    return str(x)
+
+
+def _hot_layers_rows(status_key, report):
+    for rank, row in enumerate(report):
+        row = {c: _to_json_value(v) for c, v in row.items()}
+        yield dict(row, status_key=status_key, rank=rank, machine_balance=report.machine_balance)
+
+
+def _export_status_parquet(path, layers_path, hot_layers_path, header, status, layers, hot_layers,
+                           batch_rows=1024):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Exporting the status to parquet requires pyarrow (pip install pyarrow)")
+
+    # nested values do not have a fixed type across models, they are kept as json strings
+    row = dict(header)
+    for k, v in status.items():
+        row[k] = json.dumps(v) if isinstance(v, (list, dict)) else v
+    pq.write_table(pa.Table.from_pylist([row]), path)
+
+    if layers_path is None:
+        root, ext = os.path.splitext(path)
+        layers_path = root + '.layers' + (ext or '.parquet')
+    # the shapes are nested lists of variable depth, they are kept as json strings
+    types = {int: pa.int64(), float: pa.float64()}
+    schema = pa.schema([('name', pa.string()), ('backend', pa.string()), ('status_key', pa.string()),
+                        ('layer', pa.string())] +
+                       [(c, types.get(t, pa.string())) for c, t in LayerwiseTable.column_types().items()
+                        if c != 'name'])
+    with pq.ParquetWriter(layers_path, schema) as writer:
+        rows = []
+        for k, table in layers:
+            for record in table.iter_records():
+                record = record.to_dict()
+                record['layer'] = record.pop('name')
+                for c in record:
+                    if LayerwiseTable.column_types().get(c) is list and record[c] is not None:
+                        record[c] = json.dumps(_to_json_value(record[c]))
+                rows.append(dict(record, status_key=k, **header))
+                if len(rows) == batch_rows:
+                    writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                    rows = []
+        if rows:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+
+    if not hot_layers:
+        return
+    if hot_layers_path is None:
+        root, ext = os.path.splitext(path)
+        hot_layers_path = root + '.hot_layers' + (ext or '.parquet')
+    types = {int: pa.int64(), float: pa.float64(), str: pa.string()}
+    schema = pa.schema([('name', pa.string()), ('backend', pa.string()), ('status_key', pa.string()),
+                        ('rank', pa.int64()), ('machine_balance', pa.float64()), ('layer', pa.string())] +
+                       [(c, types[t]) for c, t in HotLayersReport.column_types().items() if c != 'name'])
+    rows = []
+    for k, report in hot_layers:
+        for row in _hot_layers_rows(k, report):
+            row['layer'] = row.pop('name')
+            rows.append(dict(row, **header))
+    pq.write_table(pa.Table.from_pylist(rows, schema=schema), hot_layers_path)
+
+
+def _stable_repr(x):
+    """
+    A repr that does not change from one process to the next for the usual keywords and configurations
+    of `ProfilerFunction`. Unknown objects fall back to their repr, which usually includes their address and
+    therefore never matches again (a cache miss rather than a wrong cache hit).
+    """
+    if x is None or isinstance(x, (bool, int, float, str, bytes)):
+        return repr(x)
+    if isinstance(x, Enum):
+        return str(x)
+    if isinstance(x, (tuple, list)):
+        return type(x).__name__ + '(' + ', '.join(_stable_repr(v) for v in x) + ')'
+    if isinstance(x, dict):
+        return '{' + ', '.join('{}: {}'.format(_stable_repr(k), _stable_repr(v))
+                               for k, v in sorted(x.items(), key=lambda kv: repr(kv[0]))) + '}'
+    qualname = getattr(x, '__qualname__', None)
+    if qualname is not None and '<' not in qualname:
+        # functions and classes
+        return '{}.{}'.format(getattr(x, '__module__', ''), qualname)
+    if isinstance(x, EvaluationFunction):
+        return '{}.{}'.format(type(x).__module__, type(x).__qualname__) + _stable_repr(vars(x))
+    return repr(x)
+
+
 class ProfilerFunction(ABC):
     """
     Abstract callable which computes any set of :class:`StatusKey` on given model and data.
@@ -361,6 +654,23 @@ class ProfilerFunction(ABC):
         bounded_args = self._call_sign.bind(model, data_splits, **kwargs)
         return self(**bounded_args.arguments)
 
+    def get_call_fingerprint(self, kwargs):
+        """
+        Returns a `str` identifying this function, its configuration and the keywords (defaults included)
+        it would be called with through :method:`~pipe_kwargs_to_call`. Used to key cached values.
+        """
+        call_sign = self._get_piping_signature()
+        kwargs = {k: v for k, v in kwargs.items() if k in call_sign.parameters.keys()}
+        bounded_args = call_sign.bind(None, None, **kwargs)
+        bounded_args.apply_defaults()
+        call_args = list(bounded_args.arguments.items())[2:]
+        config = {k: v for k, v in vars(self).items() if not k.startswith('_')}
+        return '{}.{}{}{}'.format(type(self).__module__, type(self).__qualname__, _stable_repr(config),
+                                  _stable_repr(call_args))
+
+    def _get_piping_signature(self):
+        return self._call_sign
+
     @abstractmethod
     def get_bounded_status_keys(self):
         """
@@ -401,6 +711,12 @@ class ExternalProfilerFunction(ProfilerFunction):
         bounded_args = self._func_sign.bind(model, data_splits, **kwargs)
         return self(**bounded_args.arguments)
 
+    def get_call_fingerprint(self, kwargs):
+        return super().get_call_fingerprint(kwargs) + _stable_repr(self._func)
+
+    def _get_piping_signature(self):
+        return self._func_sign
+
     def __call__(self, *args, **kwargs):
         return self._func(*args, **kwargs)
 
@@ -412,17 +728,24 @@ class ComputeEvalMetric(ExternalProfilerFunction):
 
     This makes the additional assumption that an evaluation function is defined only on one split (
     or one data loader)
+
+    When the evaluation function returns a `dict` of metrics (ex.: a `FusedEvaluation`), `key` is the one
+    profiled as :class:`EvalMetric` and the `secondary_keys` are profiled from the same call, each as a
+    :class:`SecondaryEvalMetric` with its key as status key.
     """
 
-    def __init__(self, func, key=None, default_split='test', unit_name='', comparative=Comparative.DIFF):
+    def __init__(self, func, key=None, default_split='test', unit_name='', comparative=Comparative.DIFF,
+                 secondary_keys=None):
         super().__init__(func)
         self.default_split = default_split
         self.key = key
         self.unit_name = unit_name
         self.comparative = comparative
+        self.secondary_keys = cast_tuple(secondary_keys)
 
     def get_bounded_status_keys(self):
-        return EvalMetric(unit_name=self.unit_name, comparative=self.comparative), InferenceTime()
+        secondary = tuple(SecondaryEvalMetric(k, comparative=self.comparative) for k in self.secondary_keys)
+        return (EvalMetric(unit_name=self.unit_name, comparative=self.comparative), InferenceTime()) + secondary
 
     def pipe_kwargs_to_call(self, model, data_splits, kwargs):
         kwargs = kwargs.copy()
@@ -430,12 +753,18 @@ class ComputeEvalMetric(ExternalProfilerFunction):
         split = split if split else self.default_split
         return super().pipe_kwargs_to_call(model, data_splits[split], kwargs)
 
-    # TODO support multiple secondary evaluation metrics
+    def get_call_fingerprint(self, kwargs):
+        kwargs = kwargs.copy()
+        split = kwargs.pop('split', None)
+        split = split if split else self.default_split
+        return super().get_call_fingerprint(kwargs) + '[split={}]'.format(split)
+
     def __call__(self, *args, **kwargs):
         start = time.time()
         rval = self._func(*args, **kwargs)
         inf_time = abs(time.time() - start)
 
+        secondary = {k: rval[k] for k in self.secondary_keys}
         key = 'akey' if self.key is None else self.key
         rval = EvaluationFunction.filter_call_rval(rval, return_dict=False, return_keys=key)
-        return {'eval_metric': rval, 'inference_time': inf_time}
+        return {'eval_metric': rval, 'inference_time': inf_time, **secondary}
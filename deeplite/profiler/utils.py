@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-import functools, time
+import functools, os, threading, time
 from collections.abc import Iterable
 from enum import Enum
 
@@ -45,6 +45,75 @@ class AverageAggregator(Aggregator):
         return v
 
 
+def _to_python(x):
+    # framework tensors, numpy arrays and scalars to python numbers (or lists of), a single host sync
+    if hasattr(x, 'numpy') and not hasattr(x, 'tolist'):
+        x = x.numpy()
+    return x.tolist() if hasattr(x, 'tolist') else x
+
+
+class SumAggregator(Aggregator):
+    """
+    Streamed sum of tensors. The values are summed with the operators of their framework and stay on their
+    device, they are only converted to python numbers once by :method:`~get`.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, value):
+        self.value = value + self.value
+
+    def get(self):
+        v = _to_python(self.value)
+        self.__init__()
+        return v
+
+    def get_state(self):
+        """ The raw sum, not converted, and reset the state. States are merged with :method:`~merge_state` """
+        state = self.value
+        self.__init__()
+        return state
+
+    def merge_state(self, state):
+        self.update(state)
+
+
+class SampleMeanAggregator(Aggregator):
+    """
+    Streamed mean over samples. Each update is the sum of a metric over a batch (a tensor, or a vector of
+    metrics) and its number of samples, the mean is exact whatever the sizes of the batches. Like
+    :class:`~SumAggregator`, the sums stay on their device until :method:`~get`.
+    """
+    __slots__ = ('value', 'count')
+
+    def __init__(self):
+        self.value = 0
+        self.count = 0
+
+    def update(self, value, count=1):
+        self.value = value + self.value
+        self.count += count
+
+    def get(self):
+        if self.count == 0:
+            return 0
+        v = _to_python(self.value / self.count)
+        self.__init__()
+        return v
+
+    def get_state(self):
+        """ The raw sum and count, not converted, and reset the state. States are merged with
+        :method:`~merge_state`, the mean of merged states is the mean over all their samples """
+        state = (self.value, self.count)
+        self.__init__()
+        return state
+
+    def merge_state(self, state):
+        self.update(*state)
+
+
 def _cast_iterable(x, iter_type):
     if isinstance(x, str):
         return iter_type([x])
@@ -72,4 +141,70 @@ def timer(func):
         run_time = end_time - start_time   
         #print(f"Finished {func.__name__!r} in {run_time:.4f} secs")
         return run_time
-    return wrapper_timer
\ No newline at end of file
+    return wrapper_timer
+
+
+def _perf_counter_ns():
+    return int(time.perf_counter() * 1e9)
+
+
+# time.perf_counter_ns is new in python 3.7, the fallback loses precision after ~100 days of uptime
+perf_counter_ns = getattr(time, 'perf_counter_ns', _perf_counter_ns)
+
+
+def current_rss():
+    """
+    Returns the resident set size of the current process in bytes, None if it cannot be read on this platform.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class PeakRSSSampler:
+    """
+    Context manager sampling the resident set size of the current process on a background thread. The highest
+    sampled value is held in `peak` and `baseline` is the value when entering. Both are None if the resident
+    set size cannot be read on this platform.
+    """
+
+    def __init__(self, interval=1e-3):
+        self.interval = interval
+        self.baseline = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.baseline = current_rss()
+        self.peak = self.baseline
+        if self.baseline is not None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self._sample()
+        return False
+
+    @property
+    def peak_increase(self):
+        if self.baseline is None:
+            return None
+        return self.peak - self.baseline
@@ -14,6 +14,17 @@ from deeplite.profiler.data_loader import DataLoader, TensorSampler, ForwardPass
 
 
 class TFDataLoader(DataLoader):
+    """
+    :class:`DataLoader` of a `tf.data.Dataset` (or any iterable of batches). Its length and batch size are
+    computed once and cached. The length is the cardinality of the dataset when tf.data knows it, otherwise
+    the batches are counted once in a streaming pass, without holding them in memory.
+    """
+
+    def __init__(self, dl, fp=None):
+        self._len = None
+        self._batch_size = None
+        super().__init__(dl, fp)
+
     # TODO expose something for the end-user to allow stateful dataset?
     def dump_native_info(self):
         return
@@ -22,18 +33,40 @@ class TFDataLoader(DataLoader):
         return self
 
     def __len__(self):
-        # This won't work if the dataset is of IterableDataset type
-        return len(list(self.native_dl))
+        if self._len is None:
+            self._len = self._count_batches()
+        return self._len
+
+    def _count_batches(self):
+        if not isinstance(self.native_dl, tf.data.Dataset):
+            if hasattr(self.native_dl, '__len__'):
+                return len(self.native_dl)
+            return sum(1 for _ in self.native_dl)
+
+        cardinality = int(tf.data.experimental.cardinality(self.native_dl))
+        if cardinality == tf.data.experimental.INFINITE_CARDINALITY:
+            raise TypeError("An infinite dataset has no length")
+        if cardinality == tf.data.experimental.UNKNOWN_CARDINALITY:
+            # streaming count inside the tf.data runtime, one batch at a time
+            cardinality = int(self.native_dl.reduce(np.int64(0), lambda count, _: count + 1))
+        return cardinality
 
     def _create_iter(self):
         return iter(self.native_dl)
 
     @property
     def batch_size(self):
-        # self.native_dl.batch_size
-        for cb in self.native_dl.take(1):
-            batch_size = cb[0].shape[0]
-        return batch_size
+        if self._batch_size is None:
+            dataset = self.native_dl
+            if isinstance(dataset, tf.data.Dataset):
+                dataset = dataset.take(1)
+            batch = next(iter(dataset))
+            if isinstance(batch, dict):
+                batch = list(batch.values())
+            if isinstance(batch, (tuple, list)):
+                batch = batch[0]
+            self._batch_size = int(batch.shape[0])
+        return self._batch_size
 
 
 class TFForwardPass(ForwardPass):
@@ -64,26 +97,41 @@ class TFForwardPass(ForwardPass):
 
 
 class TFTensorSampler(TensorSampler):
-    def _standardize_tensor(self, x):
+    """
+    Keeps the inputs as `tf.Tensor` from the data loader to the model call, a numpy array is converted once
+    when standardized. `tf.Tensor` are immutable, the random inputs of a batch size are created once and
+    always reused.
+    """
 
-        if tf.is_tensor(x):
-            x = x.numpy()
-        elif not isinstance(x, np.ndarray):
+    def _standardize_tensor(self, x):
+        if isinstance(x, np.ndarray):
+            x = tf.convert_to_tensor(x)
+        elif not tf.is_tensor(x):
             raise ValueError()
         return x
 
+    def create_random_tensors(self, batch_size, reuse=True):
+        # reusing immutable tensors is always safe
+        return super().create_random_tensors(batch_size, reuse=True)
+
     def _create_random_tensor(self, x_info, batch_size):
-        if x_info.dtype in (np.complex64, np.complex128,):
+        dtype = tf.as_dtype(x_info.dtype)
+        if dtype.is_complex:
             raise RuntimeError("Complex number not supported")
-        return np.float32(np.random.rand(batch_size, *(x_info.shp)))
+        shape = (batch_size, *x_info.shp)
+        # generated in the recorded dtype, random floats in [0, 1) cast to other dtypes are zeros or True
+        if dtype.is_floating:
+            return tf.random.uniform(shape, dtype=dtype)
+        if dtype == tf.bool:
+            return tf.ones(shape, dtype=dtype)
+        return tf.zeros(shape, dtype=dtype)
 
     def _get_info(self, x):
         # dont forget to strip that batch axis!
-        if len(x.shape) == 4:
-            return x.shape[1:], x.dtype
-        return x.shape, x.dtype
+        return tuple(x.shape[1:]), x.dtype
 
     def to_device(self, tensors_tuple, device, standardize=True):
+        # the tensors are placed by the device scope of the model call, they are not copied here
         f = lambda x: x
         if standardize:
             tensors_tuple = self.standardize_tensors(tensors_tuple)
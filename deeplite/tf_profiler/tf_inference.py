@@ -9,7 +9,7 @@ except:
 import numpy as np
 
 from deeplite.profiler.evaluate import EvaluationFunction
-from deeplite.profiler.utils import Device, cast_tuple
+from deeplite.profiler.utils import Device, cast_tuple, SampleMeanAggregator
 
 
 def set_device(device):
@@ -25,7 +25,7 @@ class _GetMissclass(EvaluationFunction):
 
     def __call__(self, model, data_loader, device=Device.CPU, transform=None):
         device_name = set_device(device)
-        test_accuracy = tf.keras.metrics.CategoricalAccuracy()
+        wrong = SampleMeanAggregator()
 
         with tf.device(device_name):
             for x, y in data_loader:
@@ -36,9 +36,10 @@ class _GetMissclass(EvaluationFunction):
 
                 logits = model(x, training=False)
                 if type(logits) == tuple: logits = logits[0]
-                test_accuracy(logits, y)
+                mismatch = tf.math.not_equal(tf.math.argmax(logits, axis=-1), tf.math.argmax(y, axis=-1))
+                wrong.update(100. * tf.math.reduce_sum(tf.cast(mismatch, tf.float64)), int(mismatch.shape[0]))
 
-            return 100 - test_accuracy.result().numpy() * 100
+            return wrong.get()
 get_missclass = _GetMissclass()
 
 
@@ -54,9 +55,8 @@ class _GetTopk(EvaluationFunction):
         topk = cast_tuple(topk)
 
         def _accuracy(output, target):
-            """Computes the precision@k for the specified values of k"""
+            """Computes the number of correct predictions at k for the specified values of k"""
             maxk = max(topk)
-            batch_size = target.shape[0]
 
             _, pred = tf.math.top_k(output, maxk, True)
             pred = tf.transpose(pred)
@@ -65,17 +65,10 @@ class _GetTopk(EvaluationFunction):
             target = tf.reshape(target, [1, -1])
             target = tf.cast(target, tf.float32)
 
-            correct = tf.math.equal(pred, target)
-            res = []
+            correct = tf.cast(tf.math.equal(pred, target), tf.float64)
+            return tf.stack([tf.math.reduce_sum(correct[:k]) for k in topk])
 
-            for k in topk:
-                correct_k = tf.math.reduce_sum(tf.cast(tf.reshape(correct[:k], [-1]), tf.float32), axis=0,
-                                               keepdims=True)
-                res.append(list(correct_k))
-            return res
-
-        correct_k = [0.] * len(topk)
-        ntotal = 0
+        correct_k = SampleMeanAggregator()
         device_name = set_device(device)
 
         with tf.device(device_name):
@@ -87,11 +80,10 @@ class _GetTopk(EvaluationFunction):
                     if isinstance(y, tf.Tensor): y = y.numpy()
                     x, y = transform(x, y)
 
-                if isinstance(x, tf.Tensor): x = x.numpy()
                 outputs = model(x, training=False)
-                correct_k = np.add(correct_k, _accuracy(outputs, y))
-                ntotal += y.shape[0]
+                correct_k.update(100. * _accuracy(outputs, y), int(y.shape[0]))
 
-        rval = (100. * (correct_k / ntotal)).tolist()
+        rval = correct_k.get()
+        rval = [0.] * len(topk) if rval == 0 else rval
         return {'top-' + str(k): res for k, res in zip(topk, rval)}
 get_topk = _GetTopk()
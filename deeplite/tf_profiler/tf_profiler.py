@@ -1,11 +1,17 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import hashlib
+import json
+import threading
 import time
 
 import numpy as np
 import tensorflow as tf
 
-from deeplite.profiler import Profiler, ProfilerFunction
+from deeplite.profiler import Profiler, ProfilerFunction, LayerwiseTable
 from deeplite.profiler.metrics import *
-from deeplite.profiler.utils import Device
+from deeplite.profiler.benchmark import BENCHMARK_STATUS_KEYS, run_benchmark, benchmark_status_values
+from deeplite.profiler.utils import AverageAggregator, Device, perf_counter_ns
 from deeplite.tf_profiler.tf_data_loader import TFDataLoader, TFForwardPass
 
 
@@ -16,6 +22,77 @@ except:
     pass
 
 
+def model_weights_fingerprint(model):
+    """
+    Returns a `str` hash of the type of `model` and the names, dtypes, shapes and values of its weights.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(type(model).__qualname__.encode('utf-8'))
+    weights = model.weights
+    for w, value in zip(weights, tf.keras.backend.batch_get_value(weights)):
+        value = np.ascontiguousarray(value)
+        hasher.update("{}{}{}".format(w.name, value.dtype, value.shape).encode('utf-8'))
+        hasher.update(value)
+    return hasher.hexdigest()
+
+
+def _config_str(layer):
+    try:
+        return json.dumps(layer.get_config(), sort_keys=True, default=repr)
+    except (AttributeError, NotImplementedError):
+        return ''
+
+
+def model_architecture_fingerprint(model):
+    """
+    Returns a `str` hash of the architecture of `model`: its type, the types and configurations of the model
+    and of all its layers, and the names, dtypes and shapes of its weights. Unlike
+    :func:`~model_weights_fingerprint`, the values of the weights are not read.
+    """
+    hasher = hashlib.sha256()
+    for layer in [model] + list(getattr(model, 'submodules', ())):
+        hasher.update("{}{}".format(type(layer).__qualname__, _config_str(layer)).encode('utf-8'))
+    for w in model.weights:
+        hasher.update("{}{}{}".format(w.name, w.dtype.name, w.shape.as_list()).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def _is_tf2():
+    return hasattr(tf, 'function') and tf.executing_eagerly()
+
+
+def trace_model(model, input_signature):
+    """
+    Traces the inference forward pass of `model` into a concrete `tf.function` for `input_signature`, a
+    tuple of `tf.TensorSpec` of the model inputs.
+    """
+    forward = tf.function(lambda *x: model(*x, training=False))
+    return forward.get_concrete_function(*input_signature)
+
+
+def _input_signature(inputs):
+    return tuple(tf.TensorSpec(shape=x.shape, dtype=tf.as_dtype(x.dtype)) for x in inputs)
+
+
+def count_graph_flops(graph):
+    """
+    FLOPs of every operation of `graph` as {op name: flops}, from the statistics the TF profiler registers
+    for each op type. Operations without FLOPs are left out.
+    """
+    builder = tf.compat.v1.profiler.ProfileOptionBuilder
+    opts = builder(builder.float_operation()).with_empty_output().build()
+    root = tf.compat.v1.profiler.profile(graph=graph, run_meta=tf.compat.v1.RunMetadata(), cmd='scope',
+                                         options=opts)
+    flops = OrderedDict()
+    nodes = list(root.children) if root is not None else []
+    while nodes:
+        node = nodes.pop(0)
+        if node.float_ops:
+            flops[node.name] = node.float_ops
+        nodes.extend(node.children)
+    return flops
+
+
 def get_temp_model(model):
     weights = model.get_weights()
     new_model = tf.keras.models.clone_model(model)
@@ -24,11 +101,78 @@ def get_temp_model(model):
     return new_model
 
 
+_session = threading.local()
+
+
+@contextmanager
+def profiling_session():
+    """
+    Within this context, the summary of the weights of each model is computed once for all the TF
+    `ProfilerFunction` of the current thread (see :func:`~weights_summary`). Nested sessions are merged with
+    the outermost one.
+    """
+    if getattr(_session, 'weights', None) is not None:
+        yield
+        return
+    _session.weights = {}
+    try:
+        yield
+    finally:
+        _session.weights = None
+
+
+def weights_summary(model):
+    """
+    Number of parameters and size in bytes of all the weights of `model`, trainable and non-trainable, each
+    counted with the size of its own dtype. Within a :func:`~profiling_session`, it is computed once per model.
+
+    :return: The number of parameters and their size in bytes
+    :rtype: `tuple` of `int`
+    """
+    cache = getattr(_session, 'weights', None)
+    if cache is not None and id(model) in cache:
+        return cache[id(model)][1]
+
+    weights = model.weights
+    counts = np.array([w.shape.num_elements() for w in weights], dtype=np.int64)
+    itemsizes = np.array([w.dtype.size for w in weights], dtype=np.int64)
+    rval = int(counts.sum()), int(counts.dot(itemsizes))
+    if cache is not None:
+        cache[id(model)] = (model, rval)
+    return rval
+
+
+def _tensor_bytes(x):
+    return int(np.prod(x.shape)) * tf.as_dtype(x.dtype).size
+
+
+def _activations_bytes(model, inputs, batch_size):
+    """
+    Size in bytes of the outputs of all the layers of `model` for inputs of `batch_size`, with the dtypes of
+    the layers outputs. A model which is not a graph of layers (ex.: subclassed) only has the outputs of its
+    traced forward pass counted.
+    """
+    try:
+        # the inputs are counted apart
+        outputs = [layer.output for layer in model.layers if not isinstance(layer, tf.keras.layers.InputLayer)]
+    except (AttributeError, ValueError):
+        specs = tf.nest.flatten(trace_model(model, _input_signature(inputs)).structured_outputs)
+        return sum(_tensor_bytes(spec) for spec in specs)
+
+    size = 0
+    for output in tf.nest.flatten(outputs):
+        size += (output.shape[1:].num_elements() or 0) * batch_size * output.dtype.size
+    return size
+
+
 class TFProfiler(Profiler):
     def __init__(self, model, data_splits, **kwargs):
         super().__init__(model, data_splits, **kwargs)
         self.backend = 'TFBackend'
 
+    def _copy_model(self):
+        return get_temp_model(self.model)
+
     @classmethod
     def dl_cls(cls):
         return TFDataLoader
@@ -37,21 +181,87 @@ class TFProfiler(Profiler):
     def fp_cls(cls):
         return TFForwardPass
 
+    def model_fingerprint(self):
+        return model_weights_fingerprint(self.model)
+
+    def compute_network_status(self, print_mode=None, recompute=False, short_print=True, executor=None,
+                               **kwargs):
+        # the functions computed in this thread share the summary of the weights
+        with profiling_session():
+            return super().compute_network_status(print_mode=print_mode, recompute=recompute,
+                                                  short_print=short_print, executor=executor, **kwargs)
+
 
 class ComputeFlops(ProfilerFunction):
+    """
+    Counts the FLOPs of the inference forward pass. With TF2, the model is traced once into a concrete
+    `tf.function` graph for the signature of its inputs at `batch_size`, and the FLOPs of every op of that
+    graph are counted. The FLOPs do not depend on the values of the weights, the counts are cached by (model
+    architecture fingerprint, input signature), up to `cache_size` entries. Older TF versions go through the
+    session-based TF1 profiler.
+
+    :param cache_size: Maximum number of cached counts, defaults to 32
+    :type cache_size: `int`, optional
+    """
+
+    def __init__(self, cache_size=32):
+        super().__init__()
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
     def get_bounded_status_keys(self):
         return Flops()
 
     def __call__(self, model, data_splits, batch_size=1, device=Device.CPU, include_weights=True):
-        temp_model = get_temp_model(model)
         dataloader = data_splits['train']
 
         with tf.device('gpu' if device == Device.GPU else 'cpu'):
-            return self._compute_flops(temp_model, dataloader, batch_size=batch_size, device=device,
+            return self._compute_flops(model, dataloader, batch_size=batch_size, device=device,
                                        include_weights=include_weights)
 
     # HAS TO RETURN A TUPLE IN THE SAME ORDER OF STATUSKEYS
     def _compute_flops(self, model, dataloader, batch_size=1, device=Device.CPU, include_weights=True):
+        if not _is_tf2():
+            return self._compute_flops_legacy(model, dataloader)
+        flops = sum(self._count_op_flops(model, dataloader, batch_size).values())
+        return flops / 2e9  # Giga Flops - Counting only the flops of forward pass
+
+    def _count_op_flops(self, model, dataloader, batch_size):
+        inputs = dataloader.forward_pass.create_random_model_inputs(batch_size)
+        input_signature = _input_signature(inputs)
+        key = (model_architecture_fingerprint(model),
+               tuple((tuple(spec.shape.as_list()), spec.dtype.name) for spec in input_signature))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        flops = count_graph_flops(trace_model(model, input_signature).graph)
+        self._cache[key] = flops
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return flops
+
+    def layerwise_flops(self, model, dataloader, batch_size=1):
+        """
+        FLOPs of each layer of `model` for inputs of `batch_size`, from the cached per-op counts. An op is
+        attributed to the first layer of `model.layers` found in its name scope.
+
+        :return: A :class:`LayerwiseTable` with the 'name', 'type' and 'macs' (FLOPs / 2) of every layer, in
+            the order of `model.layers`
+        :rtype: :class:`LayerwiseTable`
+        """
+        layer_names = {layer.name for layer in model.layers}
+        layer_flops = dict.fromkeys(layer_names, 0)
+        for op_name, flops in self._count_op_flops(model, dataloader, batch_size).items():
+            for scope in op_name.split('/'):
+                if scope in layer_names:
+                    layer_flops[scope] += flops
+                    break
+        return LayerwiseTable(({'name': layer.name, 'type': type(layer).__name__,
+                                'macs': layer_flops[layer.name] // 2} for layer in model.layers),
+                              model_name=model.name)
+
+    def _compute_flops_legacy(self, model, dataloader):
         graph = tf.Graph()
         # gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=0.333)
         session = tf.Session(graph=graph)  # , config=tf.ConfigProto(gpu_options=gpu_options))
@@ -90,11 +300,10 @@ class ComputeSize(ProfilerFunction):
 
     def __call__(self, model, data_splits, batch_size=1, device=Device.CPU, include_weights=True):
         sk_cls = self._get_bounded_status_keys_cls()
-        temp_model = get_temp_model(model)
         dataloader = data_splits['train']
 
         with tf.device('gpu' if device == Device.GPU else 'cpu'):
-            rval = self._compute_size(temp_model, dataloader, batch_size=batch_size, device=device,
+            rval = self._compute_size(model, dataloader, batch_size=batch_size, device=device,
                                       include_weights=include_weights)
 
         assert len(sk_cls) == len(rval)
@@ -102,29 +311,11 @@ class ComputeSize(ProfilerFunction):
 
     # HAS TO RETURN A TUPLE IN THE SAME ORDER OF STATUSKEYS
     def _compute_size(self, model, dataloader, batch_size=1, device=Device.CPU, include_weights=True):
-        model_vars = model.trainable_variables
-        _, model_size = tf.contrib.slim.model_analyzer.analyze_vars(model_vars, print_info=False)
-
-        activation_size = 0
-        for layer in model.layers:
-            output_shape = layer.output_shape
-            if isinstance(output_shape, list):
-                for osp in output_shape:
-                    osp = [x for x in osp if x is not None]
-                    activation_size += np.product(osp) * batch_size * 4  # 4 bytes
-            if isinstance(output_shape, tuple):
-                output_shape = [x for x in output_shape if x is not None]
-                activation_size += np.product(output_shape) * batch_size * 4  # 4 bytes
-
-        total_input_size = 0
-        input_shape = model.layers[0].input_shape
-        if isinstance(input_shape, list):
-            for isp in input_shape:
-                isp = [x for x in isp if x is not None]
-                total_input_size += np.product(isp) * batch_size * 4  # 4 bytes
-        if isinstance(input_shape, tuple):
-            input_shape = [x for x in input_shape if x is not None]
-            total_input_size += np.product(input_shape) * batch_size * 4  # 4 bytes
+        _, model_size = weights_summary(model)
+
+        inputs = dataloader.forward_pass.create_random_model_inputs(batch_size)
+        total_input_size = sum(_tensor_bytes(x) for x in inputs)
+        activation_size = _activations_bytes(model, inputs, batch_size)
 
         memory_footprint = int(activation_size + total_input_size)
         if include_weights:
@@ -140,17 +331,15 @@ class ComputeParams(ProfilerFunction):
         return TotalParams()
 
     def __call__(self, model, data_splits, batch_size=1, device=Device.CPU, include_weights=True):
-        temp_model = get_temp_model(model)
         dataloader = data_splits['train']
 
         with tf.device('gpu' if device == Device.GPU else 'cpu'):
-            return self._compute_params(temp_model, dataloader, batch_size=batch_size, device=device,
+            return self._compute_params(model, dataloader, batch_size=batch_size, device=device,
                                         include_weights=include_weights)
 
     # HAS TO RETURN A TUPLE IN THE SAME ORDER OF STATUSKEYS
     def _compute_params(self, model, dataloader, batch_size=1, device=Device.CPU, include_weights=True):
-        model_vars = model.trainable_variables
-        num_params, _ = tf.contrib.slim.model_analyzer.analyze_vars(model_vars, print_info=False)
+        num_params, _ = weights_summary(model)
 
         params = num_params / 1e6  # Million Flops
         return params
@@ -161,11 +350,10 @@ class ComputeLayerwiseSummary(ProfilerFunction):
         return LayerwiseSummary()
 
     def __call__(self, model, data_splits, batch_size=1, device=Device.CPU, include_weights=True):
-        temp_model = get_temp_model(model)
         dataloader = data_splits['train']
 
         with tf.device('gpu' if device == Device.GPU else 'cpu'):
-            return self._compute_layerwise_summary(temp_model, dataloader, batch_size=batch_size,
+            return self._compute_layerwise_summary(model, dataloader, batch_size=batch_size,
                                                    device=device,
                                                    include_weights=include_weights)
 
@@ -181,45 +369,66 @@ class ComputeLayerwiseSummary(ProfilerFunction):
 
 
 class ComputeExecutionTime(ProfilerFunction):
+    """
+    Time the forward pass of the model on random inputs, in ms per sample. With TF2, the model is traced into
+    a `tf.function` for the signature of the inputs and the concrete graph is called directly, the time of a
+    step is measured with `time.perf_counter_ns` up to the outputs being available on the host. By default,
+    it averages `steps` timed steps after `dry_runs` steps. In `benchmark` mode, the warmup runs until the
+    timings stabilize and the timed steps continue until the confidence interval of the mean is within
+    `relative_precision` of the mean (or `max_steps` steps, or `max_time` seconds), and the median, 90th and
+    99th percentiles, standard deviation, minimum and number of outliers are reported as well.
+    """
+
+    def __init__(self, benchmark=False, relative_precision=0.02, max_steps=1000, max_time=60., steps=10,
+                 dry_runs=5):
+        super().__init__()
+        self.benchmark = benchmark
+        self.relative_precision = relative_precision
+        self.max_steps = max_steps
+        self.max_time = max_time
+        self.steps = steps
+        self.dry_runs = dry_runs
+
     def get_bounded_status_keys(self):
+        if self.benchmark:
+            return tuple(sk_cls() for sk_cls, _ in BENCHMARK_STATUS_KEYS)
         return ExecutionTime()
 
     def __call__(self, model, data_splits, split='train', batch_size=1, device=Device.CPU):
         dataloader = data_splits[split]
-        temp_model = get_temp_model(model)
         device = 'gpu' if device == Device.GPU else 'cpu'
         with tf.device(device):
-            return self._compute_exectime(temp_model, dataloader, batch_size=batch_size)
+            return self._compute_exectime(model, dataloader, batch_size=batch_size)
 
     def _compute_exectime(self, model, dataloader, batch_size=1):
-        tnum = dataloader.forward_pass.create_random_model_inputs(batch_size)
-
-        # START BENCHMARKING
-        steps = 10
-        fp_time = 0.
+        inputs = tuple(tf.convert_to_tensor(x) for x in dataloader.forward_pass.create_random_model_inputs(
+            batch_size))
+        if _is_tf2():
+            forward = trace_model(model, _input_signature(inputs))
+        else:
+            def forward(*x):
+                return model(*x, training=False)
+
+        def step():
+            start = perf_counter_ns()
+            outputs = forward(*inputs)
+            # the ops run asynchronously on GPU, fetching the outputs waits for them
+            for output in tf.nest.flatten(outputs):
+                output.numpy()
+            return (perf_counter_ns() - start) / 1e9
+
+        # seconds per batch to ms per sample
+        scale = 1000. / batch_size
+        if self.benchmark:
+            stats = run_benchmark(step, max_steps=self.max_steps, max_time=self.max_time,
+                                  relative_precision=self.relative_precision)
+            return benchmark_status_values(stats, scale=scale)
 
         # DRY RUNS
-        for i in range(steps):
-            _ = model(tnum, training=False)
-
-        class timecallback(tf.keras.callbacks.Callback):
-            def __init__(self):
-                self.batch_times = 0
-                self.step_time_start_batch = 0
-
-            def on_predict_batch_begin(self, batch, logs=None):
-                self.step_time_start_batch = time.perf_counter()
-
-            def on_predict_batch_end(self, batch, logs=None):
-                self.batch_times = time.perf_counter() - self.step_time_start_batch
-
-        tt = time.perf_counter()
-        ctlTime = time.perf_counter() - tt
-        tcb = timecallback()
-        for i in range(steps):
-            _ = model.predict(tnum, batch_size=batch_size, callbacks=[tcb])
-            if i > 0:
-                fp_time += (tcb.batch_times - ctlTime)
-        fp_time = fp_time / (steps - 1) / batch_size
-        execution_time = fp_time * 1000
-        return execution_time
+        for _ in range(self.dry_runs):
+            step()
+
+        aggregator = AverageAggregator()
+        for _ in range(self.steps):
+            aggregator.update(step())
+        return aggregator.get() * scale
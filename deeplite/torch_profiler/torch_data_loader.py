@@ -1,9 +1,31 @@
+from functools import partial, lru_cache
+
 from numpy import ndarray
 import torch
 from deeplite.profiler.utils import Device
 from deeplite.profiler.data_loader import DataLoader, TensorSampler, ForwardPass
 
 
+@lru_cache(maxsize=None)
+def meta_device_supported():
+    """
+    Returns if this release of torch can propagate shapes through a convolution on the meta device (torch 1.9
+    added the meta tensors but their kernels came in the following releases).
+    """
+    try:
+        x = torch.empty(1, 1, 2, 2, device='meta')
+        y = torch.nn.functional.conv2d(x, torch.empty(1, 1, 1, 1, device='meta'))
+        return y.is_meta and y.shape == x.shape
+    except (RuntimeError, NotImplementedError, TypeError, AttributeError):
+        return False
+
+
+def check_meta_device_supported():
+    if not meta_device_supported():
+        raise RuntimeError("Tensors on the meta device require a more recent torch release than {}".format(
+            torch.__version__))
+
+
 class TorchDataLoader(DataLoader):
     # TODO expose something for the end-user to allow stateful dataset?
     def dump_native_info(self):
@@ -23,6 +45,40 @@ class TorchDataLoader(DataLoader):
     def batch_size(self):
         return self.native_dl.batch_size
 
+    def prefetch(self, num_batches=2, device=Device.CPU, pin_memory=False, convert=None):
+        """
+        Returns a :class:`PrefetchDataLoader` which also converts the numpy arrays of the batches to torch
+        tensors and moves them to `device` ahead of time. With `pin_memory`, the tensors are copied to
+        page-locked memory first and the transfer to the GPU is asynchronous.
+
+        :param convert: Called on every batch after the conversion, defaults to None
+        :type convert: `callable`, optional
+        """
+        return super().prefetch(num_batches=num_batches, convert=partial(_prepare_batch, device=device,
+                                                                         pin_memory=pin_memory, convert=convert))
+
+
+def _prepare_batch(batch, device, pin_memory, convert=None):
+    # module level so that a prefetching DataLoader can be pickled
+    batch = _to_device_batch(batch, device, pin_memory)
+    return batch if convert is None else convert(batch)
+
+
+def _to_device_batch(batch, device, pin_memory):
+    if isinstance(batch, ndarray):
+        batch = torch.from_numpy(batch)
+    if isinstance(batch, torch.Tensor):
+        if pin_memory and not batch.is_cuda:
+            batch = batch.pin_memory()
+        if device == Device.GPU:
+            batch = batch.cuda(non_blocking=pin_memory)
+        return batch
+    if isinstance(batch, (list, tuple)):
+        return type(batch)(_to_device_batch(x, device, pin_memory) for x in batch)
+    if isinstance(batch, dict):
+        return {k: _to_device_batch(x, device, pin_memory) for k, x in batch.items()}
+    return batch
+
 
 class TorchForwardPass(ForwardPass):
     @property
@@ -56,7 +112,24 @@ class TorchTensorSampler(TensorSampler):
     def _create_random_tensor(self, x_info, batch_size):
         if x_info.dtype in (torch.complex64, torch.complex128, torch.complex32,):
             raise RuntimeError("Complex number not supported")
-        return torch.rand(batch_size, *x_info.shp, dtype=torch.float).cpu().type(x_info.dtype)
+        shape = (batch_size, *x_info.shp)
+        # a single allocation in the right dtype, cast random floats in [0, 1) are zeros or True
+        if x_info.dtype in (torch.float16, torch.bfloat16):
+            # older releases have no CPU kernel to sample half precision floats
+            return torch.rand(shape).to(x_info.dtype)
+        if x_info.dtype.is_floating_point:
+            return torch.rand(shape, dtype=x_info.dtype)
+        if x_info.dtype == torch.bool:
+            return torch.ones(shape, dtype=x_info.dtype)
+        return torch.zeros(shape, dtype=x_info.dtype)
+
+    def create_meta_tensors(self, batch_size):
+        """
+        Same structure as :meth:`create_random_tensors` but with tensors on the meta device, without any data.
+        """
+        check_meta_device_supported()
+        f = lambda x: torch.empty(batch_size, *x.shp, dtype=x.dtype, device='meta')
+        return self._loop_over_tensors_tuple(self.tensors_info, f)
 
     def _get_info(self, x):
         # dont forget to strip that batch axis!
@@ -1,8 +1,18 @@
 from abc import abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from inspect import signature
+import multiprocessing
+import os
+import sys
 
 import torch
-from deeplite.profiler.evaluate import EvaluationFunction
-from deeplite.profiler.utils import Device, cast_tuple
+from torch.utils.data import DataLoader, Subset, SequentialSampler, RandomSampler
+from deeplite.profiler.evaluate import EvaluationFunction, MetricReducer
+from deeplite.profiler.formatter import getLogger
+from deeplite.profiler.utils import Device, cast_tuple, SampleMeanAggregator, SumAggregator
+
+logger = getLogger(__name__)
 
 
 def cudafy(*args, **kwargs):
@@ -62,9 +72,37 @@ class TorchEvaluationFunction(EvaluationFunction):
         raise NotImplementedError("Base class call")
 
 
-class _GetMissclass(TorchEvaluationFunction):
-    def _compute_inference(self, model, data_loader, device=Device.CPU, transform=None):
-        total_acc = 0
+def _predictions(outputs):
+    # a single output is a binary classifier on the sign of its logit
+    if outputs.shape[1] == 1:
+        return torch.gt(outputs, 0).flatten().long()
+    return torch.argmax(outputs, dim=1)
+
+
+def _flat_targets(targets):
+    if targets.dim() == 2 and targets.shape[1] == 1:
+        return targets.flatten()
+    return targets
+
+
+def _batch_size(batch):
+    # number of samples of a batch, the size of its first tensor
+    if isinstance(batch, torch.Tensor):
+        return batch.size(0) if batch.dim() else 1
+    if isinstance(batch, dict):
+        batch = list(batch.values())
+    if isinstance(batch, (list, tuple)):
+        for x in batch:
+            if isinstance(x, (torch.Tensor, list, tuple, dict)):
+                return _batch_size(x)
+    return 1
+
+
+def _feed_reducers(model, data_loader, reducers, device=Device.CPU, transform=None):
+    """
+    Runs `model` once on every batch of `data_loader` and feeds its outputs to the `reducers`.
+    """
+    try:
         for x, y in data_loader:
             if len(x.shape) == 3:
                 x = x[None]
@@ -73,30 +111,60 @@ class _GetMissclass(TorchEvaluationFunction):
             if device == Device.GPU:
                 x, y = cudafy(x, y)
             out = model(x)
+            for reducer in reducers.values():
+                reducer.update(out, y)
+    except BaseException:
+        # getting a metric resets its reducer, a failed pass does not leak in the next one
+        for reducer in reducers.values():
+            reducer.get()
+        raise
+
+
+def _run_reducers(model, data_loader, reducers, device=Device.CPU, transform=None):
+    _feed_reducers(model, data_loader, reducers, device=device, transform=transform)
+    return {name: reducer.get() for name, reducer in reducers.items()}
+
+
+class ReducerEvaluation(TorchEvaluationFunction):
+    """
+    Evaluation whose metrics are reduced over the batches by :class:`MetricReducer`. As the states of the
+    reducers can be merged, it can be computed over parts of the data and combined exactly
+    (see :class:`~ShardedEvaluation`).
+    """
+
+    @abstractmethod
+    def get_reducers(self, **kwargs):
+        """
+        The reducers of the metrics by name, `kwargs` are the options of `__call__` other than the device and
+        the transform (ex.: 'topk').
+        """
+        raise NotImplementedError("Base class call")
+
+    def finalize(self, values):
+        """ The returned metric from the values of the reducers, by name """
+        return values
+
+    def _compute_inference(self, model, data_loader, device=Device.CPU, transform=None):
+        return self.finalize(_run_reducers(model, data_loader, self.get_reducers(), device=device,
+                                           transform=transform))
 
-            if out.shape[1] == 1:
-                out = torch.gt(out, 0)
-            else:
-                out = torch.nn.functional.softmax(out, dim=-1)
-                out = torch.argmax(out, dim=1)
 
-            if out.dim() == 1 and y.dim() == 2 and y.shape[1] == 1:
-                y = y.flatten()
+class _GetMissclass(ReducerEvaluation):
+    def get_reducers(self):
+        return {'missclass': MissclassReducer()}
 
-            acc = torch.mean((out != y).float())
-            total_acc += itemify(acc)
-        return 100. * (total_acc / float(len(data_loader)))
+    def finalize(self, values):
+        return values['missclass']
 get_missclass = _GetMissclass()
 
 
 class _GetAccuracy(_GetMissclass):
-    def _compute_inference(self, model, data_loader, device=Device.CPU, transform=None):
-        rval = super()._compute_inference(model, data_loader, device, transform)
-        return 100. - rval
+    def finalize(self, values):
+        return 100. - super().finalize(values)
 get_accuracy = _GetAccuracy()
 
 
-class _GetTopk(TorchEvaluationFunction):
+class _GetTopk(ReducerEvaluation):
     def __init__(self):
         self.__topk = None
 
@@ -105,54 +173,291 @@ class _GetTopk(TorchEvaluationFunction):
         self.__topk = topk
         rval = super().__call__(model, data_loader, device, transform)
         self.__topk = None
-        return {'top-' + str(k): res for k, res in zip(topk, rval)}
+        return rval
 
-    def _compute_inference(self, model, data_loader, device=Device.CPU, transform=None):
-        topk = self.__topk
-
-        def _accuracy(output, target):
-            """Computes the precision@k for the specified values of k"""
-            maxk = max(topk)
-
-            _, pred = output.topk(maxk, 1, True, True)
-            pred = pred.t()
-
-            correct = pred.eq(target.view(1, -1))
-            res = []
-            for k in topk:
-                correct_k = correct[:k].view(-1).float().sum(0, keepdim=True)
-                res.append(correct_k)
-            return res
-
-        correct_k = torch.FloatTensor([0.] * len(topk))
-        ntotal = 0
-        for xs, ys in data_loader:
-            if len(xs.shape) == 3:
-                xs = xs[None]
-            if transform:
-                xs, ys = transform(xs, ys)
-            if device == Device.GPU:
-                xs, ys = cudafy(xs, ys)
-            outputs = model(xs)
-            correct_k += torch.cat(_accuracy(outputs, ys), 0).cpu()
-            ntotal += ys.size(0)
-        return (100. * (correct_k / ntotal)).tolist()
+    def get_reducers(self, topk=None):
+        if topk is None:
+            topk = self.__topk if self.__topk else (1, 5)
+        return {'topk': TopkReducer(topk)}
+
+    def finalize(self, values):
+        return values['topk']
 get_topk = _GetTopk()
 
 
 class EvalLossFunction(TorchEvaluationFunction):
+    """
+    Mean of `loss_fn(model, batch)` over the samples. `loss_fn` returns the mean loss of the batch (or a
+    `dict` of losses which are summed), it is weighted by the number of samples of the batch.
+    """
+
     def __init__(self, loss_fn):
         self.loss_fn = loss_fn
 
     def _compute_inference(self, model, data_loader, device=Device.CPU, transform=None):
         self.loss_fn.to_device(device)
 
-        loss = 0
+        loss = SampleMeanAggregator()
         for batch in data_loader:
             if transform:
                 batch = transform(batch)
             loss_ = self.loss_fn(model, batch)
             if isinstance(loss_, dict):
                 loss_ = sum(loss_.values())
-            loss += loss_.item()
-        return loss / len(data_loader)
+            n = _batch_size(batch)
+            loss.update(loss_.detach() * n, n)
+        return loss.get()
+
+
+class TopkReducer(MetricReducer):
+    """
+    Top-k accuracies (%) over all the samples, returned as {'top-k': value}.
+    """
+
+    def __init__(self, topk=(1, 5)):
+        self.topk = cast_tuple(topk)
+        self._correct = SampleMeanAggregator()
+
+    def update(self, outputs, targets):
+        _, pred = outputs.topk(max(self.topk), 1, True, True)
+        correct = pred.eq(targets.view(-1, 1))
+        correct = torch.stack([correct[:, :k].sum() for k in self.topk])
+        self._correct.update(100. * correct, targets.size(0))
+
+    def get(self):
+        rval = self._correct.get()
+        rval = [0.] * len(self.topk) if rval == 0 else rval
+        return {'top-' + str(k): res for k, res in zip(self.topk, rval)}
+
+    def get_state(self):
+        return self._correct.get_state()
+
+    def merge_state(self, state):
+        self._correct.merge_state(state)
+
+
+class MissclassReducer(MetricReducer):
+    """
+    Misclassification rate (%) over all the samples. A model with a single output is a binary classifier on
+    the sign of its logit.
+    """
+
+    def __init__(self):
+        self._wrong = SampleMeanAggregator()
+
+    def update(self, outputs, targets):
+        wrong = _predictions(outputs) != _flat_targets(targets)
+        self._wrong.update(100. * wrong.sum(), wrong.numel())
+
+    def get(self):
+        return self._wrong.get()
+
+    def get_state(self):
+        return self._wrong.get_state()
+
+    def merge_state(self, state):
+        self._wrong.merge_state(state)
+
+
+class AccuracyReducer(MissclassReducer):
+    """
+    Accuracy (%) over all the samples, see :class:`~MissclassReducer`.
+    """
+
+    def get(self):
+        return 100. - super().get()
+
+
+class LossReducer(MetricReducer):
+    """
+    Mean of `criterion(outputs, targets)` over all the samples. `criterion` returns the mean loss of a batch
+    (ex.: torch.nn.CrossEntropyLoss()), it is weighted by the size of the batch.
+    """
+
+    def __init__(self, criterion):
+        self.criterion = criterion
+        self._loss = SampleMeanAggregator()
+
+    def update(self, outputs, targets):
+        n = targets.size(0)
+        self._loss.update(self.criterion(outputs, targets).detach() * n, n)
+
+    def get(self):
+        return self._loss.get()
+
+    def get_state(self):
+        return self._loss.get_state()
+
+    def merge_state(self, state):
+        self._loss.merge_state(state)
+
+
+class ConfusionMatrixReducer(MetricReducer):
+    """
+    Confusion matrix of the predictions, a `list` of `num_classes` rows (target class) of `num_classes`
+    counts (predicted class).
+    """
+
+    def __init__(self, num_classes):
+        self.num_classes = num_classes
+        self._counts = SumAggregator()
+
+    def update(self, outputs, targets):
+        pairs = _flat_targets(targets).long() * self.num_classes + _predictions(outputs)
+        self._counts.update(torch.bincount(pairs, minlength=self.num_classes ** 2))
+
+    def get(self):
+        n = self.num_classes
+        counts = self._counts.get()
+        counts = [0] * n ** 2 if counts == 0 else counts
+        return [counts[i * n:(i + 1) * n] for i in range(n)]
+
+    def get_state(self):
+        return self._counts.get_state()
+
+    def merge_state(self, state):
+        self._counts.merge_state(state)
+
+
+class FusedEvaluation(ReducerEvaluation):
+    """
+    Evaluates any number of metrics in a single pass over the data. The model runs once per batch and its
+    outputs are fed to every :class:`MetricReducer`.
+
+    The returned `dict` has the metric of each reducer under its name, except for the reducers returning a
+    `dict` (ex.: :class:`~TopkReducer`) whose keys are merged in, ex.:
+    FusedEvaluation({'accuracy': AccuracyReducer(), 'topk': TopkReducer((1, 5))}) returns
+    {'accuracy', 'top-1', 'top-5'}. To profile them, give one key and the others as `secondary_keys` to
+    :class:`ComputeEvalMetric`, ex.: ComputeEvalMetric(fused, 'accuracy', secondary_keys=('top-1', 'top-5')).
+
+    The given reducers are templates, each evaluation feeds its own copies of them.
+
+    :param reducers: The reducers of the metrics, by name
+    :type reducers: `dict` of `str` to :class:`MetricReducer`
+    """
+
+    def __init__(self, reducers):
+        self.reducers = reducers
+
+    def get_reducers(self):
+        return deepcopy(self.reducers)
+
+    def finalize(self, values):
+        rval = {}
+        for name, value in values.items():
+            if isinstance(value, dict):
+                rval.update(value)
+            else:
+                rval[name] = value
+        return rval
+
+
+def _evaluate_shard(func, model, dataset, indices, batch_size, collate_fn, num_threads, kwargs):
+    # module level so that it can be pickled to a process pool
+    torch.set_num_threads(num_threads)
+    data_loader = DataLoader(Subset(dataset, indices), batch_size=batch_size, shuffle=False,
+                             collate_fn=collate_fn)
+    kwargs = dict(kwargs)
+    device = kwargs.pop('device', Device.CPU)
+    transform = kwargs.pop('transform', None)
+    reducers = func.get_reducers(**kwargs)
+    model = model.eval()
+    with torch.no_grad():
+        _feed_reducers(model, data_loader, reducers, device=device, transform=transform)
+    return {name: reducer.get_state() for name, reducer in reducers.items()}
+
+
+def _process_pool(max_workers, start_method):
+    if sys.version_info >= (3, 7):
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(start_method))
+    # mp_context is new in python 3.7, before the executor always uses the default start method
+    default_method = multiprocessing.get_start_method()
+    if start_method != default_method:
+        logger.warning("The start method '{}' requires python 3.7+, the processes use '{}'".format(
+            start_method, default_method))
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+
+def _is_shardable(native_dl):
+    # every sample of a map-style dataset read once, in batches of a fixed size
+    if not isinstance(native_dl, DataLoader) or native_dl.batch_size is None or native_dl.drop_last:
+        return False
+    dataset, sampler = native_dl.dataset, native_dl.sampler
+    if not hasattr(dataset, '__len__'):
+        return False
+    if type(sampler) is SequentialSampler:
+        return True
+    # the reduced metrics do not depend on the order of the samples
+    return type(sampler) is RandomSampler and not sampler.replacement and sampler.num_samples == len(dataset)
+
+
+class ShardedEvaluation(EvaluationFunction):
+    """
+    Runs an evaluation over shards of the dataset in a pool of processes, each with its own replica of the
+    model and a budget of `num_threads` torch threads. The shards are contiguous ranges of the dataset aligned
+    on the batch size. Each process returns the raw states of its :class:`MetricReducer` (ex.: sums and
+    counts) and they are merged before computing the metrics, which are the same as in a single pass over the
+    whole dataset.
+
+    It takes the signature of `func` and can be given to a :class:`ComputeEvalMetric` in its place, ex.:
+    ComputeEvalMetric(ShardedEvaluation(get_topk, num_workers=8), 'top-1').
+
+    `func` has to be a :class:`~ReducerEvaluation` (ex.: get_accuracy, get_topk, :class:`~FusedEvaluation`)
+    and the data loader (or the native loader of a :class:`TorchDataLoader`) a `torch.utils.data.DataLoader`
+    over a map-style dataset, reading every sample once (no custom sampler or `drop_last`). The model, `func`,
+    the dataset and the collate function are pickled to the workers. Otherwise, and on GPU, `func` runs in
+    this process as usual.
+
+    :param func: The evaluation function, ex.: get_accuracy
+    :type func: :class:`~ReducerEvaluation`
+    :param num_workers: Number of processes, defaults to the number of CPUs
+    :type num_workers: `int`, optional
+    :param num_threads: Number of torch threads of each process, defaults to the current number of torch
+        threads divided among the processes
+    :type num_threads: `int`, optional
+    :param start_method: `multiprocessing` start method of the processes, defaults to 'spawn', python 3.6 always
+        uses the default start method of the platform
+    :type start_method: `str`, optional
+    """
+
+    def __init__(self, func, num_workers=None, num_threads=None, start_method='spawn'):
+        self.func = func
+        self.num_workers = num_workers
+        self.num_threads = num_threads
+        self.start_method = start_method
+        self.__signature__ = signature(func)
+
+    def _shards(self, n_samples, batch_size, num_workers):
+        # contiguous ranges of whole batches, the batches are the same as in a single pass
+        n_batches = -(-n_samples // batch_size)
+        n_shards = max(min(num_workers, n_batches), 1)
+        bounds = [round(i * n_batches / n_shards) * batch_size for i in range(n_shards + 1)]
+        return [range(start, min(stop, n_samples)) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    def __call__(self, model, data_loader, **kwargs):
+        native_dl = getattr(data_loader, 'native_dl', data_loader)
+        device = kwargs.get('device', Device.CPU)
+        if device != Device.CPU or not isinstance(self.func, ReducerEvaluation) or not _is_shardable(native_dl):
+            logger.debug("Cannot shard the evaluation over '{}', running it in a single process".format(
+                data_loader))
+            return self.func(model, data_loader, **kwargs)
+
+        dataset = native_dl.dataset
+        num_workers = self.num_workers if self.num_workers else os.cpu_count()
+        shards = self._shards(len(dataset), native_dl.batch_size, num_workers)
+        if len(shards) == 1:
+            return self.func(model, data_loader, **kwargs)
+        num_threads = self.num_threads if self.num_threads else max(torch.get_num_threads() // len(shards), 1)
+
+        with _process_pool(len(shards), self.start_method) as executor:
+            futures = [executor.submit(_evaluate_shard, self.func, model, dataset, list(shard),
+                                       native_dl.batch_size, native_dl.collate_fn, num_threads, kwargs)
+                       for shard in shards]
+            states = [future.result() for future in futures]
+
+        options = {k: v for k, v in kwargs.items() if k not in ('device', 'transform')}
+        reducers = self.func.get_reducers(**options)
+        for shard_states in states:
+            for name, reducer in reducers.items():
+                reducer.merge_state(shard_states[name])
+        return self.func.finalize({name: reducer.get() for name, reducer in reducers.items()})
@@ -1,4 +1,8 @@
+from collections import OrderedDict
+from contextlib import contextmanager
 from copy import deepcopy
+from functools import partial, lru_cache
+import hashlib
 import time
 import sys
 
@@ -7,15 +11,18 @@ from thirdparty import ptflops as flops_counter
 import torch
 
 from deeplite.profiler import Profiler, ProfilerFunction
+from deeplite.profiler.layerwise import LayerwiseTable, LayerwiseTimeTable, HotLayersReport
+from deeplite.profiler.benchmark import BENCHMARK_STATUS_KEYS, run_benchmark, benchmark_status_values
 from deeplite.profiler.metrics import *
-from deeplite.profiler.utils import AverageAggregator, Device
+from deeplite.profiler.utils import AverageAggregator, Device, PeakRSSSampler, perf_counter_ns
 from deeplite.profiler.formatter import getLogger
 
-from .torch_data_loader import TorchDataLoader, TorchForwardPass
+from .torch_data_loader import TorchDataLoader, TorchForwardPass, check_meta_device_supported
 
 logger = getLogger(__name__)
 
-__all__ = ['TorchProfiler', 'ComputeComplexity', 'ComputeExecutionTime']
+__all__ = ['TorchProfiler', 'ComputeComplexity', 'ComputeStaticComplexity', 'ComputeExecutionTime', 'ComputeThroughputSweep',
+           'ComputePeakMemory', 'ComputeLayerwiseTime', 'ComputeHotLayers']
 
 
 class TorchProfiler(Profiler):
@@ -36,8 +43,67 @@ class TorchProfiler(Profiler):
         m = m.cpu() if device == Device.CPU else m.cuda()
         return m
 
+    def model_fingerprint(self):
+        hasher = hashlib.sha256()
+        # the repr of a module lists its submodules and their configuration
+        hasher.update(repr(self.model).encode('utf-8'))
+        for name, value in self.model.state_dict().items():
+            hasher.update(name.encode('utf-8'))
+            if not isinstance(value, torch.Tensor):
+                hasher.update(repr(value).encode('utf-8'))
+                continue
+            tensor = value.detach().cpu()
+            hasher.update("{}{}".format(tensor.dtype, tuple(tensor.shape)).encode('utf-8'))
+            if tensor.is_quantized:
+                tensor = tensor.int_repr()
+            elif tensor.dtype == torch.bfloat16:
+                # numpy has no bfloat16, the float32 upcast is exact
+                tensor = tensor.float()
+            hasher.update(tensor.contiguous().numpy())
+        return hasher.hexdigest()
+
+
+@contextmanager
+def model_for_profiling(model, device, copy_model=True):
+    """
+    Yields the model to instrument, in eval mode and on `device`.
+
+    With `copy_model`, it is a deepcopy of `model`. Otherwise it is `model` itself and, on exit, the train / eval
+    state of all its modules and its device are restored. Under `torch.no_grad()` and in eval mode, a forward
+    pass does not change any parameter or buffer, so as long as the caller removes whatever it hooked on the
+    model, it is left bit-identical.
+    """
+    if copy_model:
+        temp_model = deepcopy(model)
+        temp_model.eval()
+        yield TorchProfiler.model_to_device(temp_model, device)
+        return
+
+    training = [(m, m.training) for m in model.modules()]
+    og_device = next((t.device for t in model.state_dict().values() if isinstance(t, torch.Tensor)), None)
+    try:
+        model.eval()
+        yield TorchProfiler.model_to_device(model, device)
+    finally:
+        for m, mode in training:
+            m.training = mode
+        if og_device is not None:
+            model.to(og_device)
+
 
 class ComputeComplexity(ProfilerFunction):
+    """
+    Count the MACs, parameters, model size and memory footprint of the model with hooks on its modules during
+    a forward pass on random inputs.
+
+    By default, the hooks are registered on a copy of the model. With `copy_model=False`, they are registered
+    on the model itself and removed afterwards, which avoids holding two copies of the model in memory.
+    """
+
+    def __init__(self, copy_model=True):
+        super().__init__()
+        self.copy_model = copy_model
+
     @classmethod
     def _get_bounded_status_keys_cls(cls):
         return Flops, TotalParams, ModelSize, MemoryFootprint, LayerwiseSummary
@@ -57,102 +123,592 @@ class ComputeComplexity(ProfilerFunction):
     # This is adapted from ptflops
     # HAS TO RETURN A TUPLE IN THE SAME ORDER OF STATUSKEYS
     def _compute_complexity(self, model, dataloader, batch_size=1, device=Device.CPU, include_weights=True):
-        temp_model = deepcopy(model)
         forward_pass = dataloader.forward_pass
-
-        with torch.no_grad():
-            # synchronize gpu time and measure fp
-            temp_model = TorchProfiler.model_to_device(temp_model, device)
-            flops_model = flops_counter.add_flops_counting_methods(temp_model)
-            flops_model.eval()
-
-            # DRY RUNS
-            for _ in range(5):
-                if device == Device.GPU:
-                    torch.cuda.synchronize()
-                    forward_pass.random_perform(flops_model, batch_size=batch_size, device=device)
-
-            # Add hooks and start the run
-            flops_model.start_flops_count(ost=sys.stdout, verbose=False, ignore_list=[])
-            if device == Device.GPU:
-                torch.cuda.synchronize()
-
-            t0 = time.time()
-            forward_pass.random_perform(flops_model, batch_size=batch_size, device=device)
-            flops_count, params_count, model_size, activation_size, summary_str = \
-                flops_model.compute_average_flops_cost("", t0)
-
-            flops_model.stop_flops_count()
+        flops_count, params_count, model_size, activation_size, layers = \
+            self._count_flops(model, forward_pass, batch_size=batch_size, device=device)
 
         flops = flops_count / 1e9  # Giga Flops
         params = params_count / 1e6  # Million Flops
         model_size = abs(model_size / (1024 ** 2.))  # Convert bytes to MB
-        shapes_tuple = forward_pass.get_model_input_shapes()
-        total_input_size = abs(
-            np.prod(sum(shapes_tuple, ()))) * batch_size * 4  # Multiply with batch_size and bit precision
+        total_input_size = self._get_input_size(forward_pass, batch_size)
         memory_footprint = abs((total_input_size + activation_size) / (1024 ** 2.))
         total_memory_footprint = model_size + memory_footprint if include_weights else memory_footprint
 
-        return flops, params, model_size, total_memory_footprint, summary_str
+        return flops, params, model_size, total_memory_footprint, LayerwiseTable(layers)
+
+    @staticmethod
+    def _get_input_size(forward_pass, batch_size):
+        shapes_tuple = forward_pass.get_model_input_shapes()
+        try:
+            element_sizes = [torch.empty((), dtype=dtype).element_size()
+                             for dtype in forward_pass.get_model_input_dtypes()]
+        except NotImplementedError:
+            element_sizes = [4] * len(shapes_tuple)
+        return sum(abs(int(np.prod(shp))) * batch_size * element_size
+                   for shp, element_size in zip(shapes_tuple, element_sizes))
+
+    def _count_flops(self, model, forward_pass, batch_size=1, device=Device.CPU):
+        with model_for_profiling(model, device, self.copy_model) as temp_model, torch.no_grad():
+            flops_model = flops_counter.add_flops_counting_methods(temp_model)
+            try:
+                # DRY RUNS
+                for _ in range(5):
+                    if device == Device.GPU:
+                        torch.cuda.synchronize()
+                        forward_pass.random_perform(flops_model, batch_size=batch_size, device=device)
+
+                # Add hooks and start the run
+                flops_model.start_flops_count(ost=sys.stdout, verbose=False, ignore_list=[])
+                if device == Device.GPU:
+                    torch.cuda.synchronize()
+
+                t0 = time.perf_counter()
+                forward_pass.random_perform(flops_model, batch_size=batch_size, device=device)
+                return flops_model.compute_average_flops_cost("", t0)
+            finally:
+                flops_counter.remove_flops_counting_methods(flops_model)
+
+
+def meta_replica(model):
+    """
+    Copy of `model` whose parameters and buffers are on the meta device, they have a shape and a dtype but no
+    data. The weights of `model` are never copied.
+    """
+    check_meta_device_supported()
+    memo = {}
+    for t in list(model.parameters()) + list(model.buffers()):
+        if isinstance(t, torch.nn.Parameter):
+            memo[id(t)] = torch.nn.Parameter(t.detach().to('meta'), requires_grad=t.requires_grad)
+        else:
+            memo[id(t)] = t.to('meta')
+    return deepcopy(model, memo)
+
+
+class ComputeStaticComplexity(ComputeComplexity):
+    """
+    Same as :class:`~ComputeComplexity` but the forward pass runs on a replica of the model on the meta device
+    with meta inputs. Only the shapes are propagated through the same ptflops hooks, nothing is computed nor
+    allocated, which makes it fast and cheap on memory for very large models. It profiles the same status keys,
+    it is registered in place of :class:`~ComputeComplexity`.
+
+    The `device` argument is ignored, the times of the layerwise summary are meaningless and it requires the
+    `ForwardPass` to expect common inputs, as the model is called directly with the meta inputs. Models whose
+    forward depends on the input values (ex.: data dependent control flow) cannot be profiled this way.
+
+    NOTE: The meta device requires torch 1.9 and kernels for the layers of the model, a RuntimeError is raised
+    on older releases.
+    """
+
+    def __init__(self):
+        super().__init__(copy_model=False)
+
+    def _count_flops(self, model, forward_pass, batch_size=1, device=Device.CPU):
+        if not forward_pass.expecting_common_inputs:
+            raise TypeError("{} requires a ForwardPass expecting common inputs".format(type(self).__name__))
+        x = forward_pass._tensor_sampler.create_meta_tensors(batch_size)
+        flops_model = flops_counter.add_flops_counting_methods(meta_replica(model).eval())
+        flops_model.start_flops_count(ost=sys.stdout, verbose=False, ignore_list=[])
+        t0 = time.perf_counter()
+        try:
+            with torch.no_grad():
+                flops_model(*x)
+        except (NotImplementedError, RuntimeError) as e:
+            raise RuntimeError("Could not propagate shapes through the model on the meta device, use {} "
+                               "instead".format(ComputeComplexity.__name__)) from e
+        return flops_model.compute_average_flops_cost("", t0)
 
 
 class ComputeExecutionTime(ProfilerFunction):
+    """
+    Time the forward pass of the model on random inputs. By default, it averages 10 timed steps after 5 dry
+    runs. In `benchmark` mode, the warmup runs until the timings stabilize and the timed steps continue
+    until the confidence interval of the mean is within `relative_precision` of the mean (or `max_steps`
+    steps, or `max_time` seconds). The median, 90th and 99th percentiles, standard deviation, minimum and
+    number of outliers are then reported as well.
+
+    The forward pass is timed by hooks on the model. With `copy_model=False`, they are registered on the
+    model itself instead of a copy and removed afterwards.
+    """
+
+    def __init__(self, benchmark=False, relative_precision=0.02, max_steps=1000, max_time=60., copy_model=True):
+        super().__init__()
+        self.benchmark = benchmark
+        self.relative_precision = relative_precision
+        self.max_steps = max_steps
+        self.max_time = max_time
+        self.copy_model = copy_model
+
     def get_bounded_status_keys(self):
+        if self.benchmark:
+            return tuple(sk_cls() for sk_cls, _ in BENCHMARK_STATUS_KEYS)
         return ExecutionTime()
 
     def __call__(self, model, data_splits, split='train', batch_size=1, device=Device.CPU):
-        def timer(f, aggr):
-            if device == Device.CPU:
-                def call_timing_decorator(*args, **kwargs):
-                    start_time = time.perf_counter()
-                    rval = f(*args, **kwargs)
-                    end_time = time.perf_counter()
-                    aggr.update(end_time - start_time)
-                    return rval
-            else:
-                starter, ender = torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
-
-                def call_timing_decorator(*args, **kwargs):
+        dataloader = data_splits[split]
+        aggregator = AverageAggregator()
+
+        with model_for_profiling(model, device, self.copy_model) as temp_model, torch.no_grad():
+            handles = self._register_timing_hooks(temp_model, device, aggregator)
+            try:
+                if self.benchmark:
+                    def step():
+                        if device == Device.GPU:
+                            torch.cuda.synchronize()
+                        dataloader.sample_random_forward(temp_model, batch_size=batch_size, device=device)
+                        # a single update since the last get, this is the time of this step
+                        return aggregator.get()
+
+                    stats = run_benchmark(step, max_steps=self.max_steps, max_time=self.max_time,
+                                          relative_precision=self.relative_precision)
+                else:
+                    self._time_fixed_steps(temp_model, dataloader, batch_size, device, aggregator)
+            finally:
+                for handle in handles:
+                    handle.remove()
+
+        # cuda events already measure in ms
+        scale = 1000. if device == Device.CPU else 1.
+        if self.benchmark:
+            return benchmark_status_values(stats, scale=scale / batch_size)
+        execution_time = aggregator.get() / batch_size * scale
+        return execution_time
+
+    @staticmethod
+    def _register_timing_hooks(model, device, aggregator):
+        # hooks on the model instance only, as opposed to patching its class __call__ which would also time
+        # every other instance of that class (ex.: nested nn.Sequential)
+        if device == Device.CPU:
+            start_time = [0.]
+
+            def pre_hook(module, inputs):
+                start_time[0] = time.perf_counter()
+
+            def hook(module, inputs, outputs):
+                aggregator.update(time.perf_counter() - start_time[0])
+        else:
+            starter, ender = torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
+
+            def pre_hook(module, inputs):
+                starter.record()
+
+            def hook(module, inputs, outputs):
+                ender.record()
+                torch.cuda.synchronize()
+                aggregator.update(starter.elapsed_time(ender))
+        return model.register_forward_pre_hook(pre_hook), model.register_forward_hook(hook)
+
+    @staticmethod
+    def _time_fixed_steps(model, dataloader, batch_size, device, aggregator):
+        # DRY RUNS
+        for _ in range(5):
+            if device == Device.GPU:
+                torch.cuda.synchronize()
+            _ = dataloader.timed_random_forward(model, batch_size=batch_size, device=device)
+        # resets the aggregator and makes sure it was updated in the decorator
+        assert aggregator.get() != 0
+
+        # START BENCHMARKING
+        steps = 10
+        for _ in range(steps):
+            if device == Device.GPU:
+                torch.cuda.synchronize()
+            dataloader.timed_random_forward(model, batch_size=batch_size, device=device)
+
+
+def _weights_size(model):
+    # bytes of the parameters and buffers
+    return sum(t.numel() * t.element_size() for t in model.state_dict().values() if isinstance(t, torch.Tensor))
+
+
+class ComputeThroughputSweep(ProfilerFunction):
+    """
+    Sweep the batch size on a single warmed-up copy of the model and measure, for each batch size, the median
+    latency of a forward pass (ms per batch), the throughput (images per second) and the peak memory (MB).
+    As the `peak_memory` of :class:`~ComputePeakMemory`, the peak memory is the size of the weights plus the
+    peak increase of the allocated memory on GPU, or of the resident memory of the process on CPU, during the
+    forward passes of the batch size.
+
+    The batch sizes default to the powers of 2 up to `max_batch_size`. The optimal batch size is the one with
+    the highest throughput among those with a latency within `latency_budget` (ms), 0 if none is. With
+    `copy_model=False`, the model itself is used instead of a copy.
+    """
+
+    def __init__(self, max_batch_size=256, steps=10, dry_runs=3, copy_model=True):
+        super().__init__()
+        self.max_batch_size = max_batch_size
+        self.steps = steps
+        self.dry_runs = dry_runs
+        self.copy_model = copy_model
+
+    def get_bounded_status_keys(self):
+        return ThroughputCurve(), OptimalBatchSize()
+
+    def __call__(self, model, data_splits, split='train', device=Device.CPU, batch_sizes=None,
+                 latency_budget=None):
+        if batch_sizes is None:
+            batch_sizes = [2 ** i for i in range(int(np.log2(self.max_batch_size)) + 1)]
+        batch_sizes = sorted(batch_sizes)
+        forward_pass = data_splits[split].forward_pass
+
+        curve = []
+        with model_for_profiling(model, device, self.copy_model) as temp_model, torch.no_grad():
+            x = forward_pass.create_random_model_inputs(batch_sizes[0])
+            for _ in range(self.dry_runs):
+                forward_pass.model_call(temp_model, x, device)
+
+            weights = _weights_size(temp_model)
+            for batch_size in batch_sizes:
+                curve.append(self._measure_batch_size(temp_model, forward_pass, batch_size, device, weights))
+
+        within_budget = [p for p in curve if latency_budget is None or p['latency'] <= latency_budget]
+        optimal_batch_size = max(within_budget, key=lambda p: p['throughput'])['batch_size'] \
+            if within_budget else 0
+        return {ThroughputCurve.NAME: curve, OptimalBatchSize.NAME: optimal_batch_size}
+
+    def _measure_batch_size(self, model, forward_pass, batch_size, device, weights):
+        if device == Device.GPU:
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+            baseline = torch.cuda.memory_allocated()
+
+        times = []
+        with PeakRSSSampler() as sampler:
+            x = forward_pass.create_random_model_inputs(batch_size)
+            # the first call with a new shape is not timed
+            forward_pass.model_call(model, x, device)
+            for _ in range(self.steps):
+                if device == Device.GPU:
+                    starter, ender = torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
                     starter.record()
-                    rval = f(*args, **kwargs)
+                    forward_pass.model_call(model, x, device)
                     ender.record()
                     torch.cuda.synchronize()
-                    aggr.update(starter.elapsed_time(ender))
-                    return rval
-            return call_timing_decorator
+                    times.append(starter.elapsed_time(ender))
+                else:
+                    start_time = time.perf_counter()
+                    forward_pass.model_call(model, x, device)
+                    times.append((time.perf_counter() - start_time) * 1000)
+
+        if device == Device.GPU:
+            peak_increase = torch.cuda.max_memory_allocated() - baseline
+        else:
+            peak_increase = sampler.peak_increase
+        peak_memory = (weights + peak_increase) / (1024 ** 2.) if peak_increase is not None else None
+        latency = float(np.median(times))
+        return {'batch_size': batch_size, 'latency': latency, 'throughput': batch_size / latency * 1000,
+                'peak_memory': peak_memory}
+
+
+class ComputePeakMemory(ProfilerFunction):
+    """
+    Memory needed by a forward pass of `batch_size`, in two ways:
+
+    - `peak_memory` is measured. On GPU, it is the peak of the allocated memory. On CPU, it is the peak of the
+      resident memory of the process, sampled on a background thread. The parameters and buffers are added
+      if `include_weights`. On CPU, the allocator can keep memory freed by previous calls, which can only
+      make this an underestimate of a first call in a fresh process.
+    - `peak_activation_memory` is estimated from the lifetimes of the tensors on a meta-device replica of the
+      model (see :class:`~ComputeStaticComplexity`). A tensor is alive from the module producing it (or the
+      first module consuming it) to the last module consuming it and the model outputs until the end. Views
+      and in-place results share the memory of the tensor they come from. It is None, with a warning, if the
+      model cannot run on the meta device.
+
+    Unlike the `memory_footprint` of :class:`~ComputeComplexity`, which sums every layer output, freed
+    activations are not counted.
+    """
+
+    def __init__(self, dry_runs=2, copy_model=True):
+        super().__init__()
+        self.dry_runs = dry_runs
+        self.copy_model = copy_model
 
-        dataloader = data_splits[split]
-        temp_model = deepcopy(model)
-        temp_model.eval()
-        aggregator = AverageAggregator()
-        og_call = type(temp_model).__call__
-        type(temp_model).__call__ = timer(type(temp_model).__call__, aggregator)
+    def get_bounded_status_keys(self):
+        return PeakMemory(), PeakActivationMemory()
+
+    def __call__(self, model, data_splits, split='train', batch_size=1, device=Device.CPU, include_weights=True):
+        forward_pass = data_splits[split].forward_pass
+        weights = _weights_size(model) if include_weights else 0
+        peak_memory = self._measure_peak_memory(model, forward_pass, batch_size, device)
+        try:
+            peak_activation_memory = self._estimate_peak_activation_memory(model, forward_pass, batch_size)
+        except (RuntimeError, TypeError) as e:
+            logger.warning("Cannot estimate the peak activation memory: {}".format(e))
+            peak_activation_memory = None
+
+        if peak_memory is None:
+            logger.warning("Cannot measure the memory on this platform, the peak memory is estimated")
+            peak_memory = peak_activation_memory
+        if peak_memory is not None:
+            peak_memory = (weights + peak_memory) / (1024 ** 2.)
+        if peak_activation_memory is not None:
+            peak_activation_memory /= 1024 ** 2.
+        return {PeakMemory.NAME: peak_memory, PeakActivationMemory.NAME: peak_activation_memory}
+
+    def _measure_peak_memory(self, model, forward_pass, batch_size, device):
+        with model_for_profiling(model, device, self.copy_model) as temp_model, torch.no_grad():
+            for _ in range(self.dry_runs):
+                forward_pass.random_perform(temp_model, batch_size, device)
+
+            if device == Device.GPU:
+                torch.cuda.synchronize()
+                torch.cuda.reset_peak_memory_stats()
+                baseline = torch.cuda.memory_allocated()
+                forward_pass.random_perform(temp_model, batch_size, device)
+                torch.cuda.synchronize()
+                return torch.cuda.max_memory_allocated() - baseline
+
+            with PeakRSSSampler() as sampler:
+                forward_pass.random_perform(temp_model, batch_size, device)
+            return sampler.peak_increase
+
+    @staticmethod
+    def _estimate_peak_activation_memory(model, forward_pass, batch_size):
+        if not forward_pass.expecting_common_inputs:
+            raise TypeError("Estimating the activation memory requires a ForwardPass expecting common inputs")
+        x = forward_pass._tensor_sampler.create_meta_tensors(batch_size)
+        replica = meta_replica(model).eval()
+        weights = set(id(t) for t in list(replica.parameters()) + list(replica.buffers()))
+
+        # id of the root tensor -> [root tensor, bytes, first step, last step], the tensor is kept so its id
+        # cannot be reused
+        lifetimes = {}
+        step = [0]
+
+        def root(t):
+            while t._base is not None:
+                t = t._base
+            return t
+
+        def visit(tensors, fn):
+            if isinstance(tensors, torch.Tensor):
+                fn(root(tensors))
+            elif isinstance(tensors, (list, tuple)):
+                for t in tensors:
+                    visit(t, fn)
+            elif isinstance(tensors, dict):
+                for t in tensors.values():
+                    visit(t, fn)
+
+        def use(t):
+            if id(t) in weights:
+                return
+            if id(t) not in lifetimes:
+                lifetimes[id(t)] = [t, t.numel() * t.element_size(), step[0], step[0]]
+            lifetimes[id(t)][3] = step[0]
+
+        def pre_hook(module, inputs):
+            step[0] += 1
+            visit(inputs, use)
+
+        def hook(module, inputs, outputs):
+            visit(outputs, use)
+
+        handles = []
+        for m in replica.modules():
+            if not any(True for _ in m.children()):
+                handles.append(m.register_forward_pre_hook(pre_hook))
+                handles.append(m.register_forward_hook(hook))
+        try:
+            visit(x, use)
+            with torch.no_grad():
+                y = replica(*x)
+        except (NotImplementedError, RuntimeError) as e:
+            raise RuntimeError("Could not propagate shapes through the model on the meta device") from e
+        finally:
+            for handle in handles:
+                handle.remove()
+        step[0] += 1
+        visit(y, use)
+
+        live = np.zeros(step[0] + 1)
+        for _, nbytes, first, last in lifetimes.values():
+            live[first:last + 1] += nbytes
+        return float(live.max())
+
+
+class ComputeLayerwiseTime(ProfilerFunction):
+    """
+    Time every module of the model, containers included, with a `perf_counter_ns` stamp in a forward pre hook
+    and another in the paired forward hook. The inclusive time of a module is the time between its two stamps
+    and its exclusive time is its inclusive time minus the inclusive time of the modules it calls, so the
+    exclusive times of all the modules add up to the inclusive time of the model. The times are averaged over
+    `runs` forward passes, in ms per forward pass.
+
+    The overhead of the hooks is attributed to the exclusive time of the calling module. On GPU, the hooks
+    synchronize the device to get the time of the kernels, which serializes the execution.
+    """
+
+    def __init__(self, runs=10, dry_runs=2, copy_model=True):
+        super().__init__()
+        self.runs = runs
+        self.dry_runs = dry_runs
+        self.copy_model = copy_model
+
+    def get_bounded_status_keys(self):
+        return LayerwiseTime()
 
-        with torch.no_grad():
-            # synchronize gpu time and measure fp
-            temp_model = TorchProfiler.model_to_device(temp_model, device)
+    def __call__(self, model, data_splits, split='train', batch_size=1, device=Device.CPU):
+        forward_pass = data_splits[split].forward_pass
+
+        with model_for_profiling(model, device, self.copy_model) as temp_model, torch.no_grad():
+            x = forward_pass.create_random_model_inputs(batch_size)
+            for _ in range(self.dry_runs):
+                forward_pass.model_call(temp_model, x, device)
+
+            # qualified name -> [module, calls, inclusive ns, exclusive ns], in order of first call
+            timings = OrderedDict()
+            # [name, start ns, inclusive ns of the callees] of the modules being called
+            stack = []
 
-            # DRY RUNS
-            for _ in range(5):
+            def pre_hook(name, module, inputs):
                 if device == Device.GPU:
                     torch.cuda.synchronize()
-                _ = dataloader.timed_random_forward(temp_model, batch_size=batch_size, device=device)
-            # resets the aggregator and makes sure it was updated in the decorator
-            assert aggregator.get() != 0
-
-            # START BENCHMARKING
-            steps = 10
-            fp_time = 0.
-            for _ in range(steps):
+                timings.setdefault(name, [module, 0, 0, 0])
+                stack.append([name, perf_counter_ns(), 0])
+
+            def hook(name, module, inputs, outputs):
                 if device == Device.GPU:
                     torch.cuda.synchronize()
-                fp_time += dataloader.timed_random_forward(temp_model, batch_size=batch_size, device=device)
-            fp_time = fp_time / steps / batch_size
+                end = perf_counter_ns()
+                _, start, callees = stack.pop()
+                inclusive = end - start
+                if stack:
+                    stack[-1][2] += inclusive
+                timing = timings[name]
+                timing[1] += 1
+                timing[2] += inclusive
+                timing[3] += inclusive - callees
+
+            handles = []
+            try:
+                for name, module in temp_model.named_modules():
+                    handles.append(module.register_forward_pre_hook(partial(pre_hook, name)))
+                    handles.append(module.register_forward_hook(partial(hook, name)))
+                for _ in range(self.runs):
+                    stack.clear()
+                    forward_pass.model_call(temp_model, x, device)
+            finally:
+                for handle in handles:
+                    handle.remove()
+
+        table = LayerwiseTimeTable(model_name=type(model).__name__)
+        for name, (module, calls, inclusive, exclusive) in timings.items():
+            table.append({'name': name if name else type(module).__name__, 'type': type(module).__name__,
+                          'depth': name.count('.') + 1 if name else 0, 'calls': calls // self.runs,
+                          'inclusive_time': inclusive / self.runs / 1e6,
+                          'exclusive_time': exclusive / self.runs / 1e6})
+        return table
+
+
+def _synchronize(device):
+    if device == Device.GPU:
+        torch.cuda.synchronize()
+
+
+@lru_cache(maxsize=None)
+def measure_machine_balance(device=Device.CPU, n=512, numel=2 ** 24, reps=5):
+    """
+    FLOPs per byte of the device: the FLOPs of a float32 (n, n) matmul over the bytes per second of a
+    float32 copy of `numel` elements. It is measured once per set of arguments.
+    """
+    to_device = (lambda t: t.cpu()) if device == Device.CPU else (lambda t: t.cuda())
+    with torch.no_grad():
+        a = to_device(torch.rand(n, n))
+        torch.mm(a, a)
+        _synchronize(device)
+        start = time.perf_counter()
+        for _ in range(reps):
+            torch.mm(a, a)
+        _synchronize(device)
+        flops = 2 * n ** 3 * reps / (time.perf_counter() - start)
+
+        src = to_device(torch.empty(numel))
+        dst = torch.empty_like(src)
+        dst.copy_(src)
+        _synchronize(device)
+        start = time.perf_counter()
+        for _ in range(reps):
+            dst.copy_(src)
+        _synchronize(device)
+        bandwidth = 2 * numel * src.element_size() * reps / (time.perf_counter() - start)
+    return flops / bandwidth
+
+
+class ComputeHotLayers(ProfilerFunction):
+    """
+    Rank the leaf modules of the model by their exclusive time (see :class:`~ComputeLayerwiseTime`) in a
+    :class:`~HotLayersReport` with their MACs, the bytes they move (their weights, inputs and outputs) and
+    a roofline classification: a layer is compute-bound if its arithmetic intensity (FLOPs per byte) is over
+    the machine balance of the device, memory-bound otherwise.
+
+    The machine balance is measured on `device` with :func:`~measure_machine_balance` unless
+    `machine_balance` (FLOPs per byte) is given.
+    """
+
+    def __init__(self, machine_balance=None, runs=10, dry_runs=2, copy_model=True):
+        super().__init__()
+        self.machine_balance = machine_balance
+        self.runs = runs
+        self.dry_runs = dry_runs
+        self.copy_model = copy_model
 
-        type(temp_model).__call__ = og_call
+    def get_bounded_status_keys(self):
+        return HotLayers()
 
-        # execution_time = fp_time * 1000
-        execution_time = aggregator.get() / batch_size
-        if device == Device.CPU:
-            execution_time *= 1000
-        return execution_time
+    def __call__(self, model, data_splits, split='train', batch_size=1, device=Device.CPU):
+        forward_pass = data_splits[split].forward_pass
+        costs = self._count_leaf_costs(model, forward_pass, batch_size, device)
+        timings = ComputeLayerwiseTime(runs=self.runs, dry_runs=self.dry_runs, copy_model=self.copy_model)(
+            model, data_splits, split=split, batch_size=batch_size, device=device)
+        times = {r.name: r.exclusive_time for r in timings.iter_records()}
+
+        rows = [dict(cost, name=name, time=times.get(name, 0.)) for name, cost in costs.items()]
+        machine_balance = self.machine_balance
+        if machine_balance is None:
+            machine_balance = measure_machine_balance(device)
+        return HotLayersReport(rows, machine_balance)
+
+    def _count_leaf_costs(self, model, forward_pass, batch_size, device):
+        # leaf module qualified name -> {'type', 'macs', 'bytes'}, in order of first call
+        costs = OrderedDict()
+
+        def tensors_size(tensors):
+            if isinstance(tensors, torch.Tensor):
+                return tensors.numel() * tensors.element_size()
+            if isinstance(tensors, (list, tuple)):
+                return sum(tensors_size(t) for t in tensors)
+            if isinstance(tensors, dict):
+                return sum(tensors_size(t) for t in tensors.values())
+            return 0
+
+        def pre_hook(name, module, inputs):
+            if name not in costs:
+                weights = list(module.parameters(recurse=False)) + list(module.buffers(recurse=False))
+                costs[name] = {'type': type(module).__name__, 'macs': 0,
+                               'bytes': flops_counter.get_tensors_size(weights)}
+            costs[name]['bytes'] += tensors_size(inputs)
+
+        def hook(name, module, inputs, outputs):
+            costs[name]['bytes'] += tensors_size(outputs)
+
+        with model_for_profiling(model, device, self.copy_model) as temp_model, torch.no_grad():
+            flops_model = flops_counter.add_flops_counting_methods(temp_model)
+            handles = []
+            try:
+                flops_model.start_flops_count(ost=sys.stdout, verbose=False, ignore_list=[])
+                for name, module in temp_model.named_modules():
+                    if not any(True for _ in module.children()):
+                        handles.append(module.register_forward_pre_hook(partial(pre_hook, name)))
+                        handles.append(module.register_forward_hook(partial(hook, name)))
+                t0 = time.perf_counter()
+                forward_pass.random_perform(flops_model, batch_size=batch_size, device=device)
+                for name, module in temp_model.named_modules():
+                    if name in costs and hasattr(module, '__hook_variables__'):
+                        costs[name]['macs'] = int(module.__hook_variables__.mac)
+                # also resets the counters of ptflops
+                flops_model.compute_average_flops_cost("", t0)
+            finally:
+                for handle in handles:
+                    handle.remove()
+                flops_counter.remove_flops_counting_methods(flops_model)
+        return costs
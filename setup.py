@@ -65,6 +65,7 @@ EXTRAS_REQUIRE = {
     'torch': [TORCH_RANGE, "ptflops==0.6.2"],
     'tf-gpu': ["tensorflow-gpu==1.14; python_version <= '3.7.10'"],
     'tf': ["tensorflow==1.14; python_version <= '3.7.10'"],
+    'parquet': ["pyarrow"],
     'all': [TORCH_RANGE, "ptflops==0.6.2", "tensorflow==1.14; python_version <= '3.7.10'"],
     'all-gpu': [TORCH_RANGE, "ptflops==0.6.2", "tensorflow-gpu==1.14; python_version <= '3.7.10'"],
 }
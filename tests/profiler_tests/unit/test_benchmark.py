@@ -0,0 +1,45 @@
+import pytest
+import numpy as np
+from tests.profiler_tests.unit import BaseUnitTest
+
+from deeplite.profiler.benchmark import run_benchmark, latency_statistics, benchmark_status_values
+
+
+class TestBenchmark(BaseUnitTest):
+    def test_latency_statistics(self):
+        stats = latency_statistics([1.] * 98 + [1.5, 100.])
+        assert stats['p50'] == 1.
+        assert stats['min'] == 1.
+        assert stats['outliers'] == 2
+        assert stats['steps'] == 100
+        assert stats['p99'] > stats['p90']
+        assert latency_statistics([3.])['std'] == 0.
+
+    def test_run_benchmark(self):
+        steps = []
+
+        def step():
+            steps.append(1)
+            return 2.
+
+        stats = run_benchmark(step, min_steps=10)
+        assert stats['converged']
+        assert stats['steps'] == 10
+        assert stats['mean'] == 2.
+        # constant timings stabilize right after the warmup window
+        assert len(steps) == 15
+
+        rng = np.random.RandomState(0)
+        stats = run_benchmark(lambda: rng.lognormal(0, 1), max_steps=50)
+        assert not stats['converged']
+        assert stats['steps'] == 50
+
+        with pytest.raises(ValueError):
+            run_benchmark(step, confidence=0.5)
+
+    def test_status_values(self):
+        stats = latency_statistics([1., 2., 3.])
+        rval = benchmark_status_values(stats, scale=1000)
+        assert rval['execution_time'] == 2000
+        assert rval['execution_time_min'] == 1000
+        assert rval['execution_time_outliers'] == 0
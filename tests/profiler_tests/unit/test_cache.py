@@ -0,0 +1,126 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from tests.profiler_tests.unit import BaseUnitTest
+from unittest import mock
+
+from deeplite.profiler.cache import StatusCache
+from deeplite.profiler.profiler import Profiler, ProfilerFunction, ComputeEvalMetric
+from deeplite.profiler.metrics import *
+
+
+class TestStatusCache(BaseUnitTest):
+    def test_put_get(self, tmp_path):
+        cache = StatusCache(str(tmp_path / 'cache.sqlite'))
+        key = cache.make_key('a', 'b')
+        assert key != cache.make_key('ab')
+        assert cache.get(key) is None
+        cache.put(key, {'flops': 1.5})
+        assert key in cache
+        assert cache.get(key) == {'flops': 1.5}
+
+        # persisted on disk
+        assert StatusCache(cache.path).get(key) == {'flops': 1.5}
+
+        cache.put('lambda', lambda x: x)
+        assert 'lambda' not in cache
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_lru_eviction(self, tmp_path):
+        cache = StatusCache(str(tmp_path / 'cache.sqlite'), max_size=250)
+        cache.put('a', b'a' * 100)
+        cache.put('b', b'b' * 100)
+        # 'a' becomes the most recently used
+        cache.get('a')
+        cache.put('c', b'c' * 100)
+        assert 'a' in cache and 'c' in cache
+        assert 'b' not in cache
+        cache.put('too_big', b'x' * 1000)
+        assert 'too_big' not in cache
+
+    def test_profiler_cache(self, tmp_path):
+        cache = StatusCache(str(tmp_path / 'cache.sqlite'))
+        func = CountingProfilerFunction()
+        CountingProfilerFunction.ncalls = 0
+        profiler = FingerprintProfiler('model_1', status_cache=cache)
+        profiler.register_profiler_function(func)
+        assert profiler.compute_network_status(dummy_arg=2)['flops'] == 2
+        assert func.ncalls == 1
+
+        # a new profiler on an identical model hits the cache
+        profiler = FingerprintProfiler('model_1', status_cache=cache)
+        profiler.register_profiler_function(func)
+        assert profiler.compute_status('flops', dummy_arg=2) == 2
+        assert func.ncalls == 1
+
+        # different keywords, model or function configuration miss the cache
+        profiler.compute_status('flops', recompute=True, dummy_arg=3)
+        assert func.ncalls == 2
+        profiler.clone(model='model_2').compute_network_status(dummy_arg=2)
+        assert func.ncalls == 3
+        func.offset = 1
+        assert profiler.compute_status('flops', recompute=True, dummy_arg=2) == 3
+        assert func.ncalls == 4
+
+        # recompute bypasses the cache but still updates it
+        assert profiler.compute_status('flops', recompute=True, dummy_arg=2) == 3
+        assert func.ncalls == 5
+        profiler.reset_status()
+        assert profiler.compute_status('flops', dummy_arg=2) == 3
+        assert func.ncalls == 5
+
+        # the concurrent path goes through the cache as well
+        profiler.reset_status()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            assert profiler.compute_network_status(executor=executor, dummy_arg=4)['flops'] == 5
+            assert func.ncalls == 6
+            profiler.reset_status()
+            assert profiler.compute_network_status(executor=executor, dummy_arg=4)['flops'] == 5
+            assert func.ncalls == 6
+            assert profiler.compute_network_status(executor=executor, recompute=True, dummy_arg=4)['flops'] == 5
+            assert func.ncalls == 7
+
+    def test_call_fingerprint(self):
+        def eval_func(model, loader, topk=(1, 5)):
+            return 1
+        pf = ComputeEvalMetric(eval_func)
+        assert pf.get_call_fingerprint({}) == pf.get_call_fingerprint({'topk': (1, 5), 'other': 1})
+        assert pf.get_call_fingerprint({}) != pf.get_call_fingerprint({'topk': (1,)})
+        assert pf.get_call_fingerprint({}) != pf.get_call_fingerprint({'split': 'train'})
+
+        profiler = Profiler.__new__(FingerprintProfiler)
+        Profiler.__init__(profiler, None, None)
+        with pytest.raises(NotImplementedError):
+            Profiler.model_fingerprint(profiler)
+
+
+class CountingProfilerFunction(ProfilerFunction):
+    # class level so that it is shared with the deepcopies made by Profiler.clone
+    ncalls = 0
+
+    def __init__(self):
+        super().__init__()
+        self.offset = 0
+
+    def get_bounded_status_keys(self):
+        return Flops()
+
+    def __call__(self, model, data_splits, dummy_arg=1):
+        CountingProfilerFunction.ncalls += 1
+        return dummy_arg + self.offset
+
+
+class FingerprintProfiler(Profiler):
+    def __init__(self, model, data_splits=None, **kwargs):
+        super().__init__(model, {} if data_splits is None else data_splits, **kwargs)
+
+    @classmethod
+    def dl_cls(cls):
+        return mock.MagicMock()
+
+    @classmethod
+    def fp_cls(cls):
+        return mock.MagicMock()
+
+    def model_fingerprint(self):
+        return self.model
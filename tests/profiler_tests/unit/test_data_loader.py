@@ -1,7 +1,9 @@
+import gc
 import pytest
 import numpy as np
 from unittest import mock
-from deeplite.profiler.data_loader import DataLoader, ModelInputPattern, TensorSampler, ForwardPass
+from deeplite.profiler.data_loader import DataLoader, ModelInputPattern, TensorSampler, ForwardPass, \
+    _PrefetchIterator
 from tests.profiler_tests.unit import BaseUnitTest
 
 class TestDataLoader(BaseUnitTest):
@@ -21,6 +23,74 @@ class TestDataLoader(BaseUnitTest):
         with pytest.raises(TypeError):
             defaultDL.sample_random_forward(model, 1, None)
 
+    def test_pickle_loader(self):
+        import pickle
+        defaultDL = DefaultDL([np.array([1]), np.array([2])], NumpyForwardPass(model_input_pattern=(0,)))
+        next(iter(defaultDL))
+        loaded = pickle.loads(pickle.dumps(defaultDL))
+        assert [x.tolist() for x in loaded] == [[1], [2]]
+
+        loaded = pickle.loads(pickle.dumps(StateDL([np.array([3])])))
+        assert next(loaded).tolist() == [3]
+
+    def test_task_copy(self):
+        defaultDL = DefaultDL([np.array([1]), np.array([2])], NumpyForwardPass(model_input_pattern=(0,),
+                                                                              reuse_random_inputs=True))
+        x = defaultDL.forward_pass.create_random_model_inputs(2)
+        next(iter(defaultDL))
+        copied = defaultDL.task_copy()
+        assert copied.native_dl is defaultDL.native_dl
+        assert copied.forward_pass is not defaultDL.forward_pass
+        assert copied.forward_pass._tensor_sampler is not defaultDL.forward_pass._tensor_sampler
+        # the random inputs are not shared and the iteration starts over
+        assert copied.forward_pass.create_random_model_inputs(2)[0] is not x[0]
+        assert [x.tolist() for x in copied] == [[1], [2]]
+        assert next(defaultDL).tolist() == [2]
+
+        stateDL = StateDL([np.array([3])])
+        copied = stateDL.task_copy()
+        assert copied.native_dl is not stateDL.native_dl and next(copied).tolist() == [3]
+
+    def test_prefetch_loader(self):
+        import pickle
+        defaultDL = DefaultDL([np.array([i]) for i in range(5)], NumpyForwardPass(model_input_pattern=(0,)))
+        prefetchDL = defaultDL.prefetch(num_batches=2, convert=times_ten)
+        assert prefetchDL.forward_pass is defaultDL.forward_pass
+        assert len(prefetchDL) == 5 and prefetchDL.batch_size == 1
+        # nothing is read before the first batch is requested
+        assert prefetchDL.dl_iter._thread is None
+        assert [x.tolist() for x in prefetchDL] == [[0], [10], [20], [30], [40]]
+
+        # stopping early then iterating again restarts from the first batch
+        assert next(iter(prefetchDL)).tolist() == [0]
+        assert [x.tolist() for x in prefetchDL][0] == [0]
+        prefetchDL.close()
+
+        loaded = pickle.loads(pickle.dumps(prefetchDL))
+        assert [x.tolist() for x in loaded] == [[0], [10], [20], [30], [40]]
+
+        # an abandoned iteration does not leave its thread blocked on the full queue
+        iterator = iter(prefetchDL)
+        next(iterator)
+        thread = prefetchDL.dl_iter._thread
+        prefetchDL.sample_forward(mock.MagicMock())
+        assert not thread.is_alive() and not prefetchDL.dl_iter._thread.is_alive()
+
+        iterator = _PrefetchIterator(iter(range(100)), 1, None)
+        assert next(iterator) == 0
+        thread = iterator._thread
+        del iterator
+        gc.collect()
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+
+        def fail(x):
+            raise KeyError(x.tolist())
+        with pytest.raises(KeyError):
+            list(defaultDL.prefetch(convert=fail))
+        with pytest.raises(ValueError):
+            defaultDL.prefetch(num_batches=0)
+
     def test_valid_pattern(self):
         p = ('_', 1, 2, '_', 0)
         mip = ModelInputPattern(p)
@@ -85,6 +155,27 @@ class TestDataLoader(BaseUnitTest):
         shapes = fp.get_model_input_shapes()
         assert all(shp == (2,) for shp in shapes)
 
+    def test_reuse_random_inputs(self):
+        import pickle
+        sample = (np.array([1, 2]), np.array([[2], [1]]),)
+        fp = NumpyForwardPass(model_input_pattern=(0, 1), expecting_common_inputs=True, reuse_random_inputs=True)
+        fp.infer_sampler(sample)
+        x, y = fp.random_perform(None, 3, None), fp.random_perform(None, 3, None)
+        assert all(a is b for a, b in zip(x, y))
+        assert fp.random_perform(None, 4, None)[0].shape == (4, 2)
+        assert len(fp._tensor_sampler._random_buffers) == 4
+        assert pickle.loads(pickle.dumps(fp._tensor_sampler))._random_buffers == {}
+
+        fp._tensor_sampler.clear_random_buffers()
+        assert fp.random_perform(None, 3, None)[0] is not x[0]
+
+        # inputs of the same shape and dtype do not share their buffer
+        fp.infer_sampler((np.array([1, 2]), np.array([3, 4])))
+        x, y = fp.random_perform(None, 3, None), fp.random_perform(None, 3, None)
+        assert x[0] is not x[1] and x[0] is y[0] and x[1] is y[1]
+        fp.reuse_random_inputs = False
+        assert fp.random_perform(None, 3, None)[0] is not fp.random_perform(None, 3, None)[0]
+
     def test_user_defined_pass(self):
         # use the 'simple' pass but without a mip, it does not provide an implementation and raises
         with pytest.raises(TypeError):
@@ -130,6 +221,10 @@ class TestDataLoader(BaseUnitTest):
         assert fp._tensor_sampler is None
 
 
+def times_ten(x):
+    return x * 10
+
+
 class DefaultDL(DataLoader):
     def dump_native_info(self):
         return
@@ -148,6 +243,15 @@ class DefaultDL(DataLoader):
         return 1
 
 
+class StateDL(DefaultDL):
+    def dump_native_info(self):
+        return [x.tolist() for x in self.native_dl]
+
+    def load_native_info(self, native_state):
+        self.native_dl = [np.array(x) for x in native_state]
+        return self
+
+
 class NumpyForwardPass(ForwardPass):
     def model_call(self, model, x, device):
         return x
@@ -0,0 +1,75 @@
+import pytest
+from tests.profiler_tests.unit import BaseUnitTest
+
+from deeplite.profiler.layerwise import LayerwiseTable, LayerRecord, HotLayersReport
+
+
+class TestLayerwiseTable(BaseUnitTest):
+    def test_records(self):
+        table = LayerwiseTable()
+        assert not table and len(table) == 0
+        table.append({'name': 'Linear-1', 'type': 'Linear', 'params': 1234, 'time': 0.5})
+        table.append(LayerRecord(name='ReLU-2', type='ReLU', macs=10))
+        assert table and len(table) == 2
+
+        record = next(iter(table))
+        assert isinstance(record, LayerRecord)
+        assert record.name == 'Linear-1' and record['output_shape'] is None and record.macs is None
+        assert set(record.to_dict()) == set(LayerwiseTable.COLUMNS)
+        types = LayerwiseTable.column_types()
+        assert tuple(types) == LayerwiseTable.COLUMNS
+        assert types['name'] is str and types['output_shape'] is list
+        assert types['macs'] is int and types['time'] is float
+        assert table.record(-1) == LayerRecord(name='ReLU-2', type='ReLU', macs=10)
+        assert table.column('params') == [1234, None]
+        assert table == LayerwiseTable([{'name': 'Linear-1', 'type': 'Linear', 'params': 1234, 'time': 0.5},
+                                        {'name': 'ReLU-2', 'type': 'ReLU', 'macs': 10}])
+
+        with pytest.raises(ValueError):
+            table.append({'flops': 1})
+        with pytest.raises(ValueError):
+            LayerRecord(flops=1)
+        with pytest.raises(IndexError):
+            table.record(2)
+        with pytest.raises(KeyError):
+            table.column('flops')
+
+    def test_queries(self):
+        table = LayerwiseTable([{'name': 'Conv2d-1', 'type': 'Conv2d', 'macs': 100},
+                                {'name': 'ReLU-2', 'type': 'ReLU', 'macs': 10},
+                                {'name': 'Conv2d-3', 'type': 'Conv2d', 'macs': 300},
+                                {'name': 'Flatten-4', 'type': 'Flatten'}])
+        assert table.filter(type='Conv2d').column('name') == ['Conv2d-1', 'Conv2d-3']
+        assert table.filter(lambda r: r.macs is not None and r.macs < 200).column('name') == ['Conv2d-1', 'ReLU-2']
+        assert table.sort_by('macs').column('macs') == [300, 100, 10, None]
+        assert table.sort_by('macs', descending=False).column('macs') == [10, 100, 300, None]
+        assert table.top_k(2).column('name') == ['Conv2d-3', 'Conv2d-1']
+
+    def test_str(self):
+        table = LayerwiseTable([{'name': 'Linear-1', 'weight_shape': [2, 3], 'output_shape': [[1, 2]],
+                                 'activation_bytes': 8, 'params': 1234, 'time': 0.5}], model_name='net')
+        lines = str(table).split("\n")
+        assert lines[0] == ''
+        assert lines[2].split() == ['Layer', '(net)', 'Weight', 'Shape', 'Bias', 'Shape', 'Output', 'Shape',
+                                    'ActivationSize', '(Bytes)', '#', 'Params', 'Time', '(ms)']
+        assert lines[4].split() == ['Linear-1', '[2,', '3]', 'None', '[[1,', '2]]', '8', '1,234', '0.5000']
+        assert len(lines) == 6
+
+
+class TestHotLayersReport(BaseUnitTest):
+    def test_report(self):
+        report = HotLayersReport([{'name': 'a', 'type': 'ReLU', 'time': 1., 'macs': 10, 'bytes': 80},
+                                  {'name': 'b', 'type': 'Conv2d', 'time': 6., 'macs': 900, 'bytes': 100},
+                                  {'name': 'c', 'type': 'Linear', 'time': 3., 'macs': 90, 'bytes': 20}],
+                                 machine_balance=5.)
+        assert [row['name'] for row in report] == ['b', 'c', 'a']
+        assert [row['cumulative_time_share'] for row in report] == pytest.approx([.6, .9, 1.])
+        assert report.rows[0]['mac_share'] == .9 and report.rows[0]['bytes_share'] == .5
+        assert [row['arithmetic_intensity'] for row in report] == [18., 9., .25]
+        assert [row['bound'] for row in report] == ['compute', 'compute', 'memory']
+        assert [row['name'] for row in report.pareto(.8)] == ['b', 'c']
+        assert len(report.pareto(1.1)) == len(report) == 3
+        assert len(str(report).split("\n")) == 9
+        types = HotLayersReport.column_types()
+        assert tuple(types) == HotLayersReport.COLUMNS
+        assert types['bound'] is str and types['macs'] is int and types['time_share'] is float
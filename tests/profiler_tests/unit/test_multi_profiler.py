@@ -0,0 +1,99 @@
+import pytest
+from tests.profiler_tests.unit import BaseUnitTest
+from tests.profiler_tests.unit.test_profiler import DummyProfiler, DummyFlopsProfilerFunction, \
+    DummySizeProfilerFunction
+
+from deeplite.profiler import MultiProfiler, ComputeEvalMetric, compare_profilers
+from deeplite.profiler.formatter import make_n_models_summary_str
+
+
+class CountingLoader:
+    def __init__(self, batches, fail_at=None):
+        self.batches = batches
+        self.fail_at = fail_at
+        self.iterations = 0
+        self.batch_size = 2
+
+    def __iter__(self):
+        self.iterations += 1
+        for i, batch in enumerate(self.batches):
+            if i == self.fail_at:
+                raise IOError("corrupted batch")
+            yield batch
+
+    def __len__(self):
+        return len(self.batches)
+
+
+def weighted_sum(model, data_loader):
+    assert data_loader.batch_size == 2
+    return sum(model * x for x, _ in data_loader) / len(data_loader)
+
+
+def first_batch(model, data_loader):
+    for x, _ in data_loader:
+        return model * x
+
+
+class TestMultiProfiler(BaseUnitTest):
+    def get_multi_profiler(self, eval_func, loader, models=(1, 2, 3)):
+        profiler = DummyProfiler(None, {'test': loader})
+        profiler.register_profiler_function(ComputeEvalMetric(eval_func))
+        profiler.register_profiler_function(DummyFlopsProfilerFunction())
+        return MultiProfiler(profiler, models, names=['a', 'b', 'c'][:len(models)])
+
+    def test_shared_pass(self):
+        loader = CountingLoader([(i, None) for i in range(10)])
+        multi = self.get_multi_profiler(weighted_sum, loader)
+        rval = multi.compute_network_status(dummy_arg=7)
+        assert loader.iterations == 1
+        assert list(rval.keys()) == ['a', 'b', 'c']
+        assert [s['eval_metric'] for s in rval.values()] == [4.5, 9., 13.5]
+        assert all(s['flops'] == 7 and s['inference_time'] is not None for s in rval.values())
+
+        # already computed
+        multi.compute_network_status()
+        assert loader.iterations == 1
+        multi.compute_network_status(recompute=True)
+        assert loader.iterations == 2
+
+    def test_early_stop_and_errors(self):
+        loader = CountingLoader([(i, None) for i in range(1, 20)])
+        multi = self.get_multi_profiler(first_batch, loader, models=(1, 2))
+        rval = multi.compute_network_status()
+        assert [s['eval_metric'] for s in rval.values()] == [1, 2]
+
+        loader = CountingLoader([(i, None) for i in range(10)], fail_at=3)
+        multi = self.get_multi_profiler(weighted_sum, loader)
+        with pytest.raises(IOError):
+            multi.compute_network_status()
+
+        with pytest.raises(ValueError):
+            MultiProfiler(DummyProfiler(None, {}), [1, 2], names=['a'])
+
+    def test_display_status(self):
+        multi = self.get_multi_profiler(weighted_sum, CountingLoader([(1, None)]), models=(1, 2))
+        multi.compute_network_status(print_mode='info', short_print=False)
+        status_dicts = [p.display_status_dict()[0] for p in multi]
+        summary = make_n_models_summary_str(status_dicts)
+        assert 'Value (a)' in summary and 'Value (b)' in summary
+        del status_dicts[1]['eval_metric']
+        assert '<NotComputed>' in make_n_models_summary_str(status_dicts)
+
+    def test_compare(self):
+        multi = self.get_multi_profiler(weighted_sum, CountingLoader([(1, None), (3, None)]))
+        multi.profilers[2].register_profiler_function(DummySizeProfilerFunction())
+        rval = multi.compare(baseline='b', short_print=False)
+        assert list(rval.keys()) == ['eval_metric', 'inference_time', 'flops']
+        assert rval['eval_metric']['a'] == {'value': 2., 'relative': 2.}
+        assert rval['eval_metric']['c']['relative'] == -2.
+        assert rval['flops']['b'] == {'value': 1, 'relative': 1.}
+
+        # already computed status are reused, the baseline decides the rows
+        rval = compare_profilers(multi.profilers[::-1], print_mode=None)
+        assert 'model_size' in rval and rval['model_size']['a'] == {'value': None, 'relative': None}
+
+        with pytest.raises(ValueError):
+            compare_profilers(multi.profilers, baseline='d')
+        with pytest.raises(ValueError):
+            compare_profilers([multi.profilers[0]] * 2)
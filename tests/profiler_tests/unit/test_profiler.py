@@ -30,6 +30,113 @@ class TestProfiler(BaseUnitTest):
         rval = profiler.compute_network_status(recompute=True)
         assert rval['flops'] == 1
 
+    def test_compute_network_status_executor(self):
+        from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+        profiler = get_profiler()
+        profiler.register_profiler_function(DummyFlopsProfilerFunction())
+        profiler.register_profiler_function(DummySizeProfilerFunction())
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            rval = profiler.compute_network_status(executor=executor, dummy_arg=3)
+        assert rval == {'flops': 3, 'model_size': 5, 'memory_footprint': 6}
+
+        # the thread tasks get their own copy of the model unless they copy it themselves, the functions
+        # instrumenting it in place run after them on the model itself
+        models = []
+        profiler = DummyProfiler([], {'train': None})
+        profiler.register_profiler_function(DummyInPlaceProfilerFunction(models))
+        profiler.register_profiler_function(DummySizeProfilerFunction())
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            profiler.compute_network_status(executor=executor)
+        assert profiler.model == [] and profiler.status_get('flops') == 1 and models[0] is not profiler.model
+
+        for copy_model in (True, False):
+            models.clear()
+            profiler.reset_status()
+            profiler.register_profiler_function(DummyInPlaceProfilerFunction(models, copy_model=copy_model))
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                profiler.compute_network_status(executor=executor)
+            assert models[0] is profiler.model and profiler.status_get('flops') == 1
+            assert profiler.model == ([] if copy_model else ['hook'])
+
+        # a process pool needs everything picklable
+        profiler = DummyProfiler(None, {'train': None})
+        profiler.register_profiler_function(DummyFlopsProfilerFunction())
+        profiler.register_profiler_function(DummySizeProfilerFunction())
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            rval = profiler.compute_network_status(executor=executor)
+            assert rval == {'flops': 1, 'model_size': 5, 'memory_footprint': 6}
+            # nothing left to compute, the executor is not used
+            rval = profiler.compute_network_status(executor=executor)
+            assert rval['flops'] == 1
+
+    def test_export_status(self, tmp_path):
+        import json
+        import numpy as np
+        profiler = get_profiler()
+        profiler.register_profiler_function(DummySizeProfilerFunction())
+        profiler.register_profiler_function(DummyLayerwiseProfilerFunction())
+        profiler.compute_network_status()
+        profiler.register_profiler_function(DummyFlopsProfilerFunction())
+        profiler.compute_status('flops', dummy_arg=np.float32(2))
+
+        path = str(tmp_path / 'status.jsonl')
+        profiler.export_status(path)
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        assert lines[0] == {'record': 'status', 'name': profiler.name, 'backend': profiler.backend,
+                            'status': {'model_size': 5, 'memory_footprint': 6, 'flops': 2.}}
+        assert [line['name'] for line in lines[1:]] == ['Conv2d-1', 'ReLU-2']
+        assert lines[1]['status_key'] == 'layerwise_summary' and lines[1]['output_shape'] == [[1, 2, 4, 4]]
+        assert lines[2]['macs'] == 32 and lines[2]['weight_shape'] is None
+
+        with pytest.raises(ValueError):
+            profiler.export_status(path, fmt='csv')
+
+    def test_export_status_parquet(self, tmp_path):
+        pq = pytest.importorskip('pyarrow.parquet')
+        profiler = get_profiler()
+        profiler.register_profiler_function(DummySizeProfilerFunction())
+        profiler.register_profiler_function(DummyLayerwiseProfilerFunction())
+        profiler.compute_network_status()
+        profiler.export_status(str(tmp_path / 'status.parquet'), fmt='parquet')
+        assert pq.read_table(str(tmp_path / 'status.parquet')).to_pylist()[0]['model_size'] == 5
+        table = pq.read_table(str(tmp_path / 'status.layers.parquet'))
+        types = {field.name: str(field.type) for field in table.schema}
+        assert types['layer'] == types['type'] == types['output_shape'] == 'string'
+        assert types['macs'] == types['params'] == 'int64' and types['time'] == 'double'
+        layers = table.to_pylist()
+        assert [layer['layer'] for layer in layers] == ['Conv2d-1', 'ReLU-2']
+        assert layers[0]['output_shape'] == '[[1, 2, 4, 4]]' and layers[1]['weight_shape'] is None
+        assert layers[0]['macs'] == 288 and layers[1]['time'] == 0.1 and layers[1]['depth'] is None
+
+    def test_export_hot_layers(self, tmp_path):
+        import json
+        profiler = get_profiler()
+        profiler.register_profiler_function(DummyHotLayersProfilerFunction())
+        profiler.compute_network_status()
+
+        path = str(tmp_path / 'status.jsonl')
+        profiler.export_status(path)
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        assert 'hot_layers' not in lines[0]['status']
+        assert [line['record'] for line in lines[1:]] == ['hot_layer', 'hot_layer']
+        assert lines[1] == {'record': 'hot_layer', 'status_key': 'hot_layers', 'rank': 0, 'machine_balance': 5.,
+                            'name': 'conv', 'type': 'Conv2d', 'time': 3., 'time_share': .75,
+                            'cumulative_time_share': .75, 'macs': 900, 'mac_share': .9, 'bytes': 100,
+                            'bytes_share': .5, 'arithmetic_intensity': 18., 'bound': 'compute'}
+        assert lines[2]['name'] == 'relu' and lines[2]['rank'] == 1 and lines[2]['bound'] == 'memory'
+
+        pq = pytest.importorskip('pyarrow.parquet')
+        profiler.export_status(str(tmp_path / 'status.parquet'), fmt='parquet')
+        table = pq.read_table(str(tmp_path / 'status.hot_layers.parquet'))
+        types = {field.name: str(field.type) for field in table.schema}
+        assert types['layer'] == types['bound'] == 'string' and types['macs'] == types['rank'] == 'int64'
+        assert types['time'] == types['arithmetic_intensity'] == 'double'
+        rows = table.to_pylist()
+        assert [row['layer'] for row in rows] == ['conv', 'relu']
+        assert rows[1]['cumulative_time_share'] == 1. and rows[1]['status_key'] == 'hot_layers'
+
     def test_register_profiler_function(self):
         profiler = get_profiler()
         flops_func = DummyFlopsProfilerFunction()
@@ -73,6 +180,56 @@ class DummyFlopsProfilerFunction(ProfilerFunction):
         return dummy_arg
 
 
+class DummySizeProfilerFunction(ProfilerFunction):
+    def get_bounded_status_keys(self):
+        return ModelSize(), MemoryFootprint()
+
+    def __call__(self, model, data_splits):
+        return {'model_size': 5, 'memory_footprint': 6}
+
+
+class DummyLayerwiseProfilerFunction(ProfilerFunction):
+    def get_bounded_status_keys(self):
+        return LayerwiseSummary()
+
+    def __call__(self, model, data_splits):
+        from deeplite.profiler.layerwise import LayerwiseTable
+        return LayerwiseTable([
+            {'name': 'Conv2d-1', 'type': 'Conv2d', 'output_shape': [[1, 2, 4, 4]], 'weight_shape': [2, 1, 3, 3],
+             'macs': 288, 'params': 18, 'activations': 32, 'activation_bytes': 128, 'time': 0.5},
+            {'name': 'ReLU-2', 'type': 'ReLU', 'output_shape': [[1, 2, 4, 4]], 'macs': 32, 'params': 0,
+             'activations': 32, 'activation_bytes': 128, 'time': 0.1}])
+
+
+class DummyInPlaceProfilerFunction(ProfilerFunction):
+    def __init__(self, models, copy_model=None):
+        super().__init__()
+        self.models = models
+        if copy_model is not None:
+            self.copy_model = copy_model
+
+    def get_bounded_status_keys(self):
+        return Flops()
+
+    def __call__(self, model, data_splits):
+        self.models.append(model)
+        if getattr(self, 'copy_model', False):
+            model = list(model)
+        model.append('hook')
+        return len(model)
+
+
+class DummyHotLayersProfilerFunction(ProfilerFunction):
+    def get_bounded_status_keys(self):
+        return HotLayers()
+
+    def __call__(self, model, data_splits):
+        from deeplite.profiler.layerwise import HotLayersReport
+        return HotLayersReport([{'name': 'relu', 'type': 'ReLU', 'time': 1., 'macs': 100, 'bytes': 100},
+                                {'name': 'conv', 'type': 'Conv2d', 'time': 3., 'macs': 900, 'bytes': 100}],
+                               machine_balance=5.)
+
+
 class DummyProfilerFunction(ProfilerFunction):
     def get_bounded_status_keys(self):
         return Flops()
@@ -0,0 +1,40 @@
+import pytest
+from tests.profiler_tests.unit import BaseUnitTest
+from unittest import mock
+
+from deeplite.profiler.utils import PeakRSSSampler, current_rss, SumAggregator, SampleMeanAggregator
+
+
+class TestUtils(BaseUnitTest):
+    def test_peak_rss_sampler(self):
+        with PeakRSSSampler() as sampler:
+            buf = bytearray(32 * 1024 ** 2)
+            buf[::4096] = b'x' * len(buf[::4096])
+        assert sampler.peak >= sampler.baseline
+        assert sampler.peak_increase >= 0
+        assert current_rss() > 0
+
+        with mock.patch('deeplite.profiler.utils.current_rss', return_value=None):
+            with PeakRSSSampler() as sampler:
+                pass
+        assert sampler.peak is None
+        assert sampler.peak_increase is None
+
+    def test_streaming_aggregators(self):
+        import numpy as np
+        mean = SampleMeanAggregator()
+        assert mean.get() == 0
+        # a ragged last batch weighs its number of samples
+        mean.update(np.float32(4.), 4)
+        mean.update(np.float32(3.), 1)
+        assert mean.get() == pytest.approx(7. / 5)
+        assert mean.count == 0
+
+        mean.update(np.array([2., 4.]), 2)
+        assert mean.get() == [1., 2.]
+
+        total = SumAggregator()
+        total.update(np.array([1, 2]))
+        total.update(np.array([3, 4]))
+        assert total.get() == [4, 6]
+        assert total.get() == 0
@@ -38,3 +38,35 @@ class TestTFProfiler(BaseFunctionalTest):
         assert all(v1 == v2 for (k1, v1), (k2, v2) in zip(profiler.status_items(), profiler2.status_items())
                    if k1 not in ('layerwise_summary', 'inference_time', 'execution_time'))
 
+
+    def test_layerwise_flops(self, *args):
+        from deeplite.tf_profiler.tf_profiler import ComputeFlops, get_temp_model
+        profiler = get_profiler()
+        compute_flops = ComputeFlops()
+        dataloader = profiler.data_splits['train']
+        table = compute_flops.layerwise_flops(profiler.model, dataloader)
+        assert [r.name for r in table] == [layer.name for layer in profiler.model.layers]
+        assert table.top_k(1).record(0).type == 'Conv2D'
+        flops = compute_flops._compute_flops(profiler.model, dataloader)
+        assert flops == pytest.approx(sum(table.column('macs')) / 1e9, rel=1e-3)
+        # traced once per signature
+        assert len(compute_flops._cache) == 1
+        compute_flops._compute_flops(profiler.model, dataloader, batch_size=2)
+        assert len(compute_flops._cache) == 2
+
+        # the cache key does not read the values of the weights, which do not change the FLOPs
+        model = get_temp_model(profiler.model)
+        compute_flops._compute_flops(model, dataloader)
+        n_cached = len(compute_flops._cache)
+        model.set_weights([w * 0 for w in model.get_weights()])
+        with mock.patch('deeplite.tf_profiler.tf_profiler.model_weights_fingerprint') as fingerprint:
+            assert compute_flops._compute_flops(model, dataloader) == flops
+        assert len(compute_flops._cache) == n_cached and not fingerprint.called
+
+    def test_benchmark_execution_time(self, *args):
+        from deeplite.tf_profiler.tf_profiler import ComputeExecutionTime
+        profiler = get_profiler()
+        profiler.register_profiler_function(ComputeExecutionTime(benchmark=True, max_steps=20, max_time=5.),
+                                            override=True)
+        assert profiler.compute_status('execution_time') > 0
+        assert profiler.status_get('execution_time_p50') >= profiler.status_get('execution_time_min')
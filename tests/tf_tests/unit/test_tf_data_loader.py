@@ -21,3 +21,45 @@ class TestTFDataLoader(BaseUnitTest):
         with pytest.raises(ValueError):
             TFTensorSampler((None,))
 
+    def test_len_and_batch_size(self):
+        import tensorflow as tf
+        from deeplite.tf_profiler.tf_data_loader import TFDataLoader
+        x, y = np.random.rand(10, 3).astype(np.float32), np.arange(10)
+        dataset = tf.data.Dataset.from_tensor_slices((x, y)).batch(4)
+        dl = TFDataLoader(dataset)
+        assert len(dl) == 3 and dl.batch_size == 4
+        assert dl.dataset_size == 12
+
+        # the cardinality of a generator is unknown, the batches are counted once
+        calls = []
+
+        def gen():
+            calls.append(1)
+            for i in range(3):
+                yield np.full((2, 1), i, dtype=np.float32)
+
+        dl = TFDataLoader(tf.data.Dataset.from_generator(
+            gen, output_types=tf.float32, output_shapes=(2, 1)))
+        assert len(dl) == 3 and len(dl) == 3
+        assert len(calls) == 1
+
+        with pytest.raises(TypeError):
+            len(TFDataLoader(dataset.repeat()))
+
+    def test_tensor_sampler(self):
+        import tensorflow as tf
+        from deeplite.tf_profiler.tf_data_loader import TFTensorSampler
+        x = np.random.rand(4, 3).astype(np.float64)
+        ids, mask = tf.zeros((4, 7), dtype=tf.int32), tf.ones((4, 7), dtype=tf.bool)
+        sampler = TFTensorSampler((x, {'ids': ids, 'mask': mask}))
+        assert sampler.get_flat_shapes_tuple() == ((3,), (7,), (7,))
+
+        # the tensors are handed to the model as they are
+        x_, inputs = sampler.to_device((x, {'ids': ids, 'mask': mask}), None)
+        assert tf.is_tensor(x_) and inputs['ids'] is ids
+
+        rand_x, rand_inputs = sampler.create_random_tensors(2)
+        assert rand_x.shape == (2, 3) and rand_x.dtype == tf.float64
+        assert rand_inputs['ids'].dtype == tf.int32 and rand_inputs['mask'].dtype == tf.bool
+        assert sampler.create_random_tensors(2)[0] is rand_x
+        assert sampler.create_random_tensors(3)[0].shape == (3, 3)
@@ -37,3 +37,26 @@ class TestTFProfiler(BaseUnitTest):
         profiler.compute_status('memory_footprint', device=device, batch_size=batch_size)
 
 
+
+    def test_profiling_session(self, *args):
+        from deeplite.tf_profiler import tf_profiler
+        with tf_profiler.profiling_session():
+            cache = tf_profiler._session.weights
+            with tf_profiler.profiling_session():
+                assert tf_profiler._session.weights is cache
+            assert tf_profiler._session.weights is cache
+        assert tf_profiler._session.weights is None
+
+    def test_weights_summary(self, *args):
+        from deeplite.tf_profiler import tf_profiler
+        model = mock.MagicMock()
+        model.weights = [mock.MagicMock(), mock.MagicMock()]
+        for w, (n, size) in zip(model.weights, ((10, 4), (3, 2))):
+            w.shape.num_elements.return_value = n
+            w.dtype.size = size
+        assert tf_profiler.weights_summary(model) == (13, 46)
+        with tf_profiler.profiling_session():
+            tf_profiler.weights_summary(model)
+            model.weights = []
+            assert tf_profiler.weights_summary(model) == (13, 46)
+        assert tf_profiler.weights_summary(model) == (0, 0)
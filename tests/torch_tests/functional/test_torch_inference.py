@@ -25,3 +25,136 @@ class TestTorchInference(BaseFunctionalTest):
         eval_loss_fn = EvalLossFunction(loss_fn)
         eval_loss_fn(MODEL, DATA['test'])
 
+
+    def test_sharded_evaluation(self):
+        import torch
+        from deeplite.profiler import ComputeEvalMetric
+        from deeplite.torch_profiler.torch_inference import ShardedEvaluation, FusedEvaluation, \
+            ConfusionMatrixReducer, LossReducer, get_topk, get_accuracy
+        from deeplite.torch_profiler.torch_data_loader import TorchDataLoader
+        torch.manual_seed(0)
+        model = torch.nn.Sequential(torch.nn.Flatten(), torch.nn.Linear(12, 10))
+        dataset = torch.utils.data.TensorDataset(torch.randn(23, 3, 2, 2), torch.randint(0, 10, (23,)))
+        data_loader = torch.utils.data.DataLoader(dataset, batch_size=4)
+
+        sharded_topk = ShardedEvaluation(get_topk, num_workers=2, num_threads=1)
+        expected = get_topk(model, data_loader, topk=(1, 3))
+        rval = sharded_topk(model, TorchDataLoader(data_loader), topk=(1, 3))
+        assert rval.keys() == expected.keys()
+        assert all(rval[k] == pytest.approx(expected[k]) for k in expected)
+
+        # drop-in for ComputeEvalMetric, and a single process fallback for unshardable loaders
+        compute_eval = ComputeEvalMetric(ShardedEvaluation(get_accuracy), 'acc')
+        assert compute_eval.can_pipe()
+        rval = compute_eval.pipe_kwargs_to_call(MODEL, DATA, {'device': 'cpu'})
+        assert rval['eval_metric'] == get_accuracy(MODEL, DATA['test'])
+        assert sharded_topk._shards(23, 4, 2) == [range(0, 12), range(12, 23)]
+
+        # counts are summed across the shards
+        fused = FusedEvaluation({'confusion': ConfusionMatrixReducer(10), 'loss': LossReducer(
+            torch.nn.CrossEntropyLoss())})
+        expected = fused(model, data_loader)
+        rval = ShardedEvaluation(fused, num_workers=3, num_threads=1)(model, data_loader)
+        assert rval['confusion'] == expected['confusion'] and sum(map(sum, rval['confusion'])) == 23
+        assert rval['loss'] == pytest.approx(expected['loss'], rel=1e-5)
+
+        # a loader dropping its last batch is not sharded
+        data_loader = torch.utils.data.DataLoader(dataset, batch_size=4, drop_last=True)
+        rval = ShardedEvaluation(fused, num_workers=3)(model, data_loader)
+        assert sum(map(sum, rval['confusion'])) == 20
+
+    def test_sharded_shared_pass(self):
+        import torch
+        from deeplite.profiler import ComputeEvalMetric, MultiProfiler
+        from deeplite.torch_profiler.torch_inference import ShardedEvaluation, get_accuracy
+        from deeplite.torch_profiler.torch_profiler import TorchProfiler
+        from deeplite.torch_profiler.torch_data_loader import TorchDataLoader
+
+        class CountingDataset(torch.utils.data.TensorDataset):
+            reads = 0
+
+            def __getitem__(self, index):
+                CountingDataset.reads += 1
+                return super().__getitem__(index)
+
+        torch.manual_seed(0)
+        models = [torch.nn.Sequential(torch.nn.Flatten(), torch.nn.Linear(12, 3)) for _ in range(3)]
+        dataset = CountingDataset(torch.randn(12, 3, 2, 2), torch.randint(0, 3, (12,)))
+        data_loader = torch.utils.data.DataLoader(dataset, batch_size=4)
+        expected = [get_accuracy(model, data_loader) for model in models]
+
+        # the broadcast hides the native loader, the shards would read the dataset again for every model
+        profiler = TorchProfiler(models[0], {'test': TorchDataLoader(data_loader)})
+        profiler.register_profiler_function(ComputeEvalMetric(ShardedEvaluation(get_accuracy, num_workers=2)))
+        multi = MultiProfiler(profiler, models)
+        CountingDataset.reads = 0
+        with mock.patch('deeplite.torch_profiler.torch_inference._process_pool') as process_pool:
+            rval = multi.compute_network_status()
+        assert not process_pool.called and CountingDataset.reads == len(dataset)
+        assert [status['eval_metric'] for status in rval.values()] == pytest.approx(expected)
+
+    def test_fused_evaluation(self):
+        import torch
+        from deeplite.torch_profiler.torch_inference import FusedEvaluation, AccuracyReducer, MissclassReducer, \
+            TopkReducer, LossReducer, ConfusionMatrixReducer, get_topk, get_accuracy
+        torch.manual_seed(0)
+        model = torch.nn.Sequential(torch.nn.Flatten(), torch.nn.Linear(12, 3))
+        dataset = torch.utils.data.TensorDataset(torch.randn(12, 3, 2, 2), torch.randint(0, 3, (12,)))
+        data_loader = torch.utils.data.DataLoader(dataset, batch_size=4)
+
+        fused = FusedEvaluation({'accuracy': AccuracyReducer(), 'missclass': MissclassReducer(),
+                                 'topk': TopkReducer((1, 2)), 'loss': LossReducer(torch.nn.CrossEntropyLoss()),
+                                 'confusion': ConfusionMatrixReducer(3)})
+        calls = []
+        model.register_forward_hook(lambda *args: calls.append(1))
+        rval = fused(model, data_loader)
+        assert len(calls) == len(data_loader)
+        assert set(rval.keys()) == {'accuracy', 'missclass', 'top-1', 'top-2', 'loss', 'confusion'}
+
+        expected = get_topk(model, data_loader, topk=(1, 2))
+        assert rval['top-1'] == pytest.approx(expected['top-1'])
+        assert rval['top-2'] == pytest.approx(expected['top-2'])
+        assert rval['accuracy'] == pytest.approx(get_accuracy(model, data_loader))
+        assert rval['accuracy'] + rval['missclass'] == pytest.approx(100.)
+        with torch.no_grad():
+            x, y = dataset.tensors
+            assert rval['loss'] == pytest.approx(torch.nn.functional.cross_entropy(model(x), y).item(), rel=1e-5)
+        confusion = torch.tensor(rval['confusion'])
+        assert confusion.sum() == 12 and confusion.trace().item() == pytest.approx(12 * rval['accuracy'] / 100)
+
+        # the reducers are reset between passes and each pass feeds its own copies of them
+        assert fused(model, data_loader) == rval
+        assert fused.get_reducers()['accuracy'] is not fused.get_reducers()['accuracy']
+        assert fused.reducers['confusion'].get() == [[0] * 3] * 3
+
+        # the other fused metrics are bound as secondary status keys of the same call
+        from deeplite.profiler import ComputeEvalMetric
+        from deeplite.torch_profiler.torch_profiler import TorchProfiler
+        profiler = TorchProfiler(model, {'test': data_loader})
+        profiler.register_profiler_function(ComputeEvalMetric(fused, 'accuracy', secondary_keys=('top-2', 'loss')))
+        calls.clear()
+        status = profiler.compute_network_status()
+        assert len(calls) == len(data_loader)
+        assert status['eval_metric'] == rval['accuracy']
+        assert status['top-2'] == rval['top-2'] and status['loss'] == pytest.approx(rval['loss'])
+
+    def test_ragged_last_batch(self):
+        import torch
+        from deeplite.torch_profiler.torch_inference import get_missclass, EvalLossFunction
+        torch.manual_seed(0)
+        model = torch.nn.Sequential(torch.nn.Flatten(), torch.nn.Linear(12, 3))
+        dataset = torch.utils.data.TensorDataset(torch.randn(11, 3, 2, 2), torch.randint(0, 3, (11,)))
+        x, y = dataset.tensors
+        with torch.no_grad():
+            out = model(x)
+        expected = 100. * (out.argmax(dim=1) != y).float().mean().item()
+        for batch_size in (1, 4, 11):
+            data_loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size)
+            assert get_missclass(model, data_loader) == pytest.approx(expected)
+
+        def loss_fn(model, batch):
+            x, y = batch
+            return torch.nn.functional.cross_entropy(model(x), y)
+        loss_fn.to_device = lambda device: None
+        loss = EvalLossFunction(loss_fn)(model, torch.utils.data.DataLoader(dataset, batch_size=4))
+        assert loss == pytest.approx(torch.nn.functional.cross_entropy(out, y).item(), rel=1e-5)
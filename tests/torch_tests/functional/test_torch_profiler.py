@@ -1,6 +1,7 @@
 import pytest
 from copy import deepcopy
-from tests.torch_tests.functional import BaseFunctionalTest, TORCH_AVAILABLE, MODEL, get_profiler
+from tests.torch_tests.functional import BaseFunctionalTest, TORCH_AVAILABLE, META_DEVICE_SUPPORTED, MODEL, DATA, \
+    get_profiler
 from unittest import mock
 
 class TestTorchProfiler(BaseFunctionalTest):
@@ -75,6 +76,217 @@ class TestTorchProfiler(BaseFunctionalTest):
         assert(status['layerwise_summary'])
         assert 'inference_time' in status
 
+    def test_benchmark_execution_time(self):
+        from deeplite.profiler import Device
+        from deeplite.torch_profiler.torch_profiler import TorchProfiler, ComputeExecutionTime
+        profiler = get_profiler()
+        profiler.register_profiler_function(ComputeExecutionTime(benchmark=True, max_steps=20), override=True)
+        status = profiler.compute_network_status(batch_size=2, device=Device.CPU)
+        assert status['execution_time_min'] <= status['execution_time_p50'] <= status['execution_time_p99']
+        assert status['execution_time'] > 0
+        assert status['execution_time_outliers'] >= 0
+        profiler.display_status()
+
+    def test_throughput_sweep(self):
+        from deeplite.torch_profiler.torch_profiler import ComputeThroughputSweep
+        profiler = get_profiler()
+        profiler.register_profiler_function(ComputeThroughputSweep(max_batch_size=4, steps=2))
+        curve = profiler.compute_status('throughput_curve')
+        assert [p['batch_size'] for p in curve] == [1, 2, 4]
+        assert all(p['throughput'] > 0 and p['peak_memory'] > 0 for p in curve)
+        assert profiler.status_get('optimal_batch_size') in (1, 2, 4)
+
+        profiler.compute_status('throughput_curve', recompute=True, batch_sizes=(3, 1), latency_budget=0)
+        assert [p['batch_size'] for p in profiler.status_get('throughput_curve')] == [1, 3]
+        assert profiler.status_get('optimal_batch_size') == 0
+
+        # the peak memory of the forward passes, not of the whole process
+        curve = profiler.compute_status('throughput_curve', recompute=True, batch_sizes=(1, 64))
+        assert curve[0]['peak_memory'] < curve[1]['peak_memory'] < 100
+
+    def test_in_place_profiling(self):
+        import torch
+        from deeplite.torch_profiler.torch_profiler import TorchProfiler, ComputeComplexity, \
+            ComputeExecutionTime, ComputeThroughputSweep
+        model = deepcopy(MODEL)
+        model.train()
+        model[1].eval()
+        state_dict = deepcopy(model.state_dict())
+        og_dict = {m: dict(m.__dict__) for m in model.modules()}
+
+        profiler = TorchProfiler(model, TorchProfiler.enable_forward_pass_data_splits(DATA))
+        profiler.register_profiler_function(ComputeComplexity(copy_model=False))
+        profiler.register_profiler_function(ComputeExecutionTime(copy_model=False))
+        profiler.register_profiler_function(ComputeThroughputSweep(max_batch_size=2, steps=2, copy_model=False))
+        profiler.compute_network_status()
+
+        assert profiler.status_get('flops') == get_profiler().compute_status('flops')
+        assert profiler.status_get('execution_time') > 0
+        assert all(torch.equal(v, state_dict[k]) for k, v in model.state_dict().items())
+        assert [m.training for m in model.modules()] == [True, True, False, True, True]
+        for m in model.modules():
+            assert m.__dict__.keys() == og_dict[m].keys()
+            assert not m._forward_hooks and not m._forward_pre_hooks
+
+    @pytest.mark.skipif(not META_DEVICE_SUPPORTED, reason="No meta device in this torch release")
+    def test_static_complexity(self):
+        import torch
+        import torch.nn as nn
+        from deeplite.torch_profiler.torch_profiler import TorchProfiler, ComputeComplexity, \
+            ComputeStaticComplexity, meta_replica
+        model = nn.Sequential(deepcopy(MODEL), nn.Linear(8192, 10), nn.BatchNorm1d(10))
+        replica = meta_replica(model)
+        assert all(p.is_meta for p in replica.parameters()) and all(b.is_meta for b in replica.buffers())
+        assert not any(p.is_meta for p in model.parameters())
+
+        data_splits = TorchProfiler.enable_forward_pass_data_splits(DATA)
+        status = []
+        for function in (ComputeComplexity(), ComputeStaticComplexity()):
+            profiler = TorchProfiler(model, data_splits)
+            profiler.register_profiler_function(function)
+            status.append(profiler.compute_network_status(batch_size=2))
+        for key in ('flops', 'total_params', 'model_size', 'memory_footprint'):
+            assert status[0][key] == status[1][key]
+
+        class DataDependent(nn.Module):
+            def forward(self, x):
+                return x[x > 0]
+
+        profiler = TorchProfiler(DataDependent(), data_splits)
+        profiler.register_profiler_function(ComputeStaticComplexity())
+        with pytest.raises(RuntimeError):
+            profiler.compute_status('flops')
+
+    @pytest.mark.skipif(not META_DEVICE_SUPPORTED, reason="No meta device in this torch release")
+    def test_peak_memory(self):
+        import torch.nn as nn
+        from deeplite.torch_profiler.torch_profiler import TorchProfiler, ComputePeakMemory
+        from deeplite.profiler.utils import PeakRSSSampler
+        model = nn.Sequential(nn.Conv2d(3, 8, 3, padding=1), nn.ReLU(inplace=True), nn.Conv2d(8, 8, 3, padding=1),
+                              nn.ReLU(), nn.Flatten())
+        profiler = TorchProfiler(model, TorchProfiler.enable_forward_pass_data_splits(DATA))
+        profiler.register_profiler_function(ComputePeakMemory())
+        status = profiler.compute_network_status(batch_size=4)
+
+        # the in-place relu and the flatten view do not allocate, at most two conv outputs are alive at once
+        assert status['peak_activation_memory'] == 2 * 4 * 8 * 32 * 32 * 4 / 1024 ** 2
+        weights = sum(p.numel() for p in model.parameters()) * 4 / 1024 ** 2
+        assert status['peak_memory'] >= weights
+        profiler.display_status()
+
+        # the input (3 channels) is alive until the first conv, then its output (8) through the relu and
+        # the output of the relu (8) until the second conv, whose output (4) is the model output
+        model = nn.Sequential(nn.Conv2d(3, 8, 1), nn.ReLU(), nn.Conv2d(8, 4, 1))
+        profiler = TorchProfiler(model, TorchProfiler.enable_forward_pass_data_splits(DATA))
+        profiler.register_profiler_function(ComputePeakMemory())
+        status = profiler.compute_network_status(batch_size=2)
+        plane = 2 * 32 * 32 * 4
+        assert status['peak_activation_memory'] == max(3 + 8, 8 + 8, 8 + 4) * plane / 1024 ** 2
+
+        # the peak memory is still measured when the model cannot run on the meta device
+        class DataDependent(nn.Module):
+            def forward(self, x):
+                return x if x.sum() > 0 else -x
+
+        profiler = TorchProfiler(DataDependent(), TorchProfiler.enable_forward_pass_data_splits(DATA))
+        profiler.register_profiler_function(ComputePeakMemory())
+        with mock.patch.object(PeakRSSSampler, 'peak_increase', 1024 ** 2):
+            status = profiler.compute_network_status()
+        assert status['peak_memory'] == 1 and status['peak_activation_memory'] is None
+
+    @pytest.mark.skipif(not META_DEVICE_SUPPORTED, reason="No meta device in this torch release")
+    def test_dtype_aware_sizes(self):
+        import torch
+        from torch.utils.data import DataLoader, TensorDataset
+        from deeplite.torch_profiler.torch_profiler import TorchProfiler, ComputeStaticComplexity
+
+        def get_status(model, dtype, function):
+            x = torch.randn(1, 3, 32, 32)
+            data_splits = {'train': DataLoader(TensorDataset(x.to(dtype), x)), 'test': DataLoader(TensorDataset(x, x))}
+            profiler = TorchProfiler(model, TorchProfiler.enable_forward_pass_data_splits(data_splits))
+            profiler.register_profiler_function(function)
+            return profiler.compute_network_status()
+
+        status = get_status(deepcopy(MODEL), torch.float32, ComputeStaticComplexity())
+        half_status = get_status(deepcopy(MODEL).half(), torch.float16, ComputeStaticComplexity())
+        assert half_status['total_params'] == status['total_params']
+        assert half_status['model_size'] == status['model_size'] / 2
+        assert half_status['memory_footprint'] == status['memory_footprint'] / 2
+
+    def test_quantized_sizes(self):
+        import warnings
+        import torch
+        import torch.nn as nn
+        import torch.nn.quantized as nnq
+        from torch.utils.data import DataLoader, TensorDataset
+        from deeplite.torch_profiler.torch_profiler import TorchProfiler, ComputeComplexity
+
+        class QuantizedConv(nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.conv = nnq.Conv2d(3, 32, kernel_size=5, stride=1, padding=2)
+
+            def forward(self, x):
+                return self.conv(torch.quantize_per_tensor(x, 0.1, 0, torch.quint8))
+
+        x = torch.randn(1, 3, 32, 32)
+        data_splits = {'train': DataLoader(TensorDataset(x, x)), 'test': DataLoader(TensorDataset(x, x))}
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            profiler = TorchProfiler(QuantizedConv(), TorchProfiler.enable_forward_pass_data_splits(data_splits))
+            profiler.register_profiler_function(ComputeComplexity())
+            status = profiler.compute_network_status()
+        # int8 weights and float bias
+        assert status['total_params'] == (32 * 3 * 5 * 5 + 32) / 1e6
+        assert status['model_size'] == (32 * 3 * 5 * 5 + 32 * 4) / 1024 ** 2
+
+    def test_layerwise_time(self):
+        import torch.nn as nn
+        from deeplite.torch_profiler.torch_profiler import TorchProfiler, ComputeLayerwiseTime
+        model = nn.Sequential(nn.Sequential(nn.Conv2d(3, 8, 3, padding=1), nn.ReLU()), nn.Flatten())
+        profiler = TorchProfiler(model, TorchProfiler.enable_forward_pass_data_splits(DATA))
+        profiler.register_profiler_function(ComputeLayerwiseTime(runs=3, copy_model=False))
+        table = profiler.compute_status('layerwise_time')
+
+        assert table.column('name') == ['Sequential', '0', '0.0', '0.1', '1']
+        assert table.column('depth') == [0, 1, 2, 2, 1]
+        assert table.column('calls') == [1] * 5
+        root, block, conv = table.record(0), table.record(1), table.record(2)
+        assert root.inclusive_time == pytest.approx(sum(table.column('exclusive_time')))
+        assert block.inclusive_time >= conv.inclusive_time + table.record(3).inclusive_time
+        assert conv.inclusive_time == conv.exclusive_time
+        assert not any(m._forward_hooks or m._forward_pre_hooks for m in model.modules())
+        assert 'Inclusive (ms)' in str(table)
+
+    def test_hot_layers(self):
+        import torch.nn as nn
+        from deeplite.torch_profiler.torch_profiler import TorchProfiler, ComputeHotLayers, measure_machine_balance
+        model = nn.Sequential(nn.Conv2d(3, 8, 3, padding=1), nn.ReLU(), nn.Flatten(), nn.Linear(8192, 10))
+        profiler = TorchProfiler(model, TorchProfiler.enable_forward_pass_data_splits(DATA))
+        profiler.register_profiler_function(ComputeHotLayers(machine_balance=5., runs=2))
+        report = profiler.compute_status('hot_layers')
+
+        rows = {row['name']: row for row in report}
+        assert set(rows) == {'0', '1', '2', '3'}
+        assert rows['0']['macs'] == 8 * 3 * 3 * 3 * 32 * 32 + 8 * 32 * 32
+        # weights, input and output of the linear layer
+        assert rows['3']['bytes'] == (8192 * 10 + 10 + 8192 + 10) * 4
+        assert rows['0']['bound'] == 'compute' and rows['3']['bound'] == 'memory'
+        assert report.rows[-1]['cumulative_time_share'] == pytest.approx(1.)
+        assert 'Machine balance: 5.00' in str(report)
+        assert measure_machine_balance(n=64, numel=2 ** 12) > 0
+
+    def test_model_fingerprint(self):
+        import torch
+        profiler = get_profiler()
+        profiler2 = profiler.clone(model=deepcopy(MODEL))
+        assert profiler.model_fingerprint() == profiler2.model_fingerprint()
+        with torch.no_grad():
+            profiler2.model[0].bias[0] += 1
+        assert profiler.model_fingerprint() != profiler2.model_fingerprint()
+        profiler2.model = profiler2.model.to(torch.bfloat16)
+        assert profiler.model_fingerprint() != profiler2.model_fingerprint()
+
     @mock.patch('deeplite.profiler.metrics.Flops.get_comparative', return_value='coverage')
     def test_compare_profiles(self, *args):
         from deeplite.profiler import Device
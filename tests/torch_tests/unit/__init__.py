@@ -7,6 +7,12 @@ try:
 except (ImportError, NameError, AttributeError, OSError):
     TORCH_AVAILABLE = False
 
+if TORCH_AVAILABLE:
+    from deeplite.torch_profiler.torch_data_loader import meta_device_supported
+    META_DEVICE_SUPPORTED = meta_device_supported()
+else:
+    META_DEVICE_SUPPORTED = False
+
 @pytest.mark.skipif(not TORCH_AVAILABLE, reason="PyTorch is not used as a backend")
 class BaseUnitTest:
 	def setup_method(self, method):
@@ -1,6 +1,6 @@
 import pytest
 import numpy as np
-from tests.torch_tests.unit import BaseUnitTest, TORCH_AVAILABLE, fp
+from tests.torch_tests.unit import BaseUnitTest, TORCH_AVAILABLE, META_DEVICE_SUPPORTED, fp
 
 class TestTorchDataLoader(BaseUnitTest):
     def test_pass(self, fp):
@@ -23,3 +23,35 @@ class TestTorchDataLoader(BaseUnitTest):
 
 
 
+
+    def test_prefetch(self):
+        import torch
+        from deeplite.torch_profiler.torch_data_loader import TorchDataLoader
+        data = [(np.ones((2, 3)), {'y': np.zeros(2)}), (torch.ones(2, 3), {'y': torch.zeros(2)})]
+        batches = list(TorchDataLoader(data).prefetch(num_batches=1))
+        assert len(batches) == 2
+        for x, y in batches:
+            assert isinstance(x, torch.Tensor) and x.shape == (2, 3)
+            assert isinstance(y['y'], torch.Tensor)
+
+    def test_random_tensors(self):
+        import torch
+        from deeplite.torch_profiler.torch_data_loader import TorchTensorSampler
+        sampler = TorchTensorSampler((torch.zeros(1, 3, dtype=torch.float16), torch.ones(1, 2, dtype=torch.long),
+                                      torch.ones(1, dtype=torch.bool)))
+        x, idx, mask = sampler.create_random_tensors(4)
+        assert x.dtype == torch.float16 and x.shape == (4, 3)
+        assert idx.dtype == torch.long and not idx.any()
+        assert mask.dtype == torch.bool and mask.all()
+
+        with pytest.raises(RuntimeError):
+            TorchTensorSampler((torch.zeros(1, dtype=torch.complex64),)).create_random_tensors(1)
+
+    @pytest.mark.skipif(not META_DEVICE_SUPPORTED, reason="No meta device in this torch release")
+    def test_meta_tensors(self):
+        import torch
+        from deeplite.torch_profiler.torch_data_loader import TorchTensorSampler
+        sampler = TorchTensorSampler((torch.zeros(1, 3, dtype=torch.float16), torch.ones(1, 2, dtype=torch.long)))
+        x, idx = sampler.create_meta_tensors(4)
+        assert x.is_meta and x.dtype == torch.float16 and x.shape == (4, 3)
+        assert idx.is_meta and idx.dtype == torch.long
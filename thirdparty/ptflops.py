@@ -15,6 +15,8 @@ from functools import partial
 import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.quantized as nnq
+import torch.nn.quantized.dynamic as nnqd
 
 layer_count = 0
 
@@ -42,18 +44,6 @@ class HookVariables:
         print("Number of model_size: ", self.model_size)
         print("Number of memory_footprint: ", self.memory_footprint)
 
-def summary_str_header_footer(model_name):
-    header = "\n--------------------------------------------------------------------------------------------------------------------------------------------" + "\n"
-    line_new = "{:>25} {:>20} {:>15} {:>20} {:>25} {:>14} {:>14}".format(
-        "Layer (" + model_name + ")", "Weight Shape", "Bias Shape", "Output Shape", "ActivationSize (Bytes)", "# Params", "Time (ms)")
-    header += line_new + "\n"
-    header += "============================================================================================================================================" + "\n"
-    
-    footer = "--------------------------------------------------------------------------------------------------------------------------------------------"
-    
-    return header, footer
-
-
 class __Switch:
     def __init__(self):
         self.state = False
@@ -103,6 +93,36 @@ def get_model_parameters_number(model):
     return params_num
 
 
+def get_weight_and_bias(module):
+    """
+    Returns the (weight, bias) tensors of the module, either can be None. Quantized modules expose them
+    through methods as they are packed.
+    """
+    weight, bias = getattr(module, 'weight', None), getattr(module, 'bias', None)
+    if callable(weight):
+        weight = weight()
+    if callable(bias):
+        bias = bias()
+    return weight, bias
+
+
+def get_module_parameters(module):
+    """
+    Trainable parameters of the module, or the packed weight and bias of a quantized module which has none.
+    """
+    params = [p for p in module.parameters() if p.requires_grad]
+    if not params and callable(getattr(module, 'weight', None)):
+        params = [t for t in get_weight_and_bias(module) if t is not None]
+    return params
+
+
+def get_tensors_size(tensors):
+    """
+    Memory in bytes of the tensors, with the size of their own dtype.
+    """
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
 def add_flops_counting_methods(net_main_module):
     # adding additional methods to the existing module object,
     # this is done this way so that each function has access to self object
@@ -117,12 +137,26 @@ def add_flops_counting_methods(net_main_module):
     return net_main_module
 
 
+def remove_flops_counting_methods(net_main_module):
+    """
+    Undo add_flops_counting_methods(): removes every hook, counting variable and method added to the module
+    and its submodules so that it is left as it was before.
+    """
+    net_main_module.stop_flops_count()
+    for name in ('start_flops_count', 'stop_flops_count', 'reset_flops_count', 'compute_average_flops_cost',
+                 'all_modules', '__batch_counter__'):
+        net_main_module.__dict__.pop(name, None)
+    net_main_module.apply(remove_flops_counter_variables)
+
+    return net_main_module
+
+
 def compute_average_flops_cost(self, model_name, start_time):
     """
     A method that will be available after add_flops_counting_methods() is called
     on a desired net object.
 
-    Returns current mean flops consumption per image.
+    Returns current mean flops consumption per image, the totals and the records of each layer, a list of dict.
 
     """
     batches_count = self.__batch_counter__
@@ -132,7 +166,7 @@ def compute_average_flops_cost(self, model_name, start_time):
     total_model_size = 0
     total_memory_footprint = 0
     prev_total_time = start_time
-    summary_str = ""
+    layers = []
     for module in self.all_modules:
         if is_supported_instance(module) or not isinstance(module, (nn.Sequential, nn.ModuleList)):
             if hasattr(module, '__hook_variables__') and module.__hook_variables__.summary:
@@ -142,27 +176,27 @@ def compute_average_flops_cost(self, model_name, start_time):
                 total_model_size += module.__hook_variables__.model_size
                 total_memory_footprint += module.__hook_variables__.memory_footprint
 
-                layer_time = (module.__hook_variables__.summary["layer_time"] - prev_total_time) * 1000
-
-                line_new = "{:>25} {:>20} {:>15} {:>20} {:>25} {:>14} {:>14}".format(
-                    module.__hook_variables__.summary["m_key"],
-                    str(module.__hook_variables__.summary.get("layer_weight_size", None)),
-                    str(module.__hook_variables__.summary.get("layer_bias_size", None)),
-                    str(module.__hook_variables__.summary["output_shape"]),
-                    "{0:,}".format(module.__hook_variables__.memory_footprint),
-                    "{0:,}".format(module.__hook_variables__.params),
-                    "{0:2.4f}".format(layer_time),
-                )
-                summary_str += line_new + "\n"
-                prev_total_time = module.__hook_variables__.summary["layer_time"]
-
-    header, footer = summary_str_header_footer(model_name)
-    summary_str = header + summary_str + footer
+                summary = module.__hook_variables__.summary
+                layers.append({
+                    'name': summary["m_key"],
+                    'type': type(module).__name__,
+                    'input_shape': summary.get("input_shape", None),
+                    'output_shape': summary["output_shape"],
+                    'weight_shape': summary.get("layer_weight_size", None),
+                    'bias_shape': summary.get("layer_bias_size", None),
+                    'macs': int(module.__hook_variables__.mac),
+                    'params': int(module.__hook_variables__.params),
+                    'activations': int(module.__hook_variables__.activations),
+                    'activation_bytes': int(module.__hook_variables__.memory_footprint),
+                    'time': (summary["layer_time"] - prev_total_time) * 1000,
+                })
+                prev_total_time = summary["layer_time"]
+
     self.all_modules = []
     global layer_count
     layer_count = 0 
 
-    return total_flops / batches_count, total_params, total_model_size, total_memory_footprint / batches_count, summary_str
+    return total_flops / batches_count, total_params, total_model_size, total_memory_footprint / batches_count, layers
 
 
 def start_flops_count(self, **kwargs):
@@ -263,7 +297,8 @@ def get_input_shape(input):
     # print("unknown input tuple detected in hook for model size, size could be wrong")
     return [0]
 
-def _parse_output(o, activation_size):
+def _parse_output(o, activation_size=None):
+    # activation_size is the bytes per element, None for the element size of each output tensor
     output_shape = []
     total_activations = []
     memory_footprint = []
@@ -279,14 +314,15 @@ def _parse_output(o, activation_size):
         elif isinstance(oo, torch.Tensor):
             output_shape.append(list(oo.size()))
             total_activations.append(np.prod(oo.size()))
-            memory_footprint.append(np.prod(oo.size()) * activation_size)
+            element_size = oo.element_size() if activation_size is None else activation_size
+            memory_footprint.append(np.prod(oo.size()) * element_size)
         else:
             corrupted[0] = True
 
     get_memory(o)
     return total_activations, memory_footprint, output_shape, corrupted[0]
 
-def parse_module_output(module, output, activation_size):
+def parse_module_output(module, output, activation_size=None):
     total_activations, memory_footprint, output_shape, corrupted = _parse_output(output, activation_size)
     if corrupted and corruption_warning_switch.state is False:
         print("Warning!! cannot parse module '{}' output types, memory footprint value is potentially".format(module) +\
@@ -296,14 +332,13 @@ def parse_module_output(module, output, activation_size):
 
 
 def upsample_flops_counter_hook(module, input, output):
-    activation_size = 4
     output_size = output[0]
     batch_size = output.shape[0]
     output_elements_count = batch_size
     for val in output_size.shape[1:]:
         output_elements_count *= val
 
-    total_activations, memory_footprint, output_shape = parse_module_output(module, output, activation_size)
+    total_activations, memory_footprint, output_shape = parse_module_output(module, output)
 
     module.__hook_variables__ = HookVariables() # write fi else
     module.__hook_variables__.mac += int(output_elements_count)
@@ -313,7 +348,7 @@ def upsample_flops_counter_hook(module, input, output):
     m_key = get_m_key(module.__class__)
     summary = OrderedDict()
     summary["m_key"] = m_key
-    summary['layer_time'] = time.time()
+    summary['layer_time'] = time.perf_counter()
     summary["input_shape"] = get_input_shape(input)
     summary["input_shape"][0] = batch_size
     summary["output_shape"] = output_shape
@@ -324,11 +359,10 @@ def upsample_flops_counter_hook(module, input, output):
     layer_count += 1
     
 def no_flops_ops_counter_hook(module, input, output):
-    activation_size = 4
     #batch_size = output.shape[0]
     #active_elements_count = output.numel()
 
-    total_activations, memory_footprint, output_shape = parse_module_output(module, output, activation_size)
+    total_activations, memory_footprint, output_shape = parse_module_output(module, output)
 
     module.__hook_variables__ = HookVariables()
     module.__hook_variables__.activations += sum(total_activations)
@@ -337,7 +371,7 @@ def no_flops_ops_counter_hook(module, input, output):
     m_key = get_m_key(module.__class__)
     summary = OrderedDict()
     summary["m_key"] = m_key
-    summary['layer_time'] = time.time()
+    summary['layer_time'] = time.perf_counter()
     summary["input_shape"] = get_input_shape(input)
     #summary["input_shape"][0] = batch_size
     summary["output_shape"] = output_shape
@@ -346,11 +380,10 @@ def no_flops_ops_counter_hook(module, input, output):
     layer_count += 1
 
 def relu_flops_counter_hook(module, input, output):
-    activation_size = 4
     batch_size = output.shape[0]
     active_elements_count = output.numel()
 
-    total_activations, memory_footprint, output_shape = parse_module_output(module, output, activation_size)
+    total_activations, memory_footprint, output_shape = parse_module_output(module, output)
 
     module.__hook_variables__ = HookVariables()
     module.__hook_variables__.mac += int(active_elements_count)
@@ -360,55 +393,56 @@ def relu_flops_counter_hook(module, input, output):
     m_key = get_m_key(module.__class__)
     summary = OrderedDict()
     summary["m_key"] = m_key
-    summary['layer_time'] = time.time()
+    summary['layer_time'] = time.perf_counter()
     summary["input_shape"] = get_input_shape(input)
     summary["input_shape"][0] = batch_size
     summary["output_shape"] = output_shape
-    if hasattr(module, "weight") and hasattr(module.weight, "size"):
-        summary["layer_weight_size"] = list(module.weight.size())
-    if hasattr(module, "bias") and hasattr(module.bias, "size"):
-        summary["layer_bias_size"] = list(module.bias.size())
+    layer_weight, layer_bias = get_weight_and_bias(module)
+    if hasattr(layer_weight, "size"):
+        summary["layer_weight_size"] = list(layer_weight.size())
+    if hasattr(layer_bias, "size"):
+        summary["layer_bias_size"] = list(layer_bias.size())
     module.__hook_variables__.summary = summary
     global layer_count
     layer_count += 1
 
 def linear_flops_counter_hook(module, input, output):
-    param_size = 4
-    activation_size = 4
     input = input[0]
     output_last_dim = output.shape[-1]
     batch_size = output.shape[0]
-    bias_flops = output_last_dim if module.bias is not None else 0
+    weight, bias = get_weight_and_bias(module)
+    bias_flops = output_last_dim if bias is not None else 0
 
-    total_activations, memory_footprint, output_shape = parse_module_output(module, output, activation_size)
+    total_activations, memory_footprint, output_shape = parse_module_output(module, output)
     
+    params = get_module_parameters(module)
     module.__hook_variables__ = HookVariables()
     module.__hook_variables__.mac += int(np.prod(input.shape) * output_last_dim + bias_flops)
-    module.__hook_variables__.params += sum(p.numel() for p in module.parameters() if p.requires_grad)
+    module.__hook_variables__.params += sum(p.numel() for p in params)
     module.__hook_variables__.activations += sum(total_activations)
-    module.__hook_variables__.model_size += module.__hook_variables__.params * param_size
+    module.__hook_variables__.model_size += get_tensors_size(params)
     module.__hook_variables__.memory_footprint += sum(memory_footprint)
 
     m_key = get_m_key(module.__class__)
     summary = OrderedDict()
     summary["m_key"] = m_key
-    summary['layer_time'] = time.time()
+    summary['layer_time'] = time.perf_counter()
     summary["input_shape"] = get_input_shape(input)
     summary["input_shape"][0] = batch_size
     summary["output_shape"] = output_shape
-    if hasattr(module, "weight") and hasattr(module.weight, "size"):
-        summary["layer_weight_size"] = list(module.weight.size())
-    if hasattr(module, "bias") and hasattr(module.bias, "size"):
-        summary["layer_bias_size"] = list(module.bias.size())
+    layer_weight, layer_bias = get_weight_and_bias(module)
+    if hasattr(layer_weight, "size"):
+        summary["layer_weight_size"] = list(layer_weight.size())
+    if hasattr(layer_bias, "size"):
+        summary["layer_bias_size"] = list(layer_bias.size())
     module.__hook_variables__.summary = summary
     global layer_count
     layer_count += 1
 
 def pool_flops_counter_hook(module, input, output):
-    activation_size = 4
     batch_size = output.shape[0]
     input = input[0]
-    total_activations, memory_footprint, output_shape = parse_module_output(module, output, activation_size)
+    total_activations, memory_footprint, output_shape = parse_module_output(module, output)
 
     module.__hook_variables__ = HookVariables()
     module.__hook_variables__.mac += int(np.prod(input.shape))
@@ -418,21 +452,20 @@ def pool_flops_counter_hook(module, input, output):
     m_key = get_m_key(module.__class__)
     summary = OrderedDict()
     summary["m_key"] = m_key
-    summary['layer_time'] = time.time()
+    summary['layer_time'] = time.perf_counter()
     summary["input_shape"] = get_input_shape(input)
     summary["input_shape"][0] = batch_size
     summary["output_shape"] = output_shape
-    if hasattr(module, "weight") and hasattr(module.weight, "size"):
-        summary["layer_weight_size"] = list(module.weight.size())
-    if hasattr(module, "bias") and hasattr(module.bias, "size"):
-        summary["layer_bias_size"] = list(module.bias.size())
+    layer_weight, layer_bias = get_weight_and_bias(module)
+    if hasattr(layer_weight, "size"):
+        summary["layer_weight_size"] = list(layer_weight.size())
+    if hasattr(layer_bias, "size"):
+        summary["layer_bias_size"] = list(layer_bias.size())
     module.__hook_variables__.summary = summary
     global layer_count
     layer_count += 1
 
 def bn_flops_counter_hook(module, input, output):
-    activation_size = 4
-    param_size = 4
     batch_size = output.shape[0]
     input = input[0]
 
@@ -440,34 +473,34 @@ def bn_flops_counter_hook(module, input, output):
     if module.affine:
         batch_flops *= 2
 
-    total_activations, memory_footprint, output_shape = parse_module_output(module, output, activation_size)
+    total_activations, memory_footprint, output_shape = parse_module_output(module, output)
 
     module.__hook_variables__ = HookVariables()
     module.__hook_variables__.mac += int(batch_flops)
     module.__hook_variables__.params += int(2 * module.num_features)
     module.__hook_variables__.activations += sum(total_activations)
+    param_size = module.weight.element_size() if module.weight is not None else input.element_size()
     module.__hook_variables__.model_size += module.__hook_variables__.params * param_size
     module.__hook_variables__.memory_footprint += sum(memory_footprint)
 
     m_key = get_m_key(module.__class__)
     summary = OrderedDict()
     summary["m_key"] = m_key
-    summary['layer_time'] = time.time()
+    summary['layer_time'] = time.perf_counter()
     summary["input_shape"] = get_input_shape(input)
     summary["input_shape"][0] = batch_size
     summary["output_shape"] = output_shape
-    if hasattr(module, "weight") and hasattr(module.weight, "size"):
-        summary["layer_weight_size"] = list(module.weight.size())
-    if hasattr(module, "bias") and hasattr(module.bias, "size"):
-        summary["layer_bias_size"] = list(module.bias.size())
+    layer_weight, layer_bias = get_weight_and_bias(module)
+    if hasattr(layer_weight, "size"):
+        summary["layer_weight_size"] = list(layer_weight.size())
+    if hasattr(layer_bias, "size"):
+        summary["layer_bias_size"] = list(layer_bias.size())
     module.__hook_variables__.summary = summary
     global layer_count
     layer_count += 1
 
 def conv_flops_counter_hook(module, input, output):
     # Can have multiple inputs, getting the first one
-    param_size = 4
-    activation_size = 4
     batch_size = output.shape[0]
     input = input[0]
 
@@ -486,32 +519,34 @@ def conv_flops_counter_hook(module, input, output):
     overall_conv_flops = conv_per_position_flops * active_elements_count
 
     bias_flops = 0
-    if module.bias is not None:
+    if get_weight_and_bias(module)[1] is not None:
         bias_flops = out_channels * active_elements_count
 
     overall_flops = overall_conv_flops + bias_flops
     num_out_elements = output.numel()
 
-    total_activations, memory_footprint, output_shape = parse_module_output(module, output, activation_size)
+    total_activations, memory_footprint, output_shape = parse_module_output(module, output)
 
+    params = get_module_parameters(module)
     module.__hook_variables__ = HookVariables()
     module.__hook_variables__.mac += int(overall_flops) 
-    module.__hook_variables__.params += sum(p.numel() for p in module.parameters() if p.requires_grad)
+    module.__hook_variables__.params += sum(p.numel() for p in params)
     module.__hook_variables__.activations += sum(total_activations)
-    module.__hook_variables__.model_size += module.__hook_variables__.params * param_size
+    module.__hook_variables__.model_size += get_tensors_size(params)
     module.__hook_variables__.memory_footprint += sum(memory_footprint)
 
     m_key = get_m_key(module.__class__)
     summary = OrderedDict()
     summary["m_key"] = m_key
-    summary['layer_time'] = time.time()
+    summary['layer_time'] = time.perf_counter()
     summary["input_shape"] = get_input_shape(input)
     summary["input_shape"][0] = batch_size
     summary["output_shape"] = output_shape
-    if hasattr(module, "weight") and hasattr(module.weight, "size"):
-        summary["layer_weight_size"] = list(module.weight.size())
-    if hasattr(module, "bias") and hasattr(module.bias, "size"):
-        summary["layer_bias_size"] = list(module.bias.size())
+    layer_weight, layer_bias = get_weight_and_bias(module)
+    if hasattr(layer_weight, "size"):
+        summary["layer_weight_size"] = list(layer_weight.size())
+    if hasattr(layer_bias, "size"):
+        summary["layer_bias_size"] = list(layer_bias.size())
     module.__hook_variables__.summary = summary
     global layer_count
     layer_count += 1
@@ -524,8 +559,8 @@ def generic_flops_counter_hook(module, input, output):
 
     try:
         flops = rval['flops']
-        param_size = rval.get('param_size', 4)
-        activation_size = rval.get('activation_size', 4)
+        param_size = rval.get('param_size', None)
+        activation_size = rval.get('activation_size', None)
         params = rval.get('params', None)
         assert flops is not None
     except (AssertionError, TypeError, KeyError):
@@ -534,24 +569,31 @@ def generic_flops_counter_hook(module, input, output):
 
     total_activations, memory_footprint, output_shape = parse_module_output(module, output, activation_size)
 
+    module_params = get_module_parameters(module)
     module.__hook_variables__ = HookVariables()
     module.__hook_variables__.mac += int(flops)
-    module.__hook_variables__.params += sum(p.numel() for p in module.parameters() if p.requires_grad) if params is None else params
+    module.__hook_variables__.params += sum(p.numel() for p in module_params) if params is None else params
     module.__hook_variables__.activations += sum(total_activations)
-    module.__hook_variables__.model_size += module.__hook_variables__.params * param_size
+    if param_size is None and params is None:
+        module.__hook_variables__.model_size += get_tensors_size(module_params)
+    else:
+        # without its own parameters, the sizes of the declared params are not known
+        param_size = 4 if param_size is None else param_size
+        module.__hook_variables__.model_size += module.__hook_variables__.params * param_size
     module.__hook_variables__.memory_footprint += sum(memory_footprint)
 
     m_key = get_m_key(module.__class__)
     summary = OrderedDict()
     summary["m_key"] = m_key
-    summary['layer_time'] = time.time()
+    summary['layer_time'] = time.perf_counter()
     summary["input_shape"] = get_input_shape(input)
     # summary["input_shape"][0] = batch_size
     summary["output_shape"] = output_shape
-    if hasattr(module, "weight") and hasattr(module.weight, "size"):
-        summary["layer_weight_size"] = list(module.weight.size())
-    if hasattr(module, "bias") and hasattr(module.bias, "size"):
-        summary["layer_bias_size"] = list(module.bias.size())
+    layer_weight, layer_bias = get_weight_and_bias(module)
+    if hasattr(layer_weight, "size"):
+        summary["layer_weight_size"] = list(layer_weight.size())
+    if hasattr(layer_bias, "size"):
+        summary["layer_bias_size"] = list(layer_bias.size())
     module.__hook_variables__.summary = summary
     global layer_count
     layer_count += 1
@@ -625,6 +667,15 @@ MODULES_MAPPING = {
     nn.ConvTranspose3d: conv_flops_counter_hook,
 }
 
+# Quantized, not all of them exist in older torch versions
+for _quantized_module, _name, _hook in ((nnq, 'Conv1d', conv_flops_counter_hook),
+                                        (nnq, 'Conv2d', conv_flops_counter_hook),
+                                        (nnq, 'Conv3d', conv_flops_counter_hook),
+                                        (nnq, 'Linear', linear_flops_counter_hook),
+                                        (nnqd, 'Linear', linear_flops_counter_hook)):
+    if hasattr(_quantized_module, _name):
+        MODULES_MAPPING[getattr(_quantized_module, _name)] = _hook
+
 
 def is_supported_instance(module):
     if type(module) in MODULES_MAPPING or type(module) in CUSTOM_MODULES_MAPPING:
@@ -633,7 +684,11 @@ def is_supported_instance(module):
 
 
 def remove_flops_counter_hook_function(module):
-    if is_supported_instance(module):
-        if hasattr(module, '__flops_handle__'):
-            module.__flops_handle__.remove()
-            del module.__flops_handle__
\ No newline at end of file
+    # unsupported modules also get a hook (no_flops_ops_counter_hook)
+    if hasattr(module, '__flops_handle__'):
+        module.__flops_handle__.remove()
+        del module.__flops_handle__
+
+
+def remove_flops_counter_variables(module):
+    module.__dict__.pop('__hook_variables__', None)
\ No newline at end of file